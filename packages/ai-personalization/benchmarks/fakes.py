@@ -0,0 +1,380 @@
+"""
+In-process stand-ins for Supabase and Gemini
+
+FakeSupabaseClient implements the subset of the supabase-py / postgrest
+query builder the service uses, over plain in-memory tables with lazy hash
+indexes and the unique constraints from migrations/; async_client() gives
+an awaitable view of the same tables. FakeGenerativeModel sleeps for a
+configurable latency and returns a canned response with usage metadata.
+"""
+import re
+import time
+import uuid
+import asyncio
+import threading
+from types import SimpleNamespace
+
+
+# Unique columns per table, as created by migrations/; other tables only have id
+UNIQUE_COLUMNS = {
+    'teacher_feedback_aggregates': ('id', 'teacher_id'),
+    'personalized_training': ('id', 'idempotency_key'),
+    'competency_gaps': ('id', 'idempotency_key'),
+}
+
+
+class FakeAPIError(Exception):
+    """postgrest APIError stand-in: Postgres errors carry a SQLSTATE code"""
+
+    def __init__(self, code, message):
+        super().__init__(f"{{'code': '{code}', 'message': '{message}'}}")
+        self.code = code
+        self.message = message
+
+
+class FakeTable:
+    """Rows of one table plus hash indexes built on demand per column"""
+
+    def __init__(self, unique=('id',)):
+        self.rows = []
+        self.unique = tuple(unique)
+        self._indexes = {}
+        self.lock = threading.RLock()
+
+    def index(self, column):
+        index = self._indexes.get(column)
+        if index is None:
+            index = {}
+            for row in self.rows:
+                index.setdefault(row.get(column), []).append(row)
+            self._indexes[column] = index
+        return index
+
+    def invalidate(self):
+        self._indexes = {}
+
+
+def _parse_or(expression):
+    """Parse the small PostgREST or_() grammar used for keyset pagination"""
+    clauses = []
+    for part in re.findall(r'and\([^)]*\)|[^,]+', expression):
+        if part.startswith('and('):
+            clauses.append([_parse_condition(c) for c in part[4:-1].split(',')])
+        else:
+            clauses.append([_parse_condition(part)])
+    return lambda row: any(all(cond(row) for cond in clause) for clause in clauses)
+
+
+def _parse_condition(condition):
+    column, op, value = condition.split('.', 2)
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        value = value[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+    return _comparison(column, op, value)
+
+
+def _comparison(column, op, value):
+    ops = {
+        'eq': lambda a: a == value,
+        'neq': lambda a: a != value,
+        'gt': lambda a: a is not None and a > value,
+        'gte': lambda a: a is not None and a >= value,
+        'lt': lambda a: a is not None and a < value,
+        'lte': lambda a: a is not None and a <= value,
+    }
+    check = ops[op]
+    return lambda row: check(row.get(column))
+
+
+class FakeQuery:
+    def __init__(self, client, table_name):
+        self._client = client
+        if table_name not in client.tables:
+            client.tables[table_name] = client.new_table(table_name)
+        self._table = client.tables[table_name]
+        self._columns = None
+        self._filters = []
+        self._index_filter = None
+        self._order = []
+        self._limit = None
+        self._range = None
+        self._operation = 'select'
+        self._payload = None
+        self._on_conflict = None
+        self._ignore_duplicates = False
+
+    # Query builder -----------------------------------------------------
+
+    def select(self, columns='*', **kwargs):
+        if columns != '*':
+            self._columns = [c.strip() for c in columns.split(',')]
+        return self
+
+    def eq(self, column, value):
+        if self._index_filter is None:
+            self._index_filter = (column, [value])
+        else:
+            self._filters.append(_comparison(column, 'eq', value))
+        return self
+
+    def in_(self, column, values):
+        values = list(values)
+        if self._index_filter is None:
+            self._index_filter = (column, values)
+        else:
+            allowed = set(values)
+            self._filters.append(lambda row: row.get(column) in allowed)
+        return self
+
+    def gt(self, column, value):
+        self._filters.append(_comparison(column, 'gt', value))
+        return self
+
+    def gte(self, column, value):
+        self._filters.append(_comparison(column, 'gte', value))
+        return self
+
+    def lt(self, column, value):
+        self._filters.append(_comparison(column, 'lt', value))
+        return self
+
+    def lte(self, column, value):
+        self._filters.append(_comparison(column, 'lte', value))
+        return self
+
+    def or_(self, expression):
+        self._filters.append(_parse_or(expression))
+        return self
+
+    def order(self, column, desc=False):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def range(self, start, end):
+        self._range = (start, end)
+        return self
+
+    def insert(self, payload):
+        self._operation, self._payload = 'insert', payload
+        return self
+
+    def upsert(self, payload, on_conflict='id', ignore_duplicates=False):
+        self._operation, self._payload, self._on_conflict = 'upsert', payload, on_conflict
+        self._ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, payload):
+        self._operation, self._payload = 'update', payload
+        return self
+
+    def delete(self):
+        self._operation = 'delete'
+        return self
+
+    # Execution ---------------------------------------------------------
+
+    def _matching_rows(self):
+        if self._index_filter:
+            column, values = self._index_filter
+            index = self._table.index(column)
+            candidates = [row for value in dict.fromkeys(values) for row in index.get(value, [])]
+        else:
+            candidates = self._table.rows
+        return [row for row in candidates if all(check(row) for check in self._filters)]
+
+    def execute(self):
+        if self._client.latency:
+            time.sleep(self._client.latency)
+        return self._run()
+
+    def _run(self):
+        self._client.request_count += 1
+
+        with self._table.lock:
+            if self._operation in ('insert', 'upsert'):
+                return SimpleNamespace(data=self._write())
+            if self._operation == 'update':
+                rows = self._matching_rows()
+                for row in rows:
+                    row.update(self._payload)
+                self._table.invalidate()
+                return SimpleNamespace(data=[dict(row) for row in rows])
+            if self._operation == 'delete':
+                doomed = {id(row) for row in self._matching_rows()}
+                self._table.rows = [row for row in self._table.rows if id(row) not in doomed]
+                self._table.invalidate()
+                return SimpleNamespace(data=[])
+
+            rows = self._matching_rows()
+
+        for column, desc in reversed(self._order):
+            rows.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+
+        start, end = self._range if self._range else (0, None)
+        limit = self._client.max_rows
+        if end is not None:
+            limit = min(limit, end - start + 1)
+        if self._limit is not None:
+            limit = min(limit, self._limit)
+        rows = rows[start:start + limit]
+
+        if self._columns:
+            rows = [{column: row.get(column) for column in self._columns} for row in rows]
+        else:
+            rows = [dict(row) for row in rows]
+        return SimpleNamespace(data=rows)
+
+    def _write(self):
+        payload = self._payload if isinstance(self._payload, list) else [self._payload]
+        if self._operation == 'upsert' and self._on_conflict not in self._table.unique:
+            raise FakeAPIError('42P10', 'there is no unique or exclusion constraint matching the ON CONFLICT specification')
+
+        rows = []
+        for row in payload:
+            row = dict(row)
+            row.setdefault('id', str(uuid.uuid4()))
+            row.setdefault('created_at', self._client.now())
+            rows.append(row)
+
+        # Validate the whole statement before writing, as Postgres would
+        existing = {column: self._table.index(column) for column in self._table.unique}
+        staged = {column: set() for column in self._table.unique}
+        kept = []
+        for row in rows:
+            if self._operation == 'upsert':
+                key = row.get(self._on_conflict)
+                matches = existing[self._on_conflict].get(key)
+                if matches or key in staged[self._on_conflict]:
+                    if self._ignore_duplicates:
+                        continue  # ON CONFLICT DO NOTHING returns no row
+                    if not matches:
+                        raise FakeAPIError('21000', 'ON CONFLICT DO UPDATE command cannot affect row a second time')
+                    kept.append((row, matches))
+                    staged[self._on_conflict].add(key)
+                    continue
+            for column in self._table.unique:
+                value = row.get(column)
+                if value is not None and (value in existing[column] or value in staged[column]):
+                    raise FakeAPIError('23505', f'duplicate key value violates unique constraint on {column}')
+                staged[column].add(value)
+            kept.append((row, None))
+
+        written = []
+        for row, matches in kept:
+            if matches:
+                matches[0].update(row)
+                written.append(dict(matches[0]))
+            else:
+                self._table.rows.append(row)
+                written.append(dict(row))
+
+        self._table.invalidate()
+        return written
+
+
+class FakeAsyncQuery(FakeQuery):
+    async def execute(self):
+        if self._client.latency:
+            await asyncio.sleep(self._client.latency)
+        return self._run()
+
+
+class FakeSupabaseClient:
+    """
+    supabase-py Client stand-in. `latency` adds a per-request sleep to
+    model network round trips; `max_rows` mimics PostgREST's row cap.
+    `unique` overrides UNIQUE_COLUMNS, e.g. to model an unmigrated table.
+    """
+
+    def __init__(self, tables=None, latency=0.0, max_rows=1000, unique=None):
+        self.tables = {}
+        self.latency = latency
+        self.max_rows = max_rows
+        self.unique = {**UNIQUE_COLUMNS, **(unique or {})}
+        self.request_count = 0
+        self._clock = 0
+        self._clock_lock = threading.Lock()
+        for name, rows in (tables or {}).items():
+            self.tables[name] = self.new_table(name)
+            self.tables[name].rows = rows
+
+    def new_table(self, name):
+        return FakeTable(self.unique.get(name, ('id',)))
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def async_client(self):
+        """supabase AsyncClient stand-in over these same tables"""
+        return FakeAsyncSupabaseClient(self)
+
+    def now(self):
+        """Monotonic ISO-like timestamps for inserted rows"""
+        with self._clock_lock:
+            self._clock += 1
+            return f'2099-01-01T00:00:00.{self._clock:06d}'
+
+
+class FakeAsyncSupabaseClient:
+    """Async view of a FakeSupabaseClient: same tables, awaitable execute()"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name):
+        return FakeAsyncQuery(self._client, name)
+
+
+class FakeGenerativeModel:
+    """google.generativeai GenerativeModel stand-in with configurable latency"""
+
+    def __init__(self, latency=0.0, response_words=120):
+        self.latency = latency
+        self.model_name = 'fake-model'
+        self.response_words = response_words
+        self.call_count = 0
+
+    def _response(self, prompt):
+        self.call_count += 1
+        text = ' '.join(['lorem'] * self.response_words)
+        usage = SimpleNamespace(prompt_token_count=len(prompt) // 4, candidates_token_count=self.response_words)
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    def generate_content(self, prompt, stream=False, request_options=None, **kwargs):
+        if stream:
+            return FakeStream(self, prompt)
+        timeout = (request_options or {}).get('timeout')
+        if timeout is not None and self.latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Deadline of {timeout}s exceeded")
+        if self.latency:
+            time.sleep(self.latency)
+        return self._response(prompt)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._response(prompt)
+
+
+class FakeStream:
+    """Streamed response: latency spread over chunks of ~10 words"""
+
+    def __init__(self, model, prompt, words_per_chunk=10):
+        self._model = model
+        self._prompt = prompt
+        self._words_per_chunk = words_per_chunk
+        self.usage_metadata = None
+
+    def __iter__(self):
+        response = self._model._response(self._prompt)
+        words = response.text.split(' ')
+        chunks = [' '.join(words[i:i + self._words_per_chunk]) + ' ' for i in range(0, len(words), self._words_per_chunk)]
+        for text in chunks:
+            if self._model.latency:
+                time.sleep(self._model.latency / len(chunks))
+            yield SimpleNamespace(text=text)
+        self.usage_metadata = response.usage_metadata
@@ -0,0 +1,222 @@
+"""
+Offline benchmarks for the personalization service
+
+Runs the analyzers, the personalizer and the Flask routes against
+in-process fakes for Supabase and Gemini, so hot-path regressions can be
+caught without network access:
+
+    python benchmarks/run_benchmarks.py --scale 1k
+    python benchmarks/run_benchmarks.py --scale 100k --db-latency 0.005 --llm-latency 0.5
+    python benchmarks/run_benchmarks.py --ops keyword_match,analyze_gaps_bulk --json out.json
+    python benchmarks/run_benchmarks.py --snapshot snapshots/20260101T000000Z
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+from contextlib import redirect_stdout
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / 'src'))
+sys.path.insert(0, str(BENCH_DIR))
+
+from fakes import FakeSupabaseClient, FakeGenerativeModel
+from synthetic import SCALES, generate_tables
+
+
+def install_fakes(tables, db_latency, llm_latency, model_dir):
+    """Point every service singleton at the in-process fakes"""
+    from supabase_client import SupabaseDB, ReferenceCache, db, reference_data
+    from async_supabase_client import AsyncSupabaseDB, async_db
+    from llm_personalizer import ContentPersonalizer, personalizer
+    from llm_cache import ResponseCache
+    from ml_engine import CompetencyAnalyzer, analyzer
+    from cluster_models import ClusterModelStore
+    from feedback_analyzer import FeedbackAnalyzer, feedback_analyzer
+
+    client = FakeSupabaseClient(tables, latency=db_latency)
+    model = FakeGenerativeModel(latency=llm_latency)
+
+    db.override(SupabaseDB(client=client))
+    async_db.override(AsyncSupabaseDB(client=client.async_client()))
+    reference_data.override(ReferenceCache(db))
+    # Cache disabled so every call pays the (fake) LLM latency
+    personalizer.override(ContentPersonalizer(cache=ResponseCache(max_entries=0), model=model))
+    analyzer.override(CompetencyAnalyzer(n_clusters=5, model_store=ClusterModelStore(model_dir)))
+    feedback_analyzer.override(FeedbackAnalyzer())
+    return client, model
+
+
+def install_snapshot(path, llm_latency, model_dir):
+    """Like install_fakes, but reads real data from an exported snapshot"""
+    from snapshots import SnapshotDB
+    from supabase_client import ReferenceCache, db, reference_data
+    from llm_personalizer import ContentPersonalizer, personalizer
+    from llm_cache import ResponseCache
+    from ml_engine import CompetencyAnalyzer, analyzer
+    from cluster_models import ClusterModelStore
+    from feedback_analyzer import FeedbackAnalyzer, feedback_analyzer
+
+    snapshot_db = SnapshotDB(path)
+    model = FakeGenerativeModel(latency=llm_latency)
+
+    db.override(snapshot_db)
+    reference_data.override(ReferenceCache(db))
+    personalizer.override(ContentPersonalizer(cache=ResponseCache(max_entries=0), model=model))
+    analyzer.override(CompetencyAnalyzer(n_clusters=5, model_store=ClusterModelStore(model_dir)))
+    feedback_analyzer.override(FeedbackAnalyzer())
+    tables = {name: snapshot_db.fetch_all(name) for name in ('teachers', 'clusters', 'feedback', 'training_modules')}
+    return snapshot_db, model, tables
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def measure(name, fn, calls, memory_calls=3):
+    """Time fn(*args) for each args tuple, then trace peak memory on a few calls"""
+    latencies = []
+    start = time.perf_counter()
+    for args in calls:
+        call_start = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    for args in calls[:memory_calls]:
+        fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'operation': name,
+        'calls': len(calls),
+        'throughput_per_s': round(len(calls) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'peak_mb': round(peak / 2**20, 2)
+    }
+
+
+def build_operations(tables, samples, rng):
+    """Map operation name -> (callable, list of argument tuples)"""
+    from ml_engine import analyzer
+    from llm_personalizer import personalizer
+    from feedback_analyzer import feedback_analyzer
+
+    teacher_ids = [t['id'] for t in rng.sample(tables['teachers'], min(samples, len(tables['teachers'])))]
+    cluster_ids = [c['id'] for c in tables['clusters'][:max(1, min(samples // 10, len(tables['clusters'])))]]
+    descriptions = [f['description'].lower() for f in rng.sample(tables['feedback'], min(samples * 20, len(tables['feedback'])))]
+    module = tables['training_modules'][0]
+
+    def route_client():
+        import app
+        return app.app.test_client()
+
+    client = route_client()
+
+    def post_feedback_to_training(teacher_id):
+        client.post('/api/feedback-to-training', json={'teacher_id': teacher_id, 'feedback_id': f'bench-{teacher_id}'})
+
+    def post_analyze_feedback(teacher_id):
+        client.post(f'/api/analyze-feedback/{teacher_id}')
+
+    teacher_profile = {'name': 'Bench Teacher', 'subject': 'Math', 'experience': 5, 'gap_areas': ['pedagogy']}
+    cluster_context = {'location': 'Ranchi', 'common_issues': 'absenteeism', 'language': 'Hindi'}
+
+    bulk_chunk = [t['id'] for t in tables['teachers'][:1000]]
+
+    return {
+        'keyword_match': (feedback_analyzer._match_issue_to_gaps, [(d,) for d in descriptions]),
+        'analyze_teacher_feedback_cold': (
+            lambda teacher_id: feedback_analyzer.analyze_teacher_feedback(teacher_id, rebuild=True),
+            [(t,) for t in teacher_ids]
+        ),
+        'analyze_teacher_feedback_warm': (feedback_analyzer.analyze_teacher_feedback, [(t,) for t in teacher_ids]),
+        'analyze_cluster_feedback': (feedback_analyzer.analyze_cluster_feedback, [(c,) for c in cluster_ids]),
+        'analyze_teacher_gap': (analyzer.analyze_teacher_gap, [(t,) for t in teacher_ids]),
+        'analyze_gaps_bulk_1000': (analyzer.analyze_gaps_bulk, [(bulk_chunk,)]),
+        'analyze_cluster_gaps': (analyzer.analyze_cluster_gaps, [(c,) for c in cluster_ids]),
+        'personalize_training_module': (
+            personalizer.personalize_training_module,
+            [(module, teacher_profile, cluster_context)] * max(1, samples // 5)
+        ),
+        'route_feedback_to_training': (post_feedback_to_training, [(t,) for t in teacher_ids]),
+        'route_analyze_feedback': (post_analyze_feedback, [(t,) for t in teacher_ids]),
+    }
+
+
+def print_report(results, header):
+    print(header)
+    columns = ['operation', 'calls', 'throughput_per_s', 'p50_ms', 'p95_ms', 'p99_ms', 'peak_mb', 'db_requests']
+    widths = [max(len(c), *(len(str(r[c])) for r in results)) for c in columns]
+    print('  '.join(c.ljust(w) for c, w in zip(columns, widths)))
+    for result in results:
+        print('  '.join(str(result[c]).ljust(w) for c, w in zip(columns, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=sorted(SCALES), default='1k', help='synthetic data size (feedback rows)')
+    parser.add_argument('--samples', type=int, default=50, help='calls per operation')
+    parser.add_argument('--db-latency', type=float, default=0.0, help='seconds added to each fake Supabase request')
+    parser.add_argument('--llm-latency', type=float, default=0.0, help='seconds added to each fake Gemini call')
+    parser.add_argument('--ops', help='comma-separated subset of operations to run')
+    parser.add_argument('--json', help='also write results to this file')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--verbose', action='store_true', help="show the service's own log output")
+    parser.add_argument('--snapshot', help='run against an exported snapshot directory instead of synthetic data')
+    args = parser.parse_args()
+
+    os.environ.setdefault('LLM_CACHE_SIZE', '0')
+    rng = random.Random(args.seed)
+
+    setup_start = time.perf_counter()
+    model_dir = tempfile.mkdtemp(prefix='bench-models-')
+    if args.snapshot:
+        client, _, tables = install_snapshot(args.snapshot, args.llm_latency, model_dir)
+    else:
+        tables = generate_tables(SCALES[args.scale], seed=args.seed)
+        client, _ = install_fakes(tables, args.db_latency, args.llm_latency, model_dir)
+    operations = build_operations(tables, args.samples, rng)
+    setup_seconds = time.perf_counter() - setup_start
+
+    selected = args.ops.split(',') if args.ops else list(operations)
+    unknown = [op for op in selected if op not in operations]
+    if unknown:
+        parser.error(f"unknown operations: {', '.join(unknown)} (choose from {', '.join(operations)})")
+
+    results = []
+    for name in selected:
+        fn, calls = operations[name]
+        requests_before = getattr(client, 'request_count', 0)
+        # The service logs with print(); keep the report readable
+        with open(os.devnull, 'w') as devnull, redirect_stdout(None if args.verbose else devnull):
+            result = measure(name, fn, calls)
+        result['db_requests'] = getattr(client, 'request_count', 0) - requests_before
+        results.append(result)
+
+    header = (
+        f"{f'snapshot={args.snapshot}' if args.snapshot else f'scale={args.scale}'} teachers={len(tables['teachers'])} feedback={len(tables['feedback'])} "
+        f"db_latency={args.db_latency}s llm_latency={args.llm_latency}s setup={setup_seconds:.1f}s"
+    )
+    print_report(results, header)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
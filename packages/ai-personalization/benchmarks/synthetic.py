@@ -0,0 +1,120 @@
+"""Synthetic, deterministic Supabase tables for benchmarks"""
+import random
+
+COMPETENCIES = [
+    'classroom_management',
+    'content_knowledge',
+    'pedagogy',
+    'technology_usage',
+    'student_engagement'
+]
+
+# Number of feedback rows per scale; teachers and assessments scale with it
+SCALES = {
+    '1k': 1_000,
+    '100k': 100_000,
+    '1m': 1_000_000
+}
+
+ISSUE_PHRASES = {
+    'classroom_management': ['noise', 'discipline', 'students fighting', 'late to class', 'शोर', 'अनुशासन'],
+    'content_knowledge': ['syllabus', 'difficult topic', 'concept unclear', 'पाठ्यक्रम'],
+    'pedagogy': ['lesson plan', 'teaching method', 'group work', 'शिक्षण विधि'],
+    'technology_usage': ['projector', 'smartboard', 'no internet', 'tablet', 'तकनीक'],
+    'student_engagement': ['bored', 'absent', 'not attentive', 'dropout', 'ध्यान नहीं']
+}
+
+FILLER = [
+    'students in my class', 'during the afternoon period', 'since last week',
+    'despite repeated efforts', 'mostly in grade 6', 'बच्चे', 'kya karein'
+]
+
+
+def _timestamp(rng, day_span=365):
+    day = rng.randrange(day_span)
+    return f'2025-{1 + day // 31 % 12:02d}-{1 + day % 28:02d}T{rng.randrange(24):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}.{rng.randrange(10**6):06d}'
+
+
+def generate_tables(n_feedback, n_clusters=None, extra_keywords=2000, seed=42):
+    """
+    Build every table the service reads:
+    teachers = n/10, assessments = 2 per teacher, feedback = n
+    """
+    rng = random.Random(seed)
+    n_teachers = max(n_feedback // 10, 10)
+    n_clusters = n_clusters or max(n_teachers // 200, 1)
+
+    clusters = [
+        {'id': f'cluster-{c:05d}', 'name': f'Cluster {c}', 'location': rng.choice(['Ranchi', 'Gumla', 'Dumka', 'Palamu'])}
+        for c in range(n_clusters)
+    ]
+
+    teachers = [
+        {
+            'id': f'teacher-{t:08d}',
+            'name': f'Teacher {t}',
+            'subject': rng.choice(['Math', 'Science', 'Hindi', 'English']),
+            'experience_years': rng.randrange(1, 30),
+            'cluster_id': clusters[t % n_clusters]['id']
+        }
+        for t in range(n_teachers)
+    ]
+
+    assessments = []
+    for t, teacher in enumerate(teachers):
+        for version in range(2):
+            row = {
+                'id': f'assessment-{t:08d}-{version}',
+                'teacher_id': teacher['id'],
+                'created_at': f'2025-0{version + 1}-01T00:00:00'
+            }
+            for competency in COMPETENCIES:
+                row[f'{competency}_score'] = rng.randrange(0, 11)
+            assessments.append(row)
+
+    feedback = []
+    for f in range(n_feedback):
+        teacher = teachers[rng.randrange(n_teachers)]
+        competency = rng.choice(COMPETENCIES)
+        description = f'{rng.choice(FILLER)} {rng.choice(ISSUE_PHRASES[competency])} {rng.choice(FILLER)}'
+        feedback.append({
+            'id': f'feedback-{f:08d}',
+            'teacher_id': teacher['id'],
+            'cluster': teacher['cluster_id'],
+            'description': description.capitalize(),
+            'status': rng.choice(['open', 'open', 'training_assigned']),
+            'created_at': _timestamp(rng)
+        })
+
+    mappings = []
+    for competency, phrases in ISSUE_PHRASES.items():
+        for phrase in phrases:
+            mappings.append({'issue_keyword': phrase, 'competency_area': competency, 'confidence_score': 1.0})
+    # Long tail of keywords that rarely match, as in the production mapping table
+    for k in range(extra_keywords):
+        mappings.append({
+            'issue_keyword': f'rare issue {k}',
+            'competency_area': rng.choice(COMPETENCIES),
+            'confidence_score': round(rng.uniform(0.3, 1.0), 2)
+        })
+    for i, mapping in enumerate(mappings):
+        mapping['id'] = i
+
+    modules = [
+        {
+            'id': f'module-{competency}',
+            'title': competency.replace('_', ' ').title(),
+            'competency_area': competency,
+            'content': 'Base module content. ' * 50
+        }
+        for competency in COMPETENCIES
+    ]
+
+    return {
+        'clusters': clusters,
+        'teachers': teachers,
+        'teacher_assessments': assessments,
+        'feedback': feedback,
+        'issue_competency_mapping': mappings,
+        'training_modules': modules
+    }
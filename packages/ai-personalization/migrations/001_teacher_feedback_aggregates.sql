@@ -0,0 +1,19 @@
+-- Running per-teacher feedback-gap aggregates kept by feedback_analyzer.FeedbackAnalyzer.
+-- One row per teacher, upserted on teacher_id after each incremental analysis.
+create table if not exists public.teacher_feedback_aggregates (
+    teacher_id       uuid primary key references public.teachers (id) on delete cascade,
+    gap_scores       jsonb not null default '{}'::jsonb,
+    total_issues     integer not null default 0,
+    -- Latest issues, newest first
+    issue_summary    jsonb not null default '[]'::jsonb,
+    -- Read cursor: newest folded feedback.created_at ...
+    last_created_at  timestamptz,
+    -- ... and [created_at, id] of the rows folded within the overlap window before it
+    recent_feedback  jsonb not null default '[]'::jsonb,
+    -- Fingerprint of issue_competency_mapping (and match mode); a mismatch triggers a rebuild
+    mapping_version  text
+);
+
+-- Incremental reads page a teacher's feedback by (created_at, id) from the cursor
+create index if not exists feedback_teacher_created_at_id
+    on public.feedback (teacher_id, created_at desc, id desc);
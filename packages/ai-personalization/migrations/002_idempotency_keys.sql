@@ -0,0 +1,17 @@
+-- Idempotency keys for rows the service writes with
+-- upsert(on_conflict='idempotency_key', ignore_duplicates=true), see
+-- SupabaseDB.save_keyed_rows. A key is the SHA-1 of the logical write:
+--   personalized_training: (teacher, triggering feedback, module)
+--   competency_gaps:       (teacher, assessment)
+-- Rows written before this migration keep a null key; nulls never conflict.
+alter table public.personalized_training add column if not exists idempotency_key text;
+alter table public.competency_gaps add column if not exists idempotency_key text;
+
+-- ON CONFLICT needs a non-partial unique index on exactly this column
+create unique index if not exists personalized_training_idempotency_key
+    on public.personalized_training (idempotency_key);
+create unique index if not exists competency_gaps_idempotency_key
+    on public.competency_gaps (idempotency_key);
+
+-- Make PostgREST pick up the new columns without a restart
+notify pgrst, 'reload schema';
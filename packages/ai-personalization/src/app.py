@@ -1,32 +1,124 @@
 import os
+import time
 import traceback
 from dotenv import load_dotenv
 
+_process_start = time.perf_counter()
+
 # 1. LOAD ENV FIRST
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '../.env'))
 
 print(f"DEBUG: Loaded API Key starting with: {os.getenv('GEMINI_API_KEY')[:5] if os.getenv('GEMINI_API_KEY') else 'NONE'}")
 
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-import google.generativeai as genai
+import json
+from lazy import startup_timings, timed_import
+from metrics import metrics, stage, record_stage_error
 
-# 2. Configure Gemini
-if os.getenv('GEMINI_API_KEY'):
-    genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+with timed_import('flask'):
+    from flask import Flask, Response, request, jsonify, stream_with_context
+    from flask_cors import CORS
 
-from ml_engine import analyzer
-from llm_personalizer import personalizer
-from feedback_analyzer import feedback_analyzer
-from supabase_client import db
+# 2. Service singletons are built lazily on first use (Gemini is configured
+#    once inside llm_personalizer), so importing this module does no network I/O
+with timed_import('service_modules'):
+    from ml_engine import analyzer
+    from llm_personalizer import personalizer
+    from feedback_analyzer import feedback_analyzer
+    from supabase_client import db, reference_data
+    from training_assignment import (
+        MAX_BATCH_ITEMS, DEFAULT_GAP, assign_training, assign_training_batch,
+        build_cluster_context, default_module, training_key, training_payload as build_training_payload
+    )
+    from job_queue import job_queue
+    import job_handlers  # noqa: F401  (registers the background job kinds)
+    from module_templates import personalize_from_template, template_store
 
 app = Flask(__name__)
 CORS(app)
 
+startup_timings['app_ready_seconds'] = round(time.perf_counter() - _process_start, 4)
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy', 'service': 'personalization-service'})
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Ready once Supabase answers and reference data is loaded"""
+    try:
+        db.ping()
+        reference_data.snapshot()
+        return jsonify({'status': 'ready'})
+    except Exception as e:
+        return jsonify({'status': 'not_ready', 'error': str(e)}), 503
+
+def _cache_metrics():
+    """LLM response cache counters, once the personalizer exists"""
+    if not personalizer.initialized or not hasattr(personalizer.cache, 'stats'):
+        return []
+    stats = personalizer.cache.stats()
+    return [
+        ('llm_cache_entries', 'gauge', 'LLM response cache entries in memory', stats.pop('entries', 0))
+    ] + [
+        (f'llm_cache_{name}_total', 'counter', f'LLM response cache {name}', value)
+        for name, value in stats.items()
+    ]
+
+def _job_metrics():
+    """Background job counts by status, once the queue exists"""
+    if not job_queue.initialized:
+        return []
+    return [
+        (f'jobs_{status}', 'gauge', f'Background jobs currently {status}', count)
+        for status, count in sorted(job_queue.stats().items())
+    ]
+
+def _db_metrics():
+    """Supabase request/retry/failure counts from the pooled client"""
+    if not db.initialized or not hasattr(db.client, 'stats'):
+        return []
+    return [
+        (f'supabase_{name}_total', 'counter', f'Supabase {name}', value)
+        for name, value in sorted(db.client.stats.items())
+    ]
+
+def _embedding_metrics():
+    """Feedback embedding cache counters in semantic/hybrid match modes"""
+    if not feedback_analyzer.initialized or feedback_analyzer.match_mode == 'keyword':
+        return []
+    stats = feedback_analyzer.semantic_matcher.cache.stats()
+    return [
+        ('feedback_embedding_cache_entries', 'gauge', 'Encoded feedback descriptions in memory', stats.pop('entries'))
+    ] + [
+        (f'feedback_embedding_cache_{name}_total', 'counter', f'Feedback embedding cache {name}', value)
+        for name, value in stats.items()
+    ]
+
+metrics.add_collector(_cache_metrics)
+metrics.add_collector(_db_metrics)
+metrics.add_collector(_embedding_metrics)
+metrics.add_collector(_job_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition of stage latencies, LLM usage and errors"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/startup-report', methods=['GET'])
+def startup_report():
+    """Import and singleton construction timings for this process"""
+    return jsonify({
+        **startup_timings,
+        'initialized': {
+            name: instance.initialized
+            for name, instance in [
+                ('db', db), ('reference_data', reference_data), ('analyzer', analyzer),
+                ('personalizer', personalizer), ('feedback_analyzer', feedback_analyzer),
+                ('job_queue', job_queue), ('template_store', template_store)
+            ]
+        }
+    })
+
 @app.route('/api/analyze-feedback/<teacher_id>', methods=['POST'])
 def analyze_teacher_feedback(teacher_id):
     try:
@@ -36,6 +128,17 @@ def analyze_teacher_feedback(teacher_id):
         print(f"Error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/cluster-feedback/<cluster_id>/top-issues', methods=['GET'])
+def cluster_top_issues(cluster_id):
+    """Most common issues in a cluster, optionally over the last ?days=N (max 31)"""
+    try:
+        days = request.args.get('days', type=int)
+        limit = min(request.args.get('limit', 10, type=int), 100)
+        result = feedback_analyzer.analyze_cluster_feedback(cluster_id, days=days, top_k=limit)
+        return jsonify(result), (500 if 'error' in result else 200)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/analyze-teacher-gaps', methods=['POST'])
 def analyze_teacher_gaps():
     try:
@@ -45,9 +148,98 @@ def analyze_teacher_gaps():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/analyze-cluster-gaps/batch', methods=['POST'])
+def analyze_cluster_gaps_batch():
+    """Queue cluster gap analysis for every cluster (or cluster_ids) across a process pool"""
+    data = request.get_json(silent=True) or {}
+    job_id = job_queue.enqueue('analyze_all_clusters', {
+        'cluster_ids': data.get('cluster_ids'),
+        'workers': data.get('workers')
+    })
+    status_url = f'/api/jobs/{job_id}'
+    return jsonify({'success': True, 'status': 'queued', 'job_id': job_id, 'status_url': status_url}), 202, {'Location': status_url}
+
+@app.route('/api/analyze-cluster-gaps/streaming', methods=['POST'])
+def analyze_cluster_gaps_streaming():
+    """
+    Queue one MiniBatchKMeans grouping over every teacher (or cluster_ids),
+    streamed from Supabase in pages, for populations too large for one fit
+    """
+    data = request.get_json(silent=True) or {}
+    job_id = job_queue.enqueue('analyze_gaps_streaming', {'cluster_ids': data.get('cluster_ids')})
+    status_url = f'/api/jobs/{job_id}'
+    return jsonify({'success': True, 'status': 'queued', 'job_id': job_id, 'status_url': status_url}), 202, {'Location': status_url}
+
+@app.route('/api/predict-teacher-group', methods=['POST'])
+def predict_teacher_group():
+    try:
+        data = request.json
+        result = analyzer.predict_teacher_group(data.get('cluster_id'), data.get('teacher_id'))
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analyze-teacher-gaps/bulk', methods=['POST'])
+def analyze_teacher_gaps_bulk():
+    try:
+        data = request.json or {}
+        return jsonify(analyzer.analyze_gaps_bulk(data.get('teacher_ids', [])))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/feedback-aggregates/rebuild', methods=['POST'])
+def rebuild_feedback_aggregates():
+    """
+    Reload issue_competency_mapping after it changes. Listed teachers are
+    rebuilt now, every other aggregate on its next analysis.
+    """
+    try:
+        data = request.json or {}
+        feedback_analyzer.reload_mappings()
+        
+        rebuilt = 0
+        for teacher_id in data.get('teacher_ids', []):
+            feedback_analyzer.rebuild_teacher_aggregate(teacher_id)
+            rebuilt += 1
+        
+        return jsonify({
+            'success': True,
+            'mapping_version': feedback_analyzer.mapping_version,
+            'rebuilt': rebuilt
+        })
+    except Exception as e:
+        print(f"Error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/reference-data/refresh', methods=['POST'])
+def refresh_reference_data():
+    """Reload clusters, training modules and keyword mappings without a restart"""
+    try:
+        snapshot = reference_data.refresh()
+        return jsonify({
+            'success': snapshot is not None,
+            'clusters': len(snapshot['clusters']) if snapshot else 0,
+            'mappings': len(snapshot['mappings']) if snapshot else 0
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/feedback-to-training', methods=['POST'])
 def feedback_to_training():
-    """Convert teacher feedback into personalized training assignment"""
+    """
+    Convert teacher feedback into personalized training assignment
+    With "async": true (or ?async=1, or Prefer: respond-async) the work is
+    queued and a 202 with a job id is returned immediately
+    """
+    with stage('total'):
+        return _feedback_to_training()
+
+def _wants_async(data):
+    if data.get('async') is True or request.args.get('async') in ('1', 'true'):
+        return True
+    return 'respond-async' in request.headers.get('Prefer', '')
+
+def _feedback_to_training():
     try:
         print("\n=== FEEDBACK TO TRAINING ROUTE ===")
         data = request.json
@@ -59,113 +251,201 @@ def feedback_to_training():
         if not teacher_id or not feedback_id:
             return jsonify({'error': 'teacher_id and feedback_id required'}), 400
         
-        # 1. Analyze feedback
-        print(f"Analyzing feedback for teacher: {teacher_id}")
-        feedback_analysis = feedback_analyzer.analyze_teacher_feedback(teacher_id)
-        inferred_gaps = feedback_analysis.get('inferred_gaps', [])
-        
-        if not inferred_gaps:
-            # Fallback if no gaps found
-            inferred_gaps = ['classroom_management'] 
+        if _wants_async(data):
+            job_id = job_queue.enqueue('feedback_to_training', {'teacher_id': teacher_id, 'feedback_id': feedback_id})
+            print(f"Queued training job {job_id}")
+            status_url = f'/api/jobs/{job_id}'
+            return jsonify({'success': True, 'status': 'queued', 'job_id': job_id, 'status_url': status_url}), 202, {'Location': status_url}
         
-        # 2. Get teacher
-        teacher = db.get_teacher_by_id(teacher_id)
-        if not teacher:
-            return jsonify({'error': 'Teacher not found'}), 404
-            
-        # 3. Get cluster context
-        cluster_id = teacher.get('cluster_id')
-        try:
-            cluster_response = db.client.table('clusters').select('*').eq('id', cluster_id).execute()
-            cluster_data = cluster_response.data[0] if cluster_response.data else {}
-        except:
-            cluster_data = {}
+        body, status = assign_training(teacher_id, feedback_id)
+        return jsonify(body), status
         
-        cluster_context = {
-            'location': cluster_data.get('location', 'Rural India'),
-            'common_issues': 'general challenges',
-            'language': 'Hindi'
+    except Exception as e:
+        record_stage_error('total')
+        print(f" UNEXPECTED ERROR: {e}")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Status of a queued job: queued, running, succeeded (with result) or failed"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+def _sse(event, data):
+    """One server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _save_training(teacher_id, feedback_id, base_module, content):
+    """Save the training row and mark the feedback assigned; returns whether both were written"""
+    try:
+        db.insert_personalized_training(
+            build_training_payload(teacher_id, feedback_id, base_module, content),
+            key=training_key(teacher_id, feedback_id, base_module) if feedback_id else None
+        )
+        if feedback_id:
+            db.update_feedback_status(feedback_id, 'training_assigned')
+        return True
+    except Exception as e:
+        print(f"Database save error: {e}")
+        traceback.print_exc()
+        return False
+
+def _personalization_inputs(params):
+    """
+    Resolve teacher, competency gaps, base module and cluster context for
+    the personalization routes; returns (inputs, None) or (None, error response)
+    """
+    teacher_id = params.get('teacher_id')
+    if not teacher_id:
+        return None, (jsonify({'error': 'teacher_id required'}), 400)
+    
+    teacher = db.get_teacher_by_id(teacher_id)
+    if not teacher:
+        return None, (jsonify({'error': 'Teacher not found'}), 404)
+    
+    gaps = [params['competency']] if params.get('competency') else (
+        feedback_analyzer.analyze_teacher_feedback(teacher_id).get('inferred_gaps') or [DEFAULT_GAP]
+    )
+    return {
+        'teacher': teacher,
+        'gaps': gaps,
+        'base_module': reference_data.get_module_for_competency(gaps[0]) or default_module(),
+        'cluster_context': build_cluster_context(reference_data.get_cluster(teacher.get('cluster_id')) or {}),
+        'teacher_profile': {
+            'name': teacher.get('name'),
+            'subject': teacher.get('subject', 'General'),
+            'experience': teacher.get('experience_years', 'Unknown'),
+            'gap_areas': gaps
         }
+    }, None
+
+@app.route('/api/personalized-training', methods=['POST'])
+def personalized_training_from_template():
+    """
+    Personalize a module from its precomputed (cluster, module) template
+    Body: teacher_id, optional competency, feedback_id and mode ('fill' or 'intro')
+    """
+    params = request.get_json(silent=True) or {}
+    try:
+        inputs, error = _personalization_inputs(params)
+        if error:
+            return error
         
-        # 4. Get base training module
-        try:
-            module_response = db.client.table('training_modules')\
-                .select('*')\
-                .eq('competency_area', inferred_gaps[0])\
-                .limit(1)\
-                .execute()
-            
-            if module_response.data:
-                base_module = module_response.data[0]
-            else:
-                base_module = {'id': 'default', 'title': 'General Pedagogy', 'description': 'Basics'}
-        except Exception as e:
-            print(f"Module fetch error: {e}")
-            base_module = {'id': 'default', 'title': 'Classroom Management', 'description': 'Basics'}
+        teacher = inputs['teacher']
+        result = personalize_from_template(
+            inputs['base_module'], inputs['teacher_profile'], teacher.get('cluster_id'),
+            inputs['cluster_context'], mode=params.get('mode')
+        )
+        if result['success']:
+            result['saved'] = _save_training(
+                teacher['id'], params.get('feedback_id'), inputs['base_module'], result['personalized_content']
+            )
+        return jsonify(result)
+    except Exception as e:
+        print(f"Template personalization error: {e}")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/templates/precompute', methods=['POST'])
+def precompute_module_templates():
+    """Queue generation of every stale (cluster, module) template; optional cluster_ids"""
+    data = request.get_json(silent=True) or {}
+    job_id = job_queue.enqueue('precompute_templates', {'cluster_ids': data.get('cluster_ids')})
+    status_url = f'/api/jobs/{job_id}'
+    return jsonify({'success': True, 'status': 'queued', 'job_id': job_id, 'status_url': status_url}), 202, {'Location': status_url}
+
+@app.route('/api/personalized-training/stream', methods=['GET', 'POST'])
+def stream_personalized_training():
+    """
+    Personalize a training module and stream it as server-sent events
+    Params (JSON body or query string): teacher_id, optional competency
+    (else inferred from feedback) and feedback_id to link the saved row
+    Events: meta, chunk ({"text"}) per model chunk, then done or error
+    """
+    params = request.get_json(silent=True) or request.args
+    inputs, error = _personalization_inputs(params)
+    if error:
+        return error
+    teacher_id, feedback_id = params.get('teacher_id'), params.get('feedback_id')
+    gaps, base_module = inputs['gaps'], inputs['base_module']
+    teacher_profile, cluster_context = inputs['teacher_profile'], inputs['cluster_context']
+    
+    def events():
+        yield _sse('meta', {'teacher_id': teacher_id, 'competency': gaps[0], 'module': base_module.get('title')})
         
-        # 5. Generate personalized training
-        print("Generating personalized content with AI...")
+        parts = []
+        stream = personalizer.stream_training_module(base_module, teacher_profile, cluster_context)
         try:
-            model = genai.GenerativeModel('gemini-pro')
-            prompt = f"""
-            You are an expert teacher trainer.
-            Teacher: {teacher.get('name')} 
-            Issue Category: {inferred_gaps[0]}
-            Module: {base_module['title']}
-            
-            Task: Write a very short, encouraging message (2 sentences) assigning this module to help with their recent feedback.
-            """
-            
-            response = model.generate_content(prompt)
-            personalized_text = response.text
+            for text in stream:
+                parts.append(text)
+                yield _sse('chunk', {'text': text})
+        except GeneratorExit:
+            # Client went away: finish generating so the module is still saved
+            try:
+                parts.extend(stream)
+                _save_training(teacher_id, feedback_id, base_module, ''.join(parts))
+            except Exception as e:
+                print(f"Stream error after disconnect: {e}")
+            raise
         except Exception as e:
-            print(f"AI Error (using fallback): {e}")
-            personalized_text = f"We have assigned {base_module['title']} to help you with your recent feedback."
+            print(f"Stream error: {e}")
+            yield _sse('error', {'error': str(e), 'fallback_content': base_module.get('content')})
+            return
+        
+        content = ''.join(parts)
+        saved = _save_training(teacher_id, feedback_id, base_module, content)
+        yield _sse('done', {'saved': saved, 'length': len(content)})
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
-        # ==========================================
-        # 6. SAVE TO DATABASE (THE FIX)
-        # ==========================================
-        print("Saving to database...")
+@app.route('/api/feedback-to-training/batch', methods=['POST'])
+def feedback_to_training_batch():
+    """
+    Assign training for many (teacher_id, feedback_id) pairs at once
+    Streams one JSON line per item as it completes, then a summary line
+    """
+    data = request.json or {}
+    items = data.get('items', [])
+    
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'items must be a non-empty list'}), 400
+    if len(items) > MAX_BATCH_ITEMS:
+        return jsonify({'error': f'At most {MAX_BATCH_ITEMS} items per batch'}), 400
+    if any(not isinstance(item, dict) or not item.get('teacher_id') or not item.get('feedback_id') for item in items):
+        return jsonify({'error': 'every item needs teacher_id and feedback_id'}), 400
+    
+    def generate():
         try:
-            # We use DIRECT INSERT to ensure feedback_id is included
-            training_payload = {
-                "teacher_id": teacher_id,
-                "training_module": base_module['title'],  # The name of the module
-                "content": personalized_text,
-                "status": "assigned",
-                "feedback_id": feedback_id,  # <--- ✅ THIS IS THE CRITICAL LINK
-                "completion_percentage": 0
-            }
-            
-            db.client.table('personalized_training').insert(training_payload).execute()
-            print("✅ Saved to personalized_training with feedback_id link!")
-            
+            for result in assign_training_batch(items):
+                yield json.dumps(result) + '\n'
         except Exception as e:
-            print(f"Database save error: {e}")
+            print(f"Batch error: {e}")
             traceback.print_exc()
-        
-        # 7. Update feedback status
-        try:
-            db.client.table('feedback').update({
-                'status': 'training_assigned'
-            }).eq('id', feedback_id).execute()
-        except Exception as e:
-            print(f"Feedback update error: {e}")
-        
-        print("=== FEEDBACK TO TRAINING COMPLETE ===\n")
-        
-        return jsonify({
-            'success': True,
-            'assigned_module': base_module['title'],
-            'personalized_message': personalized_text
-        })
-        
-    except Exception as e:
-        print(f" UNEXPECTED ERROR: {e}")
-        traceback.print_exc()
-        return jsonify({'error': str(e)}), 500
+            yield json.dumps({'done': True, 'error': str(e)}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def start_background_workers():
+    """
+    Start this serving process's job workers, so jobs queued or abandoned
+    before a restart resume without waiting for a new enqueue. Not run on
+    import: spawned cluster pool workers re-import this module. Under
+    gunicorn, call it from a post_worker_init hook.
+    """
+    job_queue.start()
 
 if __name__ == '__main__':
     port = int(os.getenv('FLASK_PORT', 5001))
-    print(f"\n🚀 Personalization Service Starting on port {port}...\n")
+    print(f"\n🚀 Personalization Service Starting on port {port}...")
+    print(f"   Startup: {startup_timings}\n")
+    # With debug=True the reloader's parent only watches files; its child serves
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_workers()
     app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
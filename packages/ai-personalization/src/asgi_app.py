@@ -0,0 +1,181 @@
+"""
+asyncio serving mode for the personalization service
+
+Serves the same routes as app.py on Quart, with async Supabase and Gemini
+clients so one process can hold many in-flight requests. Run with:
+
+    hypercorn asgi_app:app --bind 0.0.0.0:5001
+"""
+import os
+import asyncio
+import traceback
+from dotenv import load_dotenv
+
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '../.env'))
+
+from quart import Quart, request, jsonify
+from quart_cors import cors
+
+from ml_engine import analyzer
+from llm_personalizer import personalizer
+from feedback_analyzer import feedback_analyzer
+from async_supabase_client import async_db
+from supabase_client import reference_data
+from training_assignment import DEFAULT_GAP, build_cluster_context, default_module, training_key, training_payload
+from single_flight import AsyncSingleFlight
+from job_queue import job_queue
+import job_handlers  # noqa: F401  (registers the background job kinds)
+
+app = cors(Quart(__name__))
+
+# Overlapping requests for the same teacher share one analysis
+_analysis_inflight = AsyncSingleFlight('analysis')
+
+
+def _warm_up():
+    """
+    Build the lazy singletons and load reference data before serving, so
+    no request pays for it on the event loop
+    """
+    try:
+        reference_data.snapshot()
+        feedback_analyzer.matcher  # Builds the analyzer and its keyword automaton
+        personalizer.cache
+        analyzer.models
+    except Exception as e:
+        # Lookups retry on first use; each route runs them off the loop
+        print(f"⚠️ Warm-up failed, loading lazily: {e}")
+    # Resume jobs queued or abandoned before a restart
+    job_queue.start()
+
+
+@app.before_serving
+async def startup():
+    await asyncio.to_thread(_warm_up)
+
+
+async def _analyze_feedback(teacher_id):
+    """Async reads, then the same incremental aggregate as the sync service"""
+    return await _analysis_inflight.do(teacher_id, _fetch_and_fold, teacher_id)
+
+
+async def _fetch_and_fold(teacher_id):
+    stored = await async_db.get_feedback_aggregate(teacher_id)
+    aggregate = await asyncio.to_thread(feedback_analyzer.resume_aggregate, teacher_id, stored)
+    if aggregate is stored:
+        ids = feedback_analyzer.summary_feedback_ids(aggregate)
+        if ids:
+            feedback_analyzer.apply_summary_statuses(aggregate, await async_db.get_feedback_statuses(ids))
+
+    # Only feedback from the aggregate's cursor (minus the overlap) on
+    try:
+        feedback_items = await async_db.get_teacher_feedback(teacher_id, since=feedback_analyzer.read_from(aggregate))
+    except Exception as e:
+        print(f"Error fetching feedback: {e}")
+        return {'error': str(e)}
+    # Keyword/semantic matching is CPU work; keep it off the event loop
+    folded, result = await asyncio.to_thread(feedback_analyzer.continue_aggregate, aggregate, feedback_items)
+
+    if folded:
+        await async_db.save_feedback_aggregate(aggregate)
+    return result
+
+
+def _training_inputs(cluster_id, gap):
+    """Cluster context and base module; blocks while the reference cache loads"""
+    cluster_context = build_cluster_context(reference_data.get_cluster(cluster_id) or {})
+    base_module = reference_data.get_module_for_competency(gap) or default_module()
+    return cluster_context, base_module
+
+
+@app.route('/health', methods=['GET'])
+async def health_check():
+    return jsonify({'status': 'healthy', 'service': 'personalization-service', 'mode': 'asgi'})
+
+
+@app.route('/api/analyze-feedback/<teacher_id>', methods=['POST'])
+async def analyze_teacher_feedback(teacher_id):
+    try:
+        return jsonify(await _analyze_feedback(teacher_id))
+    except Exception as e:
+        print(f"Error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/analyze-teacher-gaps', methods=['POST'])
+async def analyze_teacher_gaps():
+    try:
+        data = await request.get_json()
+        teacher_id = data.get('teacher_id')
+
+        assessment = await async_db.get_teacher_assessments(teacher_id)
+        result = analyzer.build_gap_result(teacher_id, assessment)
+        if 'error' not in result:
+            await async_db.save_gap_analysis(teacher_id, result, key=analyzer.gap_key(teacher_id, assessment.get('id')))
+
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/feedback-to-training', methods=['POST'])
+async def feedback_to_training():
+    """Convert teacher feedback into personalized training assignment"""
+    try:
+        data = await request.get_json()
+
+        teacher_id = data.get('teacher_id')
+        feedback_id = data.get('feedback_id')
+
+        if not teacher_id or not feedback_id:
+            return jsonify({'error': 'teacher_id and feedback_id required'}), 400
+
+        # 1. Analyze feedback
+        feedback_analysis = await _analyze_feedback(teacher_id)
+        inferred_gaps = feedback_analysis.get('inferred_gaps') or [DEFAULT_GAP]
+
+        # 2. Get teacher
+        teacher = await async_db.get_teacher_by_id(teacher_id)
+        if not teacher:
+            return jsonify({'error': 'Teacher not found'}), 404
+
+        # 3-4. Get cluster context and base training module
+        cluster_context, base_module = await asyncio.to_thread(
+            _training_inputs, teacher.get('cluster_id'), inferred_gaps[0]
+        )
+
+        # 5. Generate personalized training
+        personalized_text = await personalizer.generate_assignment_message_async(teacher, inferred_gaps[0], base_module)
+
+        # 6. Save to database
+        try:
+            await async_db.insert_personalized_training(
+                training_payload(teacher_id, feedback_id, base_module, personalized_text),
+                key=training_key(teacher_id, feedback_id, base_module)
+            )
+        except Exception as e:
+            print(f"Database save error: {e}")
+            traceback.print_exc()
+
+        # 7. Update feedback status
+        try:
+            await async_db.update_feedback_status(feedback_id, 'training_assigned')
+        except Exception as e:
+            print(f"Feedback update error: {e}")
+
+        return jsonify({
+            'success': True,
+            'assigned_module': base_module['title'],
+            'personalized_message': personalized_text
+        })
+
+    except Exception as e:
+        print(f" UNEXPECTED ERROR: {e}")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+
+if __name__ == '__main__':
+    port = int(os.getenv('FLASK_PORT', 5001))
+    print(f"\n🚀 Personalization Service (ASGI) Starting on port {port}...\n")
+    app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,92 @@
+import sys
+from typing import Dict, Iterable
+import numpy as np
+
+# Feature order shared with ml_engine.COMPETENCIES
+SCORE_COLUMNS = (
+    'classroom_management_score',
+    'content_knowledge_score',
+    'pedagogy_score',
+    'technology_usage_score',
+    'student_engagement_score'
+)
+
+
+class AssessmentStore:
+    """
+    Latest assessment per teacher, stored column-wise
+
+    Scores live in one contiguous (rows x 5) float32 array. Each teacher id
+    is interned once and mapped to its row index, so lookups are a single
+    dict read. The JSON rows are not kept, which matters at district scale
+    where one dict per assessment costs around 1 KB against 20 bytes here.
+    """
+
+    __slots__ = ('_rows', 'teacher_ids', 'assessment_ids', 'created_at', '_scores')
+
+    def __init__(self, capacity: int = 1024):
+        self._rows = {}            # teacher_id -> row index
+        self.teacher_ids = []      # row index -> teacher_id
+        self.assessment_ids = []
+        self.created_at = []
+        self._scores = np.zeros((max(capacity, 1), len(SCORE_COLUMNS)), dtype=np.float32)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict]) -> 'AssessmentStore':
+        """Build from assessment rows; the newest row per teacher wins"""
+        store = cls()
+        for row in rows:
+            store.add(row)
+        return store
+
+    def __len__(self):
+        return len(self.teacher_ids)
+
+    def __contains__(self, teacher_id):
+        return teacher_id in self._rows
+
+    @property
+    def scores(self) -> np.ndarray:
+        """(n_teachers x 5) view over the filled rows"""
+        return self._scores[:len(self.teacher_ids)]
+
+    def add(self, row: Dict):
+        """Insert or replace a teacher's assessment unless the stored one is newer"""
+        teacher_id = row['teacher_id']
+        index = self._rows.get(teacher_id)
+        if index is None:
+            index = len(self.teacher_ids)
+            if index == len(self._scores):
+                grown = np.zeros((2 * index, len(SCORE_COLUMNS)), dtype=np.float32)
+                grown[:index] = self._scores
+                self._scores = grown
+            if isinstance(teacher_id, str):
+                teacher_id = sys.intern(teacher_id)
+            self._rows[teacher_id] = index
+            self.teacher_ids.append(teacher_id)
+            self.assessment_ids.append(row.get('id'))
+            self.created_at.append(row.get('created_at'))
+        elif (row.get('created_at') or '') <= (self.created_at[index] or ''):
+            return
+        else:
+            self.assessment_ids[index] = row.get('id')
+            self.created_at[index] = row.get('created_at')
+
+        target = self._scores[index]
+        for column, name in enumerate(SCORE_COLUMNS):
+            target[column] = row.get(name) or 0
+
+    def row(self, teacher_id):
+        """Row index of a teacher, or None"""
+        return self._rows.get(teacher_id)
+
+    def rows_for(self, teacher_ids: Iterable[str]):
+        """(row indices, teacher ids) for the given teachers that have an assessment"""
+        found = [(self._rows[teacher_id], teacher_id) for teacher_id in teacher_ids if teacher_id in self._rows]
+        indices = np.fromiter((index for index, _ in found), dtype=np.intp, count=len(found))
+        return indices, [teacher_id for _, teacher_id in found]
+
+    def matrix(self, teacher_ids: Iterable[str], dtype=np.float32):
+        """(score matrix, teacher ids) for the given teachers that have an assessment"""
+        indices, found = self.rows_for(teacher_ids)
+        return self._scores[indices].astype(dtype, copy=False), found
@@ -0,0 +1,188 @@
+import os
+import asyncio
+from dotenv import load_dotenv
+from pathlib import Path
+from lazy import LazyInstance
+from db_pool import AsyncPooledClient, create_async_pooled_client
+from supabase_client import (
+    SupabaseDB, TEACHER_COLUMNS, FEEDBACK_COLUMNS, ASSESSMENT_COLUMNS,
+    IDEMPOTENCY_COLUMN, KEYLESS_ERROR_CODES, _keyset_page
+)
+
+current_dir = Path(__file__).parent
+dotenv_path = current_dir.parent.parent.parent / '.env'
+load_dotenv(dotenv_path=dotenv_path)
+
+
+class AsyncSupabaseDB:
+    """
+    asyncio counterpart of SupabaseDB for the ASGI serving mode
+
+    Uses the same column projections, keyset paging and keyed writes, and
+    every query goes through an AsyncPooledClient with the sync client's
+    timeout and retry policy.
+    """
+
+    def __init__(self, client=None):
+        # An injected client (e.g. the benchmark fakes) skips env configuration
+        if client is None:
+            self.url = os.getenv("SUPABASE_URL")
+            self.key = os.getenv("SUPABASE_KEY_PYTHON")
+
+            if not self.url or not self.key:
+                raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set in .env file")
+        elif not isinstance(client, AsyncPooledClient):
+            client = AsyncPooledClient(client)
+
+        self._client = client
+        self._lock = asyncio.Lock()
+        self._keyless_tables = set()  # Tables without the idempotency_key constraint
+
+    async def client(self):
+        """Create the async client on first use inside the running event loop"""
+        if self._client is None:
+            async with self._lock:
+                if self._client is None:
+                    self._client = AsyncPooledClient(await create_async_pooled_client(self.url, self.key))
+        return self._client
+
+    async def _keyset_rows(self, build_query, sort_column='id', descending=False, page_size=1000):
+        """Async generator over build_query() in keyset pages, like SupabaseDB._keyset_rows"""
+        cursor = None
+        while True:
+            query = _keyset_page(build_query(), cursor, sort_column, descending, page_size)
+            rows = (await query.execute()).data or []
+
+            for row in rows:
+                yield row
+            if len(rows) < page_size:
+                return
+            cursor = (rows[-1].get(sort_column), rows[-1]['id'])
+
+    async def get_teacher_by_id(self, teacher_id, columns=TEACHER_COLUMNS):
+        """Fetch teacher profile from Supabase"""
+        try:
+            client = await self.client()
+            response = await client.table('teachers').select(columns).eq('id', teacher_id).execute()
+            return response.data[0] if response.data else None
+        except Exception as e:
+            print(f"Error fetching teacher: {e}")
+            return None
+
+    async def get_teacher_feedback(self, teacher_id, since=None, columns=FEEDBACK_COLUMNS, page_size=1000):
+        """
+        Fetch a teacher's feedback newest first, optionally only rows created
+        after `since`, paging past the API row limit (raises on failure)
+        """
+        client = await self.client()
+        columns = SupabaseDB._with_keys(columns, 'created_at')
+
+        def build_query():
+            query = client.table('feedback').select(columns).eq('teacher_id', teacher_id)
+            return query.gt('created_at', since) if since else query
+
+        return [
+            row async for row in self._keyset_rows(build_query, sort_column='created_at', descending=True, page_size=page_size)
+        ]
+
+    async def get_feedback_statuses(self, feedback_ids):
+        """Fetch current status for a few feedback rows, returns dict of id -> status"""
+        try:
+            client = await self.client()
+            response = await client.table('feedback').select('id,status').in_('id', list(feedback_ids)).execute()
+            return {row['id']: row['status'] for row in response.data}
+        except Exception as e:
+            print(f"Error fetching feedback statuses: {e}")
+            return {}
+
+    async def get_feedback_aggregate(self, teacher_id):
+        """Fetch a teacher's persisted feedback-gap aggregate"""
+        try:
+            client = await self.client()
+            response = await client.table('teacher_feedback_aggregates')\
+                .select('*')\
+                .eq('teacher_id', teacher_id)\
+                .execute()
+            return response.data[0] if response.data else None
+        except Exception as e:
+            print(f"Error fetching feedback aggregate: {e}")
+            return None
+
+    async def save_feedback_aggregate(self, aggregate):
+        """Upsert a teacher's feedback-gap aggregate (one row per teacher_id)"""
+        try:
+            client = await self.client()
+            response = await client.table('teacher_feedback_aggregates')\
+                .upsert(aggregate, on_conflict='teacher_id')\
+                .execute()
+            return response.data
+        except Exception as e:
+            print(f"Error saving feedback aggregate: {e}")
+            return None
+
+    async def get_teacher_assessments(self, teacher_id):
+        """Fetch teacher's competency assessment scores"""
+        try:
+            client = await self.client()
+            response = await client.table('teacher_assessments')\
+                .select(ASSESSMENT_COLUMNS)\
+                .eq('teacher_id', teacher_id)\
+                .order('created_at', desc=True)\
+                .limit(1)\
+                .execute()
+            return response.data[0] if response.data else None
+        except Exception as e:
+            print(f"Error fetching assessments: {e}")
+            return None
+
+    async def save_keyed_rows(self, table, rows):
+        """
+        Insert rows that carry an idempotency_key, skipping keys already
+        written (raises on failure); see SupabaseDB.save_keyed_rows
+        """
+        client = await self.client()
+        if table not in self._keyless_tables:
+            try:
+                response = await client.table(table)\
+                    .upsert(rows, on_conflict=IDEMPOTENCY_COLUMN, ignore_duplicates=True)\
+                    .execute()
+                return response.data
+            except Exception as e:
+                if getattr(e, 'code', None) not in KEYLESS_ERROR_CODES:
+                    raise
+                print(f"⚠️ {table} has no unique {IDEMPOTENCY_COLUMN} ({e.code}), writing without idempotency keys; "
+                      f"apply migrations/002_idempotency_keys.sql")
+                self._keyless_tables.add(table)
+        response = await client.table(table).insert([
+            {column: value for column, value in row.items() if column != IDEMPOTENCY_COLUMN} for row in rows
+        ]).execute()
+        return response.data
+
+    async def save_gap_analysis(self, teacher_id, gap_data, key=None):
+        """Save ML-generated gap analysis; with a key, at most once per key"""
+        try:
+            data = SupabaseDB.gap_row(teacher_id, gap_data)
+            if key:
+                return await self.save_keyed_rows('competency_gaps', [{**data, IDEMPOTENCY_COLUMN: key}])
+            client = await self.client()
+            response = await client.table('competency_gaps').insert(data).execute()
+            return response.data
+        except Exception as e:
+            print(f"Error saving gap analysis: {e}")
+            return None
+
+    async def insert_personalized_training(self, payload, key=None):
+        """Insert one personalized_training row, keyed if given (raises on failure)"""
+        if key:
+            return await self.save_keyed_rows('personalized_training', [{**payload, IDEMPOTENCY_COLUMN: key}])
+        client = await self.client()
+        response = await client.table('personalized_training').insert(payload).execute()
+        return response.data
+
+    async def update_feedback_status(self, feedback_id, status):
+        """Set a feedback row's status (raises on failure)"""
+        client = await self.client()
+        await client.table('feedback').update({'status': status}).eq('id', feedback_id).execute()
+
+# Global instance, built on first use
+async_db = LazyInstance(AsyncSupabaseDB, 'async_db')
@@ -0,0 +1,144 @@
+import os
+import json
+import threading
+import time
+
+from supabase_client import IDEMPOTENCY_COLUMN, idempotency_key  # noqa: F401  (re-exported)
+
+FLUSH_ROWS = int(os.getenv('BULK_WRITE_ROWS', 200))
+MAX_ATTEMPTS = int(os.getenv('BULK_WRITE_ATTEMPTS', 5))
+RETRY_SECONDS = float(os.getenv('BULK_WRITE_RETRY_SECONDS', 0.2))
+
+
+class BulkWriter:
+    """
+    Buffers inserts and id-based updates of a batch flow and writes them
+    in bulk
+
+    Rows are grouped per table and written with db.save_keyed_rows, as
+    multi-row upserts that skip existing idempotency_key values. A retried
+    batch therefore never duplicates a row. Updates with the same values
+    are merged into one `in (...)` update.
+
+    Flushes happen when max_rows is reached and on close(), which a `with`
+    block calls on exit. A failed flush keeps its rows buffered for the next
+    flush, up to max_attempts; close() retries until nothing is buffered and
+    returns how many writes were lost. Single-item and request paths write synchronously
+    through the db instead, so their response reflects the write.
+    """
+
+    def __init__(self, database, max_rows=FLUSH_ROWS, max_attempts=MAX_ATTEMPTS, retry_seconds=None):
+        self._db = database
+        self.max_rows = max_rows
+        self.max_attempts = max_attempts
+        self.retry_seconds = RETRY_SECONDS if retry_seconds is None else retry_seconds
+        self._rows = {}       # table -> {key: [row, attempts]}
+        self._updates = {}    # (table, values json) -> {row id: attempts}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.stats = {'rows': 0, 'updates': 0, 'flushes': 0, 'errors': 0, 'dropped': 0}
+
+    # Buffering ---------------------------------------------------------
+
+    def add(self, table, row, key=None):
+        """Buffer one row for insertion; returns its idempotency key"""
+        key = key or idempotency_key(table, row)
+        with self._lock:
+            # A later add with the same key replaces the pending row
+            self._rows.setdefault(table, {})[key] = [{**row, IDEMPOTENCY_COLUMN: key}, 0]
+        self._buffered()
+        return key
+
+    def update(self, table, row_id, values):
+        """Buffer `update table set values where id = row_id`"""
+        group = (table, json.dumps(values, sort_keys=True, default=str))
+        with self._lock:
+            self._updates.setdefault(group, {})[row_id] = 0
+        self._buffered()
+
+    def pending(self):
+        with self._lock:
+            return sum(len(rows) for rows in self._rows.values()) + sum(len(ids) for ids in self._updates.values())
+
+    def unsaved(self):
+        """Writes still buffered plus writes dropped after max_attempts"""
+        return self.pending() + self.stats['dropped']
+
+    def _buffered(self):
+        if self.pending() >= self.max_rows:
+            self.flush()
+
+    # Writing -----------------------------------------------------------
+
+    def flush(self):
+        """Write everything buffered now; returns the number of rows written"""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, {}
+                updates, self._updates = self._updates, {}
+            if not rows and not updates:
+                return 0
+
+            written = 0
+            # Inserts first, so a status update never points at a row that is not written yet
+            for table, entries in rows.items():
+                try:
+                    self._db.save_keyed_rows(table, [row for row, _ in entries.values()])
+                    written += len(entries)
+                except Exception as e:
+                    self._requeue_rows(table, entries, e)
+
+            updated = 0
+            for (table, values), ids in updates.items():
+                try:
+                    self._db.update_rows_by_id(table, json.loads(values), list(ids))
+                    updated += len(ids)
+                except Exception as e:
+                    self._requeue_updates(table, values, ids, e)
+
+            with self._lock:
+                self.stats['flushes'] += 1
+                self.stats['rows'] += written
+                self.stats['updates'] += updated
+            return written
+
+    def _requeue_rows(self, table, entries, error):
+        print(f"Bulk write to {table} failed ({len(entries)} rows): {error}")
+        with self._lock:
+            self.stats['errors'] += 1
+            pending = self._rows.setdefault(table, {})
+            for key, (row, attempts) in entries.items():
+                if attempts + 1 >= self.max_attempts:
+                    self.stats['dropped'] += 1
+                elif key not in pending:  # Keep a newer row with the same key
+                    pending[key] = [row, attempts + 1]
+
+    def _requeue_updates(self, table, values, ids, error):
+        print(f"Bulk update of {table} failed ({len(ids)} rows): {error}")
+        with self._lock:
+            self.stats['errors'] += 1
+            pending = self._updates.setdefault((table, values), {})
+            for row_id, attempts in ids.items():
+                if attempts + 1 >= self.max_attempts:
+                    self.stats['dropped'] += 1
+                else:
+                    pending.setdefault(row_id, attempts + 1)
+
+    def close(self):
+        """
+        Flush until nothing is buffered, backing off between failed flushes;
+        returns unsaved(), 0 when every write landed
+        """
+        for attempt in range(self.max_attempts):
+            if not self.pending():
+                break
+            if attempt:
+                time.sleep(self.retry_seconds * attempt)
+            self.flush()
+        return self.unsaved()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
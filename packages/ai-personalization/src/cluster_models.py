@@ -0,0 +1,196 @@
+import os
+import re
+import json
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from pathlib import Path
+import numpy as np
+
+MODEL_DIR = Path(os.getenv('CLUSTER_MODEL_DIR', Path(__file__).parent.parent / 'models'))
+DRIFT_THRESHOLD = float(os.getenv('CLUSTER_MODEL_DRIFT', 0.5))  # Mean shift, in training std units
+ROW_CHANGE_THRESHOLD = float(os.getenv('CLUSTER_MODEL_ROW_CHANGE', 0.2))  # Relative change in sample count
+# 'spawn' keeps workers clear of the parent's threads (Flask, job queue, httpx pool)
+BATCH_START_METHOD = os.getenv('CLUSTER_BATCH_START_METHOD', 'spawn')
+
+
+class ClusterModel:
+    """Fitted scaler + K-Means centroids for one cluster_id"""
+
+    def __init__(self, cluster_id, mean, scale, centroids, n_samples, trained_at=None):
+        self.cluster_id = cluster_id
+        self.mean = np.asarray(mean, dtype=float)
+        self.scale = np.asarray(scale, dtype=float)
+        self.centroids = np.asarray(centroids, dtype=float)
+        self.n_samples = int(n_samples)
+        self.trained_at = trained_at or datetime.now(timezone.utc).isoformat()
+
+    @property
+    def n_clusters(self):
+        return len(self.centroids)
+
+    def predict(self, features):
+        """Assign one feature vector (or a matrix of them) to the nearest centroid"""
+        X = (np.atleast_2d(np.asarray(features, dtype=float)) - self.mean) / self.scale
+        distances = ((X[:, None, :] - self.centroids[None, :, :]) ** 2).sum(axis=2)
+        labels = distances.argmin(axis=1)
+        return int(labels[0]) if np.ndim(features) == 1 else labels
+
+    def needs_refit(self, X):
+        """True when the sample count or feature means drifted past the thresholds"""
+        if abs(len(X) - self.n_samples) > ROW_CHANGE_THRESHOLD * self.n_samples:
+            return True
+        shift = np.abs(np.mean(X, axis=0) - self.mean) / self.scale
+        return bool(shift.max() > DRIFT_THRESHOLD)
+
+    def to_dict(self):
+        return {
+            'cluster_id': self.cluster_id,
+            'mean': self.mean.tolist(),
+            'scale': self.scale.tolist(),
+            'centroids': self.centroids.tolist(),
+            'n_samples': self.n_samples,
+            'trained_at': self.trained_at
+        }
+
+
+def fit_cluster_model(cluster_id, X, n_clusters):
+    """Fit scaler + K-Means on X and return (model, labels) without persisting"""
+    from sklearn.cluster import KMeans
+    from sklearn.preprocessing import StandardScaler
+
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+    kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+    labels = kmeans.fit_predict(X_scaled)
+
+    model = ClusterModel(
+        cluster_id=cluster_id,
+        mean=scaler.mean_,
+        scale=scaler.scale_,
+        centroids=kmeans.cluster_centers_,
+        n_samples=len(X)
+    )
+    return model, labels
+
+
+def _attach_shared(name):
+    from multiprocessing import shared_memory
+    try:
+        # The parent owns the segment; workers must not unlink it on exit
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        return shared_memory.SharedMemory(name=name)
+
+
+def _fit_shared_rows(shm_name, shape, start, stop, cluster_id, n_clusters):
+    """Process pool worker: fit one cluster from its row range of the shared matrix"""
+    from threadpoolctl import threadpool_limits
+
+    shm = _attach_shared(shm_name)
+    try:
+        matrix = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        X = matrix[start:stop].copy()
+        del matrix  # Release the buffer before close()
+    finally:
+        shm.close()
+
+    # One BLAS/OpenMP thread per worker, the pool already uses every core
+    with threadpool_limits(1):
+        model, labels = fit_cluster_model(cluster_id, X, n_clusters)
+    return model.to_dict(), labels.astype(np.int32)
+
+
+def fit_clusters_parallel(X, spans, n_clusters, workers):
+    """
+    Fit many clusters whose rows are stacked in one float64 matrix X
+    spans: [(cluster_id, start, stop)] row ranges of X
+
+    X is copied once into shared memory and workers read their rows from
+    it, so only names and offsets are pickled per task. Yields
+    (cluster_id, model, labels, error) as fits complete.
+    """
+    if workers <= 1 or len(spans) <= 1:
+        for cluster_id, start, stop in spans:
+            try:
+                model, labels = fit_cluster_model(cluster_id, X[start:stop], n_clusters)
+                yield cluster_id, model, labels, None
+            except Exception as e:
+                yield cluster_id, None, None, e
+        return
+
+    import multiprocessing
+    from multiprocessing import shared_memory
+
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    shm = shared_memory.SharedMemory(create=True, size=max(X.nbytes, 1))
+    try:
+        np.ndarray(X.shape, dtype=np.float64, buffer=shm.buf)[:] = X
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(spans)),
+            mp_context=multiprocessing.get_context(BATCH_START_METHOD)
+        ) as pool:
+            futures = {
+                pool.submit(_fit_shared_rows, shm.name, X.shape, start, stop, cluster_id, n_clusters): cluster_id
+                for cluster_id, start, stop in spans
+            }
+            for future in as_completed(futures):
+                cluster_id = futures[future]
+                try:
+                    model_dict, labels = future.result()
+                    yield cluster_id, ClusterModel(**model_dict), labels, None
+                except Exception as e:
+                    yield cluster_id, None, None, e
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+class ClusterModelStore:
+    """Per-cluster models cached in memory and persisted as JSON on local disk"""
+
+    def __init__(self, model_dir=MODEL_DIR):
+        self.model_dir = Path(model_dir)
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _path(self, cluster_id):
+        safe_id = re.sub(r'[^A-Za-z0-9_.-]', '_', str(cluster_id))
+        return self.model_dir / f'cluster_{safe_id}.json'
+
+    def get(self, cluster_id):
+        """Return the stored model for a cluster, or None"""
+        with self._lock:
+            model = self._models.get(cluster_id)
+        if model is not None:
+            return model
+
+        path = self._path(cluster_id)
+        if not path.exists():
+            return None
+        try:
+            model = ClusterModel(**json.loads(path.read_text()))
+        except Exception as e:
+            print(f"Error loading cluster model {path}: {e}")
+            return None
+
+        with self._lock:
+            self._models[cluster_id] = model
+        return model
+
+    def save(self, model):
+        """Persist atomically so concurrent readers never see a partial file"""
+        self.model_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(model.cluster_id)
+        tmp_path = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        tmp_path.write_text(json.dumps(model.to_dict()))
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._models[model.cluster_id] = model
+
+    def fit(self, cluster_id, X, n_clusters):
+        """Fit scaler + K-Means on X, persist the model and return (model, labels)"""
+        model, labels = fit_cluster_model(cluster_id, X, n_clusters)
+        self.save(model)
+        return model, labels
@@ -0,0 +1,230 @@
+import os
+import time
+import random
+import asyncio
+import threading
+import contextvars
+
+# Seconds; per-call values override these via execute(timeout=...)
+DEFAULT_TIMEOUT = float(os.getenv('SUPABASE_TIMEOUT', 10))
+CONNECT_TIMEOUT = float(os.getenv('SUPABASE_CONNECT_TIMEOUT', 5))
+MAX_CONNECTIONS = int(os.getenv('SUPABASE_MAX_CONNECTIONS', 20))
+KEEPALIVE_SECONDS = float(os.getenv('SUPABASE_KEEPALIVE_SECONDS', 120))
+MAX_RETRIES = int(os.getenv('SUPABASE_RETRIES', 2))
+RETRY_BACKOFF = float(os.getenv('SUPABASE_RETRY_BACKOFF', 0.2))
+
+# Timeout for the request currently being executed on this thread / task
+_call_timeout = contextvars.ContextVar('supabase_call_timeout', default=None)
+
+_transient_errors = None
+
+
+def _retryable_errors():
+    """(errors safe for any request, errors safe only for idempotent ones)"""
+    global _transient_errors
+    if _transient_errors is None:
+        try:
+            import httpx
+        except ImportError:
+            return (), ()
+        _transient_errors = (
+            # Raised before the request reached the server
+            (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout),
+            # The server may have applied the request
+            (httpx.TransportError,)
+        )
+    return _transient_errors
+
+
+def _retryable(error, idempotent):
+    always, idempotent_only = _retryable_errors()
+    return isinstance(error, always) or (idempotent and isinstance(error, idempotent_only))
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def create_pooled_client(url, key):
+    """
+    Supabase client on one shared, thread-safe httpx connection pool
+
+    Connections are kept alive between requests so short queries skip the
+    TCP/TLS handshake, and the pool bounds concurrent connections per process.
+    """
+    import httpx
+    from supabase import create_client, ClientOptions
+
+    class _TimeoutTransport(httpx.HTTPTransport):
+        """Applies the per-call timeout set by PooledQuery.execute"""
+
+        def handle_request(self, request):
+            timeout = _call_timeout.get()
+            if timeout is not None:
+                request.extensions['timeout'] = httpx.Timeout(timeout, connect=min(timeout, CONNECT_TIMEOUT)).as_dict()
+            return super().handle_request(request)
+
+    http_client = httpx.Client(
+        transport=_TimeoutTransport(
+            http2=_http2_available(),
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_SECONDS
+            )
+        ),
+        timeout=httpx.Timeout(DEFAULT_TIMEOUT, connect=CONNECT_TIMEOUT),
+        follow_redirects=True
+    )
+    try:
+        options = ClientOptions(httpx_client=http_client, postgrest_client_timeout=DEFAULT_TIMEOUT)
+    except TypeError:
+        # Older supabase-py without httpx_client: its own pooled session, our timeout
+        http_client.close()
+        options = ClientOptions(postgrest_client_timeout=DEFAULT_TIMEOUT)
+
+    client = create_client(url, key, options=options)
+    # Build the PostgREST session now; creating it lazily from several
+    # threads at once can leave each with its own connection pool
+    client.postgrest
+    return client
+
+
+class PooledQuery:
+    """
+    Wraps a postgrest query builder so execute() gets a timeout and retries
+
+    Transient transport errors are retried with full-jitter exponential
+    backoff. Inserts are only retried when the request never reached the
+    server, so a retry cannot write a row twice.
+    """
+
+    def __init__(self, builder, pool, idempotent=True):
+        self._builder = builder
+        self._pool = pool
+        self._idempotent = idempotent
+
+    def _wrap(self, result, attr):
+        if hasattr(result, 'execute'):
+            return PooledQuery(result, self._pool, self._idempotent and attr != 'insert')
+        return result
+
+    def __getattr__(self, attr):
+        value = getattr(self._builder, attr)
+        if not callable(value):
+            return self._wrap(value, attr)  # e.g. the `not_` property
+
+        def chain(*args, **kwargs):
+            return self._wrap(value(*args, **kwargs), attr)
+        return chain
+
+    def execute(self, timeout=None, retries=None):
+        return self._pool.run(self._builder.execute, self._idempotent, timeout, retries)
+
+
+class PooledClient:
+    """Thread-safe facade over a Supabase client used by every query in the service"""
+
+    def __init__(self, client, timeout=DEFAULT_TIMEOUT, retries=MAX_RETRIES, backoff=RETRY_BACKOFF):
+        self.raw = client
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0}
+
+    def table(self, name):
+        return PooledQuery(self.raw.table(name), self)
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def run(self, execute, idempotent=True, timeout=None, retries=None):
+        retries = self.retries if retries is None else retries
+        token = _call_timeout.set(timeout or self.timeout)
+        try:
+            attempt = 0
+            while True:
+                self._count('requests')
+                try:
+                    return execute()
+                except Exception as e:
+                    if not _retryable(e, idempotent) or attempt >= retries:
+                        self._count('failures')
+                        raise
+                    self._count('retries')
+                    time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+                    attempt += 1
+        finally:
+            _call_timeout.reset(token)
+
+    def __getattr__(self, attr):
+        # auth, storage, rpc, ... pass straight through
+        return getattr(self.raw, attr)
+
+
+async def create_async_pooled_client(url, key):
+    """Async Supabase client on one keep-alive httpx pool, for the ASGI serving mode"""
+    import httpx
+    from supabase import acreate_client, AsyncClientOptions
+
+    http_client = httpx.AsyncClient(
+        http2=_http2_available(),
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_SECONDS
+        ),
+        timeout=httpx.Timeout(DEFAULT_TIMEOUT, connect=CONNECT_TIMEOUT),
+        follow_redirects=True
+    )
+    try:
+        options = AsyncClientOptions(httpx_client=http_client, postgrest_client_timeout=DEFAULT_TIMEOUT)
+    except TypeError:
+        await http_client.aclose()
+        options = AsyncClientOptions(postgrest_client_timeout=DEFAULT_TIMEOUT)
+    return await acreate_client(url, key, options=options)
+
+
+class AsyncPooledQuery(PooledQuery):
+    """PooledQuery for async query builders: execute() is awaited"""
+
+    def _wrap(self, result, attr):
+        if hasattr(result, 'execute'):
+            return AsyncPooledQuery(result, self._pool, self._idempotent and attr != 'insert')
+        return result
+
+    async def execute(self, timeout=None, retries=None):
+        return await self._pool.run(self._builder.execute, self._idempotent, timeout, retries)
+
+
+class AsyncPooledClient(PooledClient):
+    """
+    PooledClient for the async Supabase client: the same timeout, retry and
+    backoff policy, with the timeout enforced by asyncio.wait_for. A timed
+    out request may have reached the server, so only idempotent ones retry.
+    """
+
+    def table(self, name):
+        return AsyncPooledQuery(self.raw.table(name), self)
+
+    async def run(self, execute, idempotent=True, timeout=None, retries=None):
+        retries = self.retries if retries is None else retries
+        attempt = 0
+        while True:
+            self._count('requests')
+            try:
+                return await asyncio.wait_for(execute(), timeout or self.timeout)
+            except Exception as e:
+                timed_out = isinstance(e, asyncio.TimeoutError) and idempotent
+                if not (timed_out or _retryable(e, idempotent)) or attempt >= retries:
+                    self._count('failures')
+                    raise
+                self._count('retries')
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+                attempt += 1
@@ -1,27 +1,116 @@
+import os
 import re
-from typing import List, Dict
-from supabase_client import db
-from ml_engine import analyzer
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Iterable, Tuple
+from supabase_client import db, reference_data
+from keyword_matcher import KeywordMatcher
+from semantic_matcher import SemanticMatcher, EmbeddingCache, SEMANTIC_VERSION
+from lazy import LazyInstance
+from single_flight import SingleFlight
+from issue_stats import IssueCounter
+
+SUMMARY_SIZE = 5  # Latest issues kept in issue_summary
+CLUSTER_WINDOW_MAX_DAYS = 31  # Per-day issue buckets kept per cluster
+CLUSTER_WINDOW_MAX_CLUSTERS = int(os.getenv('CLUSTER_WINDOW_MAX_CLUSTERS', 256))  # Least recently used evicted
+# Feedback re-read before each teacher's cursor, for rows committed out of timestamp order
+FEEDBACK_OVERLAP_SECONDS = float(os.getenv('FEEDBACK_OVERLAP_SECONDS', 300))
+# 'keyword': exact keyword substrings, 'semantic': nearest labelled exemplars,
+# 'hybrid': both, keeping the higher confidence per competency
+MATCH_MODE = os.getenv('FEEDBACK_MATCH_MODE', 'keyword')
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+def _shift(timestamp: str, seconds: float) -> str:
+    """ISO timestamp moved by some seconds, keeping the input's timezone"""
+    return (_parse_time(timestamp) + timedelta(seconds=seconds)).isoformat()
 
 class FeedbackAnalyzer:
-    """Analyzes teacher feedback to identify competency gaps"""
+    """
+    Analyzes teacher feedback to identify competency gaps
     
-    def __init__(self):
-        # Load issue-to-competency mappings from database
-        self.mappings = self._load_mappings()
+    Per-teacher results are kept as running aggregates in the
+    teacher_feedback_aggregates table (migrations/001) so each feedback row
+    is matched once. The read cursor is the newest folded created_at plus
+    the (created_at, id) pairs folded within FEEDBACK_OVERLAP_SECONDS of
+    it: each analysis re-reads that overlap and skips ids already folded,
+    so rows sharing the cursor timestamp or committed slightly late are
+    still counted exactly once.
+    """
     
-    def _load_mappings(self) -> List[Dict]:
-        """Load issue keyword mappings from database"""
-        try:
-            response = db.client.table('issue_competency_mapping').select('*').execute()
-            return response.data
-        except Exception as e:
-            print(f"Error loading mappings: {e}")
-            return []
+    def __init__(self, match_mode=None):
+        self.match_mode = match_mode or MATCH_MODE
+        # Encoded feedback descriptions survive mapping reloads
+        self._embeddings = EmbeddingCache()
+        # Issue-to-competency mappings come from the shared reference cache
+        self._mapping_state = None
+        self._sync_mappings()
+        # Overlapping requests for the same teacher share one analysis
+        self._inflight = SingleFlight('analysis')
+        # cluster_id -> per-day issue buckets for windowed cluster analysis (LRU);
+        # the global lock only guards the dict, each state has its own lock
+        self._cluster_windows = OrderedDict()
+        self._cluster_windows_lock = threading.Lock()
+    
+    def _sync_mappings(self):
+        """Rebuild the matcher whenever the reference cache swapped in new mappings"""
+        mappings = reference_data.get_mappings()
+        state = self._mapping_state
+        if state is not None and state[0] is mappings:
+            return state
+        
+        version = self._mapping_version(mappings)
+        semantic = None
+        if self.match_mode != 'keyword':
+            semantic = SemanticMatcher(mappings, cache=self._embeddings)
+            # Aggregates folded under another mode are rebuilt
+            version = hashlib.sha1(f'{version}:{self.match_mode}:{SEMANTIC_VERSION}'.encode('utf-8')).hexdigest()
+        
+        state = (mappings, KeywordMatcher(mappings), version, semantic)
+        self._mapping_state = state
+        return state
+    
+    def reload_mappings(self):
+        """
+        Reload mappings now. Aggregates built with an older mapping
+        version are rebuilt lazily on their next analysis.
+        """
+        reference_data.refresh()
+        self._sync_mappings()
     
-    def analyze_teacher_feedback(self, teacher_id: str) -> Dict:
+    @property
+    def mappings(self) -> List[Dict]:
+        return self._sync_mappings()[0]
+    
+    @property
+    def matcher(self) -> KeywordMatcher:
+        return self._sync_mappings()[1]
+    
+    @property
+    def mapping_version(self) -> str:
+        return self._sync_mappings()[2]
+    
+    @property
+    def semantic_matcher(self) -> SemanticMatcher:
+        return self._sync_mappings()[3]
+    
+    @staticmethod
+    def _mapping_version(mappings: List[Dict]) -> str:
+        """Fingerprint of the mapping table contents"""
+        rows = sorted(
+            (m['issue_keyword'].lower(), m['competency_area'], float(m['confidence_score']))
+            for m in mappings
+        )
+        return hashlib.sha1(json.dumps(rows, ensure_ascii=False).encode('utf-8')).hexdigest()
+    
+    def analyze_teacher_feedback(self, teacher_id: str, rebuild: bool = False) -> Dict:
         """
         Analyze all feedback from a teacher to identify competency gaps
+        Only feedback added since the teacher's stored aggregate is matched
         
         Returns:
             {
@@ -31,53 +120,199 @@ class FeedbackAnalyzer:
                 'priority': str,
                 'issue_summary': List[Dict]
             }
+        Concurrent calls for the same teacher share one in-flight analysis
         """
-        # Fetch all feedback from this teacher
+        return self._inflight.do((teacher_id, rebuild), self._analyze_teacher_feedback, teacher_id, rebuild)
+    
+    def _analyze_teacher_feedback(self, teacher_id, rebuild):
+        stored = None if rebuild else db.get_feedback_aggregate(teacher_id)
+        aggregate = self.resume_aggregate(teacher_id, stored)
+        if aggregate is stored:
+            self._refresh_summary_statuses(aggregate)
+        
+        # Stream only feedback from the aggregate's cursor (minus the overlap) on
         try:
-            response = db.client.table('feedback')\
-                .select('*')\
-                .eq('teacher_id', teacher_id)\
-                .order('created_at', desc=True)\
-                .execute()
-            
-            feedback_items = response.data
+            folded = self._fold_feedback(aggregate, db.iter_teacher_feedback(teacher_id, since=self.read_from(aggregate)))
         except Exception as e:
             print(f"Error fetching feedback: {e}")
             return {'error': str(e)}
         
-        if not feedback_items:
-            return {
-                'teacher_id': teacher_id,
-                'total_issues': 0,
-                'inferred_gaps': [],
-                'priority': 'low',
-                'issue_summary': []
-            }
+        if folded:
+            db.save_feedback_aggregate(aggregate)
+        
+        return self._aggregate_result(aggregate)
+    
+    def resume_aggregate(self, teacher_id: str, stored: Dict = None) -> Dict:
+        """The stored aggregate, or a fresh one if missing or built with other mappings"""
+        if stored and stored.get('mapping_version') == self.mapping_version:
+            return stored
+        return self._empty_aggregate(teacher_id)  # Mapping table changed, rebuild from full history
+    
+    @staticmethod
+    def read_from(aggregate: Dict):
+        """created_at to re-read feedback from: the cursor minus the overlap window"""
+        if not aggregate.get('last_created_at'):
+            return None
+        return _shift(aggregate['last_created_at'], -FEEDBACK_OVERLAP_SECONDS)
+    
+    def rebuild_teacher_aggregate(self, teacher_id: str) -> Dict:
+        """Recompute a teacher's aggregate from their full feedback history"""
+        return self.analyze_teacher_feedback(teacher_id, rebuild=True)
+    
+    def analyze_teachers_feedback_bulk(self, teacher_ids: List[str]) -> Dict[str, Dict]:
+        """
+        analyze_teacher_feedback for many teachers with chunked bulk reads
+        Stored aggregates are resumed, only feedback after each cursor is
+        matched, and the aggregates that changed are saved back in bulk
+        
+        Returns: {teacher_id: analyze_teacher_feedback-shaped result}
+        """
+        teacher_ids = list(dict.fromkeys(teacher_ids))
+        stored = db.get_feedback_aggregates(teacher_ids)
+        aggregates = {
+            teacher_id: self.resume_aggregate(teacher_id, stored.get(teacher_id))
+            for teacher_id in teacher_ids
+        }
+        
+        resumed = [aggregate for teacher_id, aggregate in aggregates.items() if aggregate is stored.get(teacher_id)]
+        if resumed:
+            statuses = db.get_feedback_statuses([
+                feedback_id for aggregate in resumed for feedback_id in self.summary_feedback_ids(aggregate)
+            ])
+            for aggregate in resumed:
+                self.apply_summary_statuses(aggregate, statuses)
         
-        # Analyze issues to infer competency gaps
-        gap_scores = {
-            'classroom_management': 0,
-            'content_knowledge': 0,
-            'pedagogy': 0,
-            'technology_usage': 0,
-            'student_engagement': 0
+        # Aggregates without a cursor read the full history; the rest read from
+        # the oldest cursor in one pass, then drop rows before their own cursor
+        cursors = {
+            teacher_id: self.read_from(aggregate)
+            for teacher_id, aggregate in aggregates.items() if aggregate['last_created_at']
         }
+        fresh = [teacher_id for teacher_id in teacher_ids if teacher_id not in cursors]
+        try:
+            feedback_by_teacher = db.get_feedback_for_teachers(fresh) if fresh else {}
+            if cursors:
+                since = min(cursors.values(), key=_parse_time)
+                for teacher_id, rows in db.get_feedback_for_teachers(list(cursors), since=since).items():
+                    read_from = _parse_time(cursors[teacher_id])
+                    feedback_by_teacher[teacher_id] = [row for row in rows if _parse_time(row['created_at']) > read_from]
+        except Exception as e:
+            print(f"Error fetching bulk feedback: {e}")
+            return {teacher_id: {'error': str(e)} for teacher_id in teacher_ids}
         
-        issue_summary = []
+        changed = [
+            aggregate for teacher_id, aggregate in aggregates.items()
+            if self._fold_feedback(aggregate, feedback_by_teacher.get(teacher_id, []))
+        ]
+        if changed:
+            db.save_feedback_aggregates(changed)
+        
+        return {teacher_id: self._aggregate_result(aggregate) for teacher_id, aggregate in aggregates.items()}
+    
+    def continue_aggregate(self, aggregate: Dict, feedback_items: Iterable[Dict]) -> Tuple[int, Dict]:
+        """
+        Fold rows read elsewhere (the async client) from read_from(aggregate)
+        into a resumed aggregate; returns (rows folded, analysis result)
+        """
+        folded = self._fold_feedback(aggregate, feedback_items)
+        return folded, self._aggregate_result(aggregate)
+    
+    def _empty_aggregate(self, teacher_id: str) -> Dict:
+        """Aggregate for a teacher with no folded feedback yet"""
+        return {
+            'teacher_id': teacher_id,
+            'gap_scores': {
+                'classroom_management': 0,
+                'content_knowledge': 0,
+                'pedagogy': 0,
+                'technology_usage': 0,
+                'student_engagement': 0
+            },
+            'total_issues': 0,
+            'issue_summary': [],
+            'last_created_at': None,
+            'recent_feedback': [],
+            'mapping_version': self.mapping_version
+        }
+    
+    def _fold_feedback(self, aggregate: Dict, feedback_items: Iterable[Dict]) -> int:
+        """
+        Match new feedback rows (newest first) once and fold them into an
+        aggregate, skipping ids the aggregate already covers. Works on any
+        iterable, so pages can be streamed in. Returns the number of rows folded.
+        """
+        gap_scores = aggregate['gap_scores']
+        recent = [tuple(entry) for entry in aggregate.get('recent_feedback') or []]
+        seen = {feedback_id for _, feedback_id in recent}
+        new_summary = []
+        folded = []
         
         for item in feedback_items:
+            feedback_id = item.get('id')
+            if feedback_id is not None:
+                if feedback_id in seen:
+                    continue  # Re-read from the overlap window
+                seen.add(feedback_id)
+            folded.append((item['created_at'], feedback_id))
             issue_text = item['description'].lower()
-            matched_gaps = self._match_issue_to_gaps(issue_text)
+            matched_gaps = self._match_issue_to_gaps(issue_text, feedback_id=feedback_id)
             
             for gap, confidence in matched_gaps.items():
                 gap_scores[gap] += confidence
             
-            issue_summary.append({
-                'issue': item['description'],
-                'status': item['status'],
-                'matched_competencies': list(matched_gaps.keys()),
-                'created_at': item['created_at']
-            })
+            if len(new_summary) < SUMMARY_SIZE:
+                new_summary.append({
+                    'feedback_id': feedback_id,
+                    'issue': item['description'],
+                    'status': item['status'],
+                    'matched_competencies': list(matched_gaps.keys()),
+                    'created_at': item['created_at']
+                })
+        
+        count = len(folded)
+        aggregate['total_issues'] += count
+        aggregate['issue_summary'] = (new_summary + aggregate['issue_summary'])[:SUMMARY_SIZE]
+        if count:
+            cursor = max((created_at for created_at, _ in folded), key=_parse_time)
+            if aggregate['last_created_at'] and _parse_time(aggregate['last_created_at']) > _parse_time(cursor):
+                cursor = aggregate['last_created_at']  # Only late rows arrived
+            window_start = _shift(cursor, -FEEDBACK_OVERLAP_SECONDS)
+            aggregate['last_created_at'] = cursor
+            aggregate['recent_feedback'] = [
+                [created_at, feedback_id] for created_at, feedback_id in recent + folded
+                if feedback_id is not None and _parse_time(created_at) >= _parse_time(window_start)
+            ]
+        return count
+    
+    def _refresh_summary_statuses(self, aggregate: Dict):
+        """Statuses change after assignment, so re-read them for the stored summary"""
+        ids = self.summary_feedback_ids(aggregate)
+        if ids:
+            self.apply_summary_statuses(aggregate, db.get_feedback_statuses(ids))
+    
+    @staticmethod
+    def summary_feedback_ids(aggregate: Dict) -> List[str]:
+        return [entry['feedback_id'] for entry in aggregate['issue_summary'] if entry.get('feedback_id')]
+    
+    @staticmethod
+    def apply_summary_statuses(aggregate: Dict, statuses: Dict[str, str]):
+        for entry in aggregate['issue_summary']:
+            entry['status'] = statuses.get(entry.get('feedback_id'), entry['status'])
+    
+    def _aggregate_result(self, aggregate: Dict) -> Dict:
+        """Turn a running aggregate into the analyze_teacher_feedback response"""
+        total_issues = aggregate['total_issues']
+        
+        if not total_issues:
+            return {
+                'teacher_id': aggregate['teacher_id'],
+                'total_issues': 0,
+                'inferred_gaps': [],
+                'priority': 'low',
+                'issue_summary': []
+            }
+        
+        gap_scores = aggregate['gap_scores']
         
         # Identify top gaps (scores above threshold)
         threshold = 1.0  # At least one strong match
@@ -87,93 +322,160 @@ class FeedbackAnalyzer:
         ]
         
         # Determine priority based on number of issues
-        if len(feedback_items) >= 5:
+        if total_issues >= 5:
             priority = 'high'
-        elif len(feedback_items) >= 3:
+        elif total_issues >= 3:
             priority = 'medium'
         else:
             priority = 'low'
         
         return {
-            'teacher_id': teacher_id,
-            'total_issues': len(feedback_items),
+            'teacher_id': aggregate['teacher_id'],
+            'total_issues': total_issues,
             'inferred_gaps': inferred_gaps,
-            'gap_scores': gap_scores,
+            'gap_scores': dict(gap_scores),
             'priority': priority,
-            'issue_summary': issue_summary[:5]  # Latest 5 issues
+            'issue_summary': [
+                {key: value for key, value in entry.items() if key != 'feedback_id'}
+                for entry in aggregate['issue_summary']
+            ]  # Latest 5 issues
         }
     
-    def analyze_cluster_feedback(self, cluster_id: str) -> Dict:
+    def analyze_cluster_feedback(self, cluster_id: str, days: int = None, top_k: int = 10) -> Dict:
         """
-        Analyze all feedback from a cluster to identify common issues
+        Analyze feedback from a cluster to identify common issues
+        
+        Issues are grouped by normalized text (case, punctuation, spacing)
+        and counted in bounded memory. With days=N only the last N days
+        count; those windows are kept as per-day buckets so repeat calls
+        only read feedback added since the previous one.
         """
+        if days:
+            return self._cluster_window(cluster_id, min(int(days), CLUSTER_WINDOW_MAX_DAYS), top_k)
+        
+        # Aggregate issues page by page instead of loading the whole cluster
+        counter = IssueCounter(k=top_k)
+        teacher_ids = set()
+        
         try:
-            response = db.client.table('feedback')\
-                .select('*')\
-                .eq('cluster', cluster_id)\
-                .execute()
-            
-            feedback_items = response.data
+            for item in db.iter_cluster_feedback(cluster_id, columns='teacher_id,description'):
+                counter.add(item['description'])
+                teacher_ids.add(item['teacher_id'])
         except Exception as e:
             return {'error': str(e)}
         
-        if not feedback_items:
-            return {
-                'cluster_id': cluster_id,
-                'total_issues': 0,
-                'common_issues': [],
-                'affected_teachers': 0
-            }
-        
-        # Aggregate issues
-        issue_counts = {}
-        teacher_ids = set()
-        
-        for item in feedback_items:
-            issue = item['description']
-            issue_counts[issue] = issue_counts.get(issue, 0) + 1
-            teacher_ids.add(item['teacher_id'])
+        return self._cluster_result(cluster_id, counter, teacher_ids, top_k)
+    
+    def _window_state(self, cluster_id: str) -> Dict:
+        """A cluster's window state, created on first use; evicts the least recently used"""
+        with self._cluster_windows_lock:
+            state = self._cluster_windows.get(cluster_id)
+            if state is None:
+                state = self._cluster_windows[cluster_id] = {
+                    'lock': threading.Lock(), 'covered_since': None, 'last_created_at': None, 'recent': {}, 'days': {}
+                }
+            self._cluster_windows.move_to_end(cluster_id)
+            while len(self._cluster_windows) > CLUSTER_WINDOW_MAX_CLUSTERS:
+                self._cluster_windows.popitem(last=False)
+            return state
+    
+    def _cluster_window(self, cluster_id: str, days: int, top_k: int) -> Dict:
+        """Top issues over the last `days` days from cached per-day buckets"""
+        today = datetime.now(timezone.utc).date()
+        window_start = (today - timedelta(days=days - 1)).isoformat()
+        oldest_kept = (today - timedelta(days=CLUSTER_WINDOW_MAX_DAYS - 1)).isoformat()
         
-        # Sort by frequency
-        common_issues = sorted(
-            issue_counts.items(), 
-            key=lambda x: x[1], 
-            reverse=True
-        )[:10]
+        state = self._window_state(cluster_id)
+        # Only requests for the same cluster wait for this read
+        with state['lock']:
+            if state['covered_since'] is None or state['covered_since'] > window_start:
+                state.update(covered_since=window_start, last_created_at=None, recent={}, days={})
+            
+            # Like teacher aggregates: re-read an overlap before the cursor, skip ids already counted
+            fresh = {}
+            recent = dict(state['recent'])
+            newest = state['last_created_at']
+            try:
+                rows = db.iter_cluster_feedback(
+                    cluster_id,
+                    columns='id,teacher_id,description,created_at',
+                    since=self.read_from(state) or window_start
+                )
+                for item in rows:  # newest first
+                    if item['id'] in recent:
+                        continue
+                    recent[item['id']] = item['created_at']
+                    if newest is None or _parse_time(item['created_at']) > _parse_time(newest):
+                        newest = item['created_at']
+                    day = item['created_at'][:10]
+                    bucket = fresh.get(day)
+                    if bucket is None:
+                        bucket = fresh[day] = (IssueCounter(k=max(top_k, 100)), set())
+                    bucket[0].add(item['description'])
+                    bucket[1].add(item['teacher_id'])
+            except Exception as e:
+                return {'error': str(e)}
+            
+            # Applied only after a complete read, so a failed page is read again next time
+            for day, (day_counter, day_teachers) in fresh.items():
+                bucket = state['days'].get(day)
+                if bucket is None:
+                    state['days'][day] = (day_counter, day_teachers)
+                else:
+                    bucket[0].merge(day_counter)
+                    bucket[1].update(day_teachers)
+            if newest is not None:
+                overlap_start = _parse_time(_shift(newest, -FEEDBACK_OVERLAP_SECONDS))
+                state['recent'] = {
+                    feedback_id: created_at for feedback_id, created_at in recent.items()
+                    if _parse_time(created_at) >= overlap_start
+                }
+                state['last_created_at'] = newest
+            
+            state['days'] = {day: bucket for day, bucket in state['days'].items() if day >= oldest_kept}
+            state['covered_since'] = max(state['covered_since'], oldest_kept)
+            
+            counter = IssueCounter(k=top_k)
+            teacher_ids = set()
+            for day, (day_counter, day_teachers) in state['days'].items():
+                if day >= window_start:
+                    counter.merge(day_counter)
+                    teacher_ids |= day_teachers
         
+        result = self._cluster_result(cluster_id, counter, teacher_ids, top_k)
+        result['window_days'] = days
+        result['since'] = window_start
+        return result
+    
+    @staticmethod
+    def _cluster_result(cluster_id: str, counter: IssueCounter, teacher_ids: set, top_k: int) -> Dict:
         return {
             'cluster_id': cluster_id,
-            'total_issues': len(feedback_items),
+            'total_issues': counter.total,
             'affected_teachers': len(teacher_ids),
+            'approximate': counter.approximate,
             'common_issues': [
-                {'description': issue, 'frequency': count} 
-                for issue, count in common_issues
+                {'description': sample, 'issue_key': key, 'frequency': count}
+                for key, count, sample in counter.top(top_k)
             ]
         }
     
-    def _match_issue_to_gaps(self, issue_text: str) -> Dict[str, float]:
+    def _match_issue_to_gaps(self, issue_text: str, feedback_id: str = None) -> Dict[str, float]:
         """
-        Match issue text to competency gaps using keyword mappings
+        Match issue text to competency gaps using keyword mappings and/or
+        the semantic exemplar index, depending on match_mode
         
         Returns: {'competency_area': confidence_score}
         """
-        matched_gaps = {}
-        
-        for mapping in self.mappings:
-            keyword = mapping['issue_keyword'].lower()
-            
-            # Check if keyword appears in issue text
-            if keyword in issue_text:
-                competency = mapping['competency_area']
-                confidence = float(mapping['confidence_score'])
-                
-                # If multiple keywords match same competency, take max confidence
-                if competency in matched_gaps:
-                    matched_gaps[competency] = max(matched_gaps[competency], confidence)
-                else:
-                    matched_gaps[competency] = confidence
+        if self.match_mode == 'keyword':
+            return self.matcher.match(issue_text)
         
-        return matched_gaps
+        matched = self.semantic_matcher.match(issue_text, key=feedback_id)
+        if self.match_mode == 'hybrid':
+            for competency, confidence in self.matcher.match(issue_text).items():
+                if confidence > matched.get(competency, 0):
+                    matched[competency] = confidence
+        return matched
     
     def create_assessment_from_feedback(self, teacher_id: str) -> Dict:
         """
@@ -206,4 +508,4 @@ class FeedbackAnalyzer:
         return assessment_scores
 
 # Initialize analyzer
-feedback_analyzer = FeedbackAnalyzer()
+feedback_analyzer = LazyInstance(FeedbackAnalyzer, 'feedback_analyzer')
@@ -0,0 +1,116 @@
+import re
+import heapq
+import hashlib
+import unicodedata
+from array import array
+
+_SPACE = re.compile(r'\s+')
+
+
+def normalize_issue(text):
+    """
+    Grouping key for an issue description: case-folded, NFKC-normalised,
+    punctuation and symbols dropped, whitespace collapsed. Devanagari vowel
+    signs are marks, not punctuation, so Hindi text keeps its words intact.
+    """
+    text = unicodedata.normalize('NFKC', text or '').casefold()
+    text = ''.join(' ' if unicodedata.category(ch)[0] in 'PS' else ch for ch in text)
+    return _SPACE.sub(' ', text).strip()
+
+
+class IssueCounter:
+    """
+    Bounded-memory issue frequency counter
+
+    Counts exactly in a dict until more than max_exact_keys distinct issues
+    are seen, then folds everything into a count-min sketch and keeps only
+    the current top-k candidates. Sketch counts never under-estimate and
+    over-estimate by at most ~2N/width with high probability.
+    """
+
+    def __init__(self, k=10, max_exact_keys=50000, width=2 ** 14, depth=4):
+        self.k = k
+        self.max_exact_keys = max_exact_keys
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self._exact = {}        # key -> [count, sample text]
+        self._sketch = None     # depth rows of width counters
+        self._candidates = {}   # key -> [estimate, sample text], at most k entries
+
+    @property
+    def approximate(self):
+        return self._sketch is not None
+
+    def add(self, text, count=1, key=None):
+        key = key if key is not None else normalize_issue(text)
+        if not key:
+            return
+        self.total += count
+
+        if self._sketch is None:
+            entry = self._exact.get(key)
+            if entry is None:
+                self._exact[key] = [count, text]
+                if len(self._exact) > self.max_exact_keys:
+                    self._to_sketch()
+            else:
+                entry[0] += count
+            return
+
+        self._offer(key, self._sketch_add(key, count), text)
+
+    def _to_sketch(self):
+        self._sketch = [array('q', bytes(8 * self.width)) for _ in range(self.depth)]
+        exact, self._exact = self._exact, {}
+        for key, (count, text) in exact.items():
+            self._offer(key, self._sketch_add(key, count), text)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=4 * self.depth).digest()
+        return [int.from_bytes(digest[4 * i:4 * i + 4], 'little') % self.width for i in range(self.depth)]
+
+    def _sketch_add(self, key, count):
+        estimate = None
+        for row, position in zip(self._sketch, self._positions(key)):
+            row[position] += count
+            estimate = row[position] if estimate is None else min(estimate, row[position])
+        return estimate
+
+    def _offer(self, key, estimate, text):
+        """Keep key among the k candidates if its estimate beats the smallest"""
+        entry = self._candidates.get(key)
+        if entry is not None:
+            entry[0] = estimate
+            return
+        if len(self._candidates) < self.k:
+            self._candidates[key] = [estimate, text]
+            return
+        smallest = min(self._candidates, key=lambda candidate: self._candidates[candidate][0])
+        if estimate > self._candidates[smallest][0]:
+            del self._candidates[smallest]
+            self._candidates[key] = [estimate, text]
+
+    def merge(self, other):
+        """Add another counter's counts into this one (e.g. per-day buckets)"""
+        if other._sketch is None:
+            for key, (count, text) in other._exact.items():
+                self.add(text, count, key=key)
+            return
+        if self._sketch is None:
+            self._to_sketch()
+        for row, other_row in zip(self._sketch, other._sketch):
+            for position, value in enumerate(other_row):
+                if value:
+                    row[position] += value
+        self.total += other.total
+        for key, (_, text) in list(self._candidates.items()) + list(other._candidates.items()):
+            estimate = min(row[position] for row, position in zip(self._sketch, self._positions(key)))
+            self._offer(key, estimate, text)
+
+    def top(self, k=None):
+        """[(key, count, sample text)] most frequent first, using a bounded heap"""
+        k = k or self.k
+        source = self._exact if self._sketch is None else self._candidates
+        best = heapq.nlargest(k, source.items(), key=lambda item: (item[1][0], item[0]))
+        return [(key, count, text) for key, (count, text) in best]
@@ -0,0 +1,37 @@
+"""
+Background job kinds, registered with the job queue on import
+
+Both serving modes import this module before starting the queue's
+workers, so a worker can run any job it claims.
+"""
+from job_queue import job_handler, PermanentJobError
+from ml_engine import analyzer
+from module_templates import precompute_templates
+from training_assignment import assign_training
+
+
+@job_handler('feedback_to_training')
+def training_job(payload, last_attempt):
+    """Queued /api/feedback-to-training work; the last attempt may use the fallback message"""
+    body, status = assign_training(
+        payload['teacher_id'], payload['feedback_id'],
+        allow_fallback=last_attempt, raise_on_save_error=True
+    )
+    if status != 200:
+        raise PermanentJobError(body.get('error', f'status {status}'))
+    return body
+
+
+@job_handler('analyze_all_clusters')
+def cluster_batch_job(payload, last_attempt):
+    return analyzer.analyze_all_clusters(payload.get('cluster_ids'), workers=payload.get('workers'))
+
+
+@job_handler('analyze_gaps_streaming')
+def streaming_gaps_job(payload, last_attempt):
+    return analyzer.analyze_gaps_streaming(payload.get('cluster_ids'))
+
+
+@job_handler('precompute_templates')
+def precompute_templates_job(payload, last_attempt):
+    return precompute_templates(payload.get('cluster_ids'))
@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import uuid
+import random
+import sqlite3
+import threading
+import traceback
+
+from lazy import LazyInstance
+
+DEFAULT_PATH = os.path.join(os.path.dirname(__file__), '..', 'jobs.sqlite3')
+
+# kind -> handler(payload); filled at import time by job_handler so that
+# registering does not build the queue
+HANDLERS = {}
+
+
+def job_handler(kind):
+    """
+    Decorator registering handler(payload, last_attempt) -> JSON-serialisable result
+    Raise to retry; last_attempt lets a handler fall back instead of failing
+    """
+    def register(handler):
+        HANDLERS[kind] = handler
+        return handler
+    return register
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying cannot help (bad input, missing rows)"""
+
+
+class JobQueue:
+    """
+    SQLite-backed job queue with a pool of worker threads
+
+    Jobs survive restarts: the serving process starts the workers at
+    startup, and a job left 'running' without a heartbeat for lease_seconds
+    (its worker died) is claimed again by any worker sharing the file. While
+    a job runs, its worker renews the lease every heartbeat_seconds, so long
+    jobs are never claimed twice. A worker only claims kinds it has a
+    handler for. Failed attempts are retried with exponential backoff plus
+    jitter until max_attempts, then marked 'failed'.
+
+    Status flow: queued -> running -> succeeded | queued (retry) | failed
+    """
+
+    def __init__(self, path=None, workers=4, max_attempts=3, backoff_seconds=2.0, max_backoff_seconds=60.0,
+                 lease_seconds=600, heartbeat_seconds=None, handlers=None):
+        self.path = path or DEFAULT_PATH
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds or lease_seconds / 3
+        self._handlers = HANDLERS if handlers is None else handlers
+        self._local = threading.local()
+        self._wakeup = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        self._init_db()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._connection()
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                run_after REAL NOT NULL
+            )"""
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, run_after)')
+
+    def register(self, kind, handler):
+        """Register a handler on this queue only (see job_handler)"""
+        self._handlers[kind] = handler
+
+    def enqueue(self, kind, payload):
+        """Persist a job and wake a worker; returns the job id"""
+        if kind not in self._handlers:
+            raise ValueError(f'No handler registered for job kind: {kind}')
+
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        self._connection().execute(
+            'INSERT INTO jobs (id, kind, payload, status, created_at, updated_at, run_after) '
+            "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+            (job_id, kind, json.dumps(payload), now, now, now)
+        )
+        self.start()
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id):
+        row = self._connection().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'job_id': row['id'],
+            'kind': row['kind'],
+            'status': row['status'],
+            'attempts': row['attempts'],
+            'max_attempts': self.max_attempts,
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error': row['error'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+            'next_attempt_at': row['run_after'] if row['status'] == 'queued' else None
+        }
+
+    def stats(self):
+        rows = self._connection().execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        return {status: count for status, count in rows}
+
+    # Workers ---------------------------------------------------------------
+
+    def start(self):
+        """Start the worker threads once (at app startup, and lazily by enqueue)"""
+        if self._threads:
+            return
+        with self._wakeup:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=5):
+        self._stopping = True
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._stopping = False
+
+    def _claim(self):
+        """Atomically move the oldest ready (or abandoned) job of a handled kind to 'running'"""
+        kinds = list(self._handlers)
+        if not kinds:
+            return None
+        conn = self._connection()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                "SELECT id, kind, payload, attempts FROM jobs "
+                "WHERE ((status = 'queued' AND run_after <= ?) OR (status = 'running' AND updated_at < ?)) "
+                f"AND kind IN ({', '.join('?' * len(kinds))}) "
+                'ORDER BY run_after LIMIT 1',
+                (now, now - self.lease_seconds, *kinds)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (now, row['id'])
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return row
+
+    def _next_wait(self):
+        """Seconds until the earliest delayed job becomes ready (capped)"""
+        row = self._connection().execute("SELECT MIN(run_after) FROM jobs WHERE status = 'queued'").fetchone()
+        if row[0] is None:
+            return 1.0
+        return min(max(row[0] - time.time(), 0.05), 1.0)
+
+    def _worker(self):
+        while not self._stopping:
+            try:
+                job = self._claim()
+            except Exception as e:
+                print(f"Job queue claim error: {e}")
+                job = None
+
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(self._next_wait())
+                continue
+
+            self._run(job)
+
+    def _heartbeat(self, job_id, attempts, done):
+        """Renew a running job's lease until done is set"""
+        conn = self._connection()
+        while not done.wait(self.heartbeat_seconds):
+            try:
+                conn.execute(
+                    "UPDATE jobs SET updated_at = ? WHERE id = ? AND status = 'running' AND attempts = ?",
+                    (time.time(), job_id, attempts)
+                )
+            except Exception as e:
+                print(f"Job {job_id} heartbeat error: {e}")
+
+    def _finish(self, job, attempts, status, **values):
+        """
+        Record an attempt's outcome unless the job was reclaimed meanwhile;
+        the attempt count fences off a worker whose lease expired
+        """
+        columns = ', '.join(f'{name} = ?' for name in values)
+        updated = self._connection().execute(
+            f"UPDATE jobs SET status = ?, {columns}, updated_at = ? "
+            "WHERE id = ? AND status = 'running' AND attempts = ?",
+            (status, *values.values(), time.time(), job['id'], attempts)
+        ).rowcount
+        if not updated:
+            print(f"Job {job['id']} ({job['kind']}) attempt {attempts} lost its lease, result discarded")
+
+    def _run(self, job):
+        attempts = job['attempts'] + 1
+        done = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat, args=(job['id'], attempts, done), name=f'job-heartbeat-{job["id"][:8]}', daemon=True
+        )
+        heartbeat.start()
+        try:
+            result = self._handlers[job['kind']](json.loads(job['payload']), attempts >= self.max_attempts)
+            self._finish(job, attempts, 'succeeded', result=json.dumps(result), error=None)
+        except Exception as e:
+            retry = not isinstance(e, PermanentJobError) and attempts < self.max_attempts
+            delay = min(self.backoff_seconds * 2 ** (attempts - 1), self.max_backoff_seconds)
+            delay *= random.uniform(0.5, 1.0)
+            print(f"Job {job['id']} ({job['kind']}) attempt {attempts} failed: {e}")
+            if not retry:
+                traceback.print_exc()
+            self._finish(job, attempts, 'queued' if retry else 'failed', error=str(e), run_after=time.time() + delay)
+        finally:
+            done.set()
+            heartbeat.join()
+
+
+def queue_from_env():
+    return JobQueue(
+        path=os.getenv('JOB_QUEUE_PATH') or None,
+        workers=int(os.getenv('JOB_WORKERS', 4)),
+        max_attempts=int(os.getenv('JOB_MAX_ATTEMPTS', 3)),
+        backoff_seconds=float(os.getenv('JOB_BACKOFF_SECONDS', 2.0)),
+        lease_seconds=float(os.getenv('JOB_LEASE_SECONDS', 600)),
+        heartbeat_seconds=float(os.getenv('JOB_HEARTBEAT_SECONDS', 0)) or None
+    )
+
+
+job_queue = LazyInstance(queue_from_env, 'job_queue')
@@ -0,0 +1,78 @@
+from collections import deque
+from typing import List, Dict
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over issue keywords for single-pass matching"""
+
+    def __init__(self, mappings: List[Dict]):
+        # Trie transitions, failure links and per-state {competency: confidence} outputs
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [{}]
+
+        for mapping in mappings:
+            keyword = mapping['issue_keyword'].lower()
+            competency = mapping['competency_area']
+            confidence = float(mapping['confidence_score'])
+            self._add(keyword, competency, confidence)
+
+        self._build_failure_links()
+
+    def _add(self, keyword: str, competency: str, confidence: float):
+        """Insert a keyword into the trie"""
+        state = 0
+        for ch in keyword:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append({})
+                self._goto[state][ch] = next_state
+            state = next_state
+
+        self._merge(self._out[state], {competency: confidence})
+
+    def _build_failure_links(self):
+        """Breadth-first pass that wires failure links and folds suffix outputs"""
+        queue = deque(self._goto[0].values())
+
+        while queue:
+            state = queue.popleft()
+            for ch, child in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(ch, 0)
+
+                # A state also matches every keyword that is a suffix of it
+                self._merge(self._out[child], self._out[self._fail[child]])
+                queue.append(child)
+
+    @staticmethod
+    def _merge(into: Dict[str, float], other: Dict[str, float]):
+        """Merge outputs keeping the max confidence per competency"""
+        for competency, confidence in other.items():
+            if competency not in into or confidence > into[competency]:
+                into[competency] = confidence
+
+    def match(self, text: str) -> Dict[str, float]:
+        """
+        Scan text once and return max confidence per matched competency
+
+        Returns: {'competency_area': confidence_score}
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+
+        matched = dict(out[0])  # Empty keywords match any text
+        state = 0
+
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                self._merge(matched, out[state])
+
+        return matched
@@ -0,0 +1,63 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# Seconds spent importing / constructing things at startup, for /api/startup-report
+startup_timings = {'imports': {}, 'singletons': {}}
+
+
+@contextmanager
+def timed_import(name):
+    """Record how long a block of imports takes"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings['imports'][name] = round(time.perf_counter() - start, 4)
+
+
+class LazyInstance:
+    """
+    Proxy that builds a module-level singleton on first attribute access
+
+    Lets modules keep `db = ...` style globals without doing network or
+    heavy work at import time. Construction is thread-safe and a failed
+    construction is retried on the next access.
+    """
+
+    def __init__(self, factory, name):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_instance', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def _get(self):
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                instance = self._instance
+                if instance is None:
+                    start = time.perf_counter()
+                    instance = self._factory()
+                    startup_timings['singletons'][self._name] = round(time.perf_counter() - start, 4)
+                    object.__setattr__(self, '_instance', instance)
+        return instance
+
+    def override(self, instance):
+        """Replace the underlying instance (benchmarks, local stand-ins)"""
+        with self._lock:
+            object.__setattr__(self, '_instance', instance)
+
+    @property
+    def initialized(self):
+        return self._instance is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._get(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._get(), attr, value)
+
+    def __repr__(self):
+        state = 'initialized' if self.initialized else 'lazy'
+        return f'<LazyInstance {self._name} ({state})>'
@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict
+
+
+class ResponseCache:
+    """
+    Content-addressed cache for LLM responses
+
+    Tier 1 is an in-memory LRU, tier 2 an optional SQLite file shared across
+    workers on the same host. Both tiers honour the same TTL.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=86400, sqlite_path=None, max_disk_entries=20000):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+
+        self._memory = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+
+        self._disk = None
+        if sqlite_path:
+            self._disk = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._disk.execute(
+                'CREATE TABLE IF NOT EXISTS llm_cache ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                'expires_at REAL NOT NULL, last_access REAL NOT NULL)'
+            )
+            self._disk.commit()
+
+    @staticmethod
+    def make_key(model_name: str, generation_config: Optional[Dict], prompt: str) -> str:
+        """Hash (model, config, whitespace-normalized prompt) into a cache key"""
+        payload = json.dumps({
+            'model': model_name,
+            'config': generation_config or {},
+            'prompt': ' '.join(prompt.split())
+        }, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached response or None on miss/expiry"""
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return value
+                del self._memory[key]
+
+            if self._disk is not None:
+                row = self._disk.execute(
+                    'SELECT value, expires_at FROM llm_cache WHERE key = ?', (key,)
+                ).fetchone()
+                if row and row[1] > now:
+                    self._disk.execute('UPDATE llm_cache SET last_access = ? WHERE key = ?', (now, key))
+                    self._disk.commit()
+                    self._remember(key, row[1], row[0])
+                    self._stats['disk_hits'] += 1
+                    return row[0]
+
+            self._stats['misses'] += 1
+            return None
+
+    def set(self, key: str, value: str):
+        """Store a response in every configured tier"""
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+
+        with self._lock:
+            self._remember(key, expires_at, value)
+
+            if self._disk is not None:
+                self._disk.execute(
+                    'INSERT OR REPLACE INTO llm_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)',
+                    (key, value, expires_at, now)
+                )
+                self._disk.execute('DELETE FROM llm_cache WHERE expires_at <= ?', (now,))
+                self._disk.execute(
+                    'DELETE FROM llm_cache WHERE key IN ('
+                    'SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)',
+                    (self.max_disk_entries,)
+                )
+                self._disk.commit()
+
+    def _remember(self, key, expires_at, value):
+        """Insert into the memory tier, evicting least recently used entries (lock held)"""
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def clear(self):
+        """Drop every cached response"""
+        with self._lock:
+            self._memory.clear()
+            if self._disk is not None:
+                self._disk.execute('DELETE FROM llm_cache')
+                self._disk.commit()
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and current memory tier size"""
+        with self._lock:
+            return {**self._stats, 'entries': len(self._memory)}
+
+
+def cache_from_env() -> ResponseCache:
+    """Build the default cache from LLM_CACHE_* environment variables"""
+    return ResponseCache(
+        max_entries=int(os.getenv('LLM_CACHE_SIZE', 1024)),
+        ttl_seconds=float(os.getenv('LLM_CACHE_TTL', 86400)),
+        sqlite_path=os.getenv('LLM_CACHE_PATH') or None,
+        max_disk_entries=int(os.getenv('LLM_CACHE_DISK_SIZE', 20000))
+    )
@@ -1,26 +1,130 @@
 import os
-import google.generativeai as genai
+import threading
 from dotenv import load_dotenv
 from pathlib import Path
+from llm_cache import ResponseCache, cache_from_env
+from lazy import LazyInstance
+from metrics import LLM_REQUESTS, record_llm_usage
+from single_flight import SingleFlight, AsyncSingleFlight
 
 current_dir = Path(__file__).parent
 dotenv_path = current_dir.parent.parent.parent / '.env'
 load_dotenv(dotenv_path=dotenv_path)
 
-genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+_genai = None
+_genai_lock = threading.Lock()
+
+
+def get_genai():
+    """Import and configure the Gemini SDK once, on first use"""
+    global _genai
+    if _genai is None:
+        with _genai_lock:
+            if _genai is None:
+                import google.generativeai as genai
+                genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+                _genai = genai
+    return _genai
 
 
 class ContentPersonalizer:
-    def __init__(self):
+    def __init__(self, cache=None, model=None):
         # Configure generation settings for plain text output
-        generation_config = {
+        self.model_name = 'gemini-2.5-flash'
+        self.generation_config = {
             "temperature": 0.7,
             "response_mime_type": "text/plain"  # Force plain text output
         }
-        self.model = genai.GenerativeModel(
-            'gemini-2.5-flash',
-            generation_config=generation_config
+        # An injected model (e.g. the benchmark fakes) skips the Gemini SDK
+        self.model = model or get_genai().GenerativeModel(
+            self.model_name,
+            generation_config=self.generation_config
         )
+        # Any object with get(key)/set(key, value) can be plugged in
+        self.cache = cache if cache is not None else cache_from_env()
+        # Identical prompts already being generated share that one call
+        self._inflight = SingleFlight('generation')
+        self._inflight_async = AsyncSingleFlight('generation')
+    
+    def _generate(self, prompt, timeout=None):
+        """
+        Call Gemini, serving identical (model, config, prompt) inputs from
+        cache; timeout is a per-request deadline in seconds
+        """
+        key = ResponseCache.make_key(self.model_name, self.generation_config, prompt)
+        cached = self.cache.get(key)
+        if cached is not None:
+            LLM_REQUESTS.inc('cache_hit')
+            return cached
+        
+        return self._inflight.do(key, self._generate_uncached, key, prompt, timeout)
+    
+    def _generate_uncached(self, key, prompt, timeout=None):
+        try:
+            if timeout:
+                response = self.model.generate_content(prompt, request_options={'timeout': timeout})
+            else:
+                response = self.model.generate_content(prompt)
+            text = response.text
+        except Exception:
+            LLM_REQUESTS.inc('error')
+            raise
+        
+        LLM_REQUESTS.inc('success')
+        record_llm_usage(response)
+        self.cache.set(key, text)
+        return text
+    
+    async def _generate_async(self, prompt):
+        """Async variant of _generate for the ASGI serving mode"""
+        key = ResponseCache.make_key(self.model_name, self.generation_config, prompt)
+        cached = self.cache.get(key)
+        if cached is not None:
+            LLM_REQUESTS.inc('cache_hit')
+            return cached
+        
+        return await self._inflight_async.do(key, self._generate_uncached_async, key, prompt)
+    
+    async def _generate_uncached_async(self, key, prompt):
+        try:
+            response = await self.model.generate_content_async(prompt)
+            text = response.text
+        except Exception:
+            LLM_REQUESTS.inc('error')
+            raise
+        
+        LLM_REQUESTS.inc('success')
+        record_llm_usage(response)
+        self.cache.set(key, text)
+        return text
+    
+    def _generate_stream(self, prompt):
+        """
+        Yield Gemini output chunks as they arrive; a cached response is
+        yielded as one chunk. The full text is cached once the stream ends.
+        """
+        key = ResponseCache.make_key(self.model_name, self.generation_config, prompt)
+        cached = self.cache.get(key)
+        if cached is not None:
+            LLM_REQUESTS.inc('cache_hit')
+            yield cached
+            return
+        
+        parts = []
+        try:
+            response = self.model.generate_content(prompt, stream=True)
+            for chunk in response:
+                text = chunk.text
+                if text:
+                    parts.append(text)
+                    yield text
+        except Exception:
+            LLM_REQUESTS.inc('error')
+            raise
+        
+        LLM_REQUESTS.inc('success')
+        record_llm_usage(response)
+        self.cache.set(key, ''.join(parts))
     
     def personalize_training_module(self, base_module, teacher_profile, cluster_context):
         """
@@ -34,8 +138,46 @@ class ContentPersonalizer:
         Returns:
             dict with 'personalized_content', 'adaptations_made', 'estimated_duration'
         """
+        try:
+            personalized_content = self._generate(
+                self._personalization_prompt(base_module, teacher_profile, cluster_context)
+            )
+            
+            return {
+                'success': True,
+                'personalized_content': personalized_content,
+                'original_module_id': base_module.get('id'),
+                'estimated_duration': '10-15 minutes',
+                'adaptations_made': self.adaptations_made(teacher_profile, cluster_context)
+            }
         
-        prompt = f"""You are an expert educational content designer for teacher professional development in India.
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'personalized_content': base_module.get('content'),  # Fallback to base content
+                'estimated_duration': '10-15 minutes'
+            }
+    
+    def stream_training_module(self, base_module, teacher_profile, cluster_context):
+        """
+        Streaming variant of personalize_training_module
+        Yields text chunks as Gemini produces them (raises on failure)
+        """
+        return self._generate_stream(self._personalization_prompt(base_module, teacher_profile, cluster_context))
+    
+    @staticmethod
+    def adaptations_made(teacher_profile, cluster_context):
+        return {
+            'language': cluster_context.get('language'),
+            'location_context': cluster_context.get('location'),
+            'infrastructure_adapted': True,
+            'gap_focused': teacher_profile.get('gap_areas')
+        }
+    
+    def _personalization_prompt(self, base_module, teacher_profile, cluster_context):
+        """Prompt adapting a base module to one teacher and cluster"""
+        return f"""You are an expert educational content designer for teacher professional development in India.
 
 
 **Teacher Profile:**
@@ -88,31 +230,99 @@ Return ONLY the adapted training content in PLAIN TEXT format. Do NOT use any ma
 Do NOT include meta-commentary about the adaptation process.
 Do NOT use markdown formatting symbols like **, ##, *, etc.
 """
-        
-        try:
-            response = self.model.generate_content(prompt)
-            personalized_content = response.text
+    
+    def generate_module_template(self, base_module, cluster_context, placeholders):
+        """
+        Adapt a base module for a whole cluster, leaving {{placeholder}}
+        markers where per-teacher details go (raises on failure)
+        """
+        markers = ', '.join('{{' + name + '}}' for name in placeholders)
+        prompt = f"""You are an expert educational content designer for teacher professional development in India.
+
+
+**Cluster/School Context:**
+- Location: {cluster_context.get('location', 'Rural India')}
+- Common Classroom Challenges: {cluster_context.get('common_issues', 'Student absenteeism, resource constraints')}
+- Primary Language: {cluster_context.get('language', 'Hindi')}
+- School Infrastructure: {cluster_context.get('infrastructure', 'Basic - no projector, limited internet')}
+
+
+**Base Training Module:**
+Title: {base_module.get('title', 'Untitled')}
+Competency Area: {base_module.get('competency_area', 'General Teaching')}
+
+
+Content:
+{base_module.get('content', 'No content provided')}
+
+
+---
+
+
+**Your Task:**
+Adapt this training module for every teacher in this cluster. Follow these guidelines:
+
+
+1. **Localize Language**: Include {cluster_context.get('language', 'Hindi')} terms where helpful, but keep main content in English
+2. **Context-Specific Examples**: Use scenarios from {cluster_context.get('location', 'rural schools')} addressing "{cluster_context.get('common_issues', 'common classroom issues')}"
+3. **Infrastructure Adaptation**: Modify activities to work with {cluster_context.get('infrastructure', 'basic')} infrastructure (no tech if unavailable)
+4. **Teacher Details**: You do not know the individual teacher. Where their details belong, write these exact markers instead: {markers}
+5. **Actionable Steps**: Provide 3-5 concrete actions the teacher can implement tomorrow
+6. **Duration**: Keep content suitable for 10-15 minute reading time
+
+
+**Output Format:**
+Return ONLY the adapted training content in PLAIN TEXT format with simple dashes and numbered steps, a brief introduction addressed to {{{{teacher_name}}}}, an example scenario and a quick reflection question.
+Do NOT use markdown formatting symbols like **, ##, *, etc.
+"""
+        return self._generate(prompt)
+    
+    def generate_teacher_intro(self, teacher_profile, base_module):
+        """Short per-teacher opening for a templated module (raises on failure)"""
+        prompt = f"""Write a 2-sentence plain text opening for a training module titled "{base_module.get('title', 'Training')}".
+Address the teacher by name and connect the module to their situation.
+Teacher: {teacher_profile.get('name', 'Teacher')}, teaches {teacher_profile.get('subject', 'General')}, {teacher_profile.get('experience', 'Unknown')} years of experience.
+Focus areas: {', '.join(teacher_profile.get('gap_areas', []))}
+"""
+        return self._generate(prompt)
+    
+    def _assignment_prompt(self, teacher, issue_category, base_module):
+        """Prompt for the short module-assignment message"""
+        return f"""
+            You are an expert teacher trainer.
+            Teacher: {teacher.get('name')} 
+            Issue Category: {issue_category}
+            Module: {base_module['title']}
             
-            return {
-                'success': True,
-                'personalized_content': personalized_content,
-                'original_module_id': base_module.get('id'),
-                'estimated_duration': '10-15 minutes',
-                'adaptations_made': {
-                    'language': cluster_context.get('language'),
-                    'location_context': cluster_context.get('location'),
-                    'infrastructure_adapted': True,
-                    'gap_focused': teacher_profile.get('gap_areas')
-                }
-            }
-        
+            Task: Write a very short, encouraging message (2 sentences) assigning this module to help with their recent feedback.
+            """
+    
+    @staticmethod
+    def fallback_assignment_message(base_module):
+        """Message used when generation fails or times out"""
+        return f"We have assigned {base_module['title']} to help you with your recent feedback."
+    
+    def generate_assignment_message(self, teacher, issue_category, base_module, fallback=True, timeout=None):
+        """
+        Write a short encouraging message assigning a module after feedback
+        Falls back to a fixed message if generation fails or misses the
+        timeout deadline, unless fallback=False
+        """
+        try:
+            return self._generate(self._assignment_prompt(teacher, issue_category, base_module), timeout=timeout)
         except Exception as e:
-            return {
-                'success': False,
-                'error': str(e),
-                'personalized_content': base_module.get('content'),  # Fallback to base content
-                'estimated_duration': '10-15 minutes'
-            }
+            if not fallback:
+                raise
+            print(f"AI Error (using fallback): {e}")
+            return self.fallback_assignment_message(base_module)
+    
+    async def generate_assignment_message_async(self, teacher, issue_category, base_module):
+        """Async variant of generate_assignment_message"""
+        try:
+            return await self._generate_async(self._assignment_prompt(teacher, issue_category, base_module))
+        except Exception as e:
+            print(f"AI Error (using fallback): {e}")
+            return self.fallback_assignment_message(base_module)
     
     def generate_feedback_prompt(self, training_module, classroom_issues):
         """
@@ -133,9 +343,8 @@ Questions should:
 Format as a JSON array of question strings."""
 
 
-        response = self.model.generate_content(prompt)
-        return response.text
+        return self._generate(prompt)
 
 
-# Initialize personalizer
-personalizer = ContentPersonalizer()
+# Initialize personalizer on first use
+personalizer = LazyInstance(ContentPersonalizer, 'personalizer')
@@ -0,0 +1,160 @@
+import time
+import threading
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+class Counter:
+    """Monotonic counter with a single label dimension"""
+
+    def __init__(self, name, help_text, label_name):
+        self.name = name
+        self.help_text = help_text
+        self.label_name = label_name
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label, amount=1):
+        with self._lock:
+            self._values[label] = self._values.get(label, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for label, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels([(self.label_name, label)])} {value}')
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a single label dimension"""
+
+    def __init__(self, name, help_text, label_name, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_name = label_name
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, label, value):
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label, series in sorted(self._series.items()):
+                base = [(self.label_name, label)]
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f'{self.name}_bucket{_format_labels(base + [("le", bound)])} {count}')
+                lines.append(f'{self.name}_bucket{_format_labels(base + [("le", "+Inf")])} {series[-1]}')
+                lines.append(f'{self.name}_sum{_format_labels(base)} {series[-2]}')
+                lines.append(f'{self.name}_count{_format_labels(base)} {series[-1]}')
+        return lines
+
+
+class MetricsRegistry:
+    """Holds metrics and renders them in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help_text, label_name):
+        metric = Counter(name, help_text, label_name)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, label_name, buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, label_name, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """Register a callable returning (name, type, help, value) tuples read at scrape time"""
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                samples = collector()
+            except Exception as e:
+                print(f"Metrics collector error: {e}")
+                continue
+            for name, metric_type, help_text, value in samples:
+                lines.extend([f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}', f'{name} {value}'])
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram(
+    'feedback_to_training_stage_seconds',
+    'Latency of each /api/feedback-to-training stage',
+    'stage'
+)
+STAGE_ERRORS = metrics.counter(
+    'feedback_to_training_errors_total',
+    'Errors raised or handled in each /api/feedback-to-training stage',
+    'stage'
+)
+LLM_REQUESTS = metrics.counter(
+    'llm_requests_total',
+    'Gemini generations by outcome (cache_hit, success, error)',
+    'outcome'
+)
+SINGLE_FLIGHT_SHARED = metrics.counter(
+    'single_flight_shared_total',
+    'Calls that joined an identical in-flight call instead of running it again',
+    'kind'
+)
+LLM_TOKENS = metrics.counter(
+    'llm_tokens_total',
+    'Gemini tokens used, by prompt/completion',
+    'type'
+)
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage; exceptions escaping the block count as errors"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(name)
+        raise
+    finally:
+        STAGE_SECONDS.observe(name, time.perf_counter() - start)
+
+
+def record_stage_error(name):
+    """Count an error a stage handled itself (e.g. with a fallback)"""
+    STAGE_ERRORS.inc(name)
+
+
+def record_llm_usage(response):
+    """Add token counts from a Gemini response, when the SDK reports them"""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return
+    LLM_TOKENS.inc('prompt', getattr(usage, 'prompt_token_count', 0) or 0)
+    LLM_TOKENS.inc('completion', getattr(usage, 'candidates_token_count', 0) or 0)
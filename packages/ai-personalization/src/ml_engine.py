@@ -1,23 +1,66 @@
+import os
+import time
+import tempfile
 import numpy as np
-import pandas as pd
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
 from supabase_client import db
+from bulk_writer import BulkWriter, idempotency_key
+from lazy import LazyInstance
+from cluster_models import ClusterModelStore, fit_clusters_parallel
+from assessment_store import AssessmentStore, SCORE_COLUMNS
+
+# Feature order used by _extract_features and the bulk paths
+COMPETENCIES = [
+    'classroom_management',
+    'content_knowledge',
+    'pedagogy',
+    'technology_usage',
+    'student_engagement'
+]
+assert SCORE_COLUMNS == tuple(f'{competency}_score' for competency in COMPETENCIES)
+
+GAP_THRESHOLD = 5  # Scores below this (out of 10) count as a gap
+BATCH_WORKERS = int(os.getenv('CLUSTER_BATCH_WORKERS', 0)) or os.cpu_count() or 1
+
+MODULE_MAP = {
+    'classroom_management': ['behavior_mgmt_101', 'discipline_strategies'],
+    'content_knowledge': ['subject_mastery', 'curriculum_design'],
+    'pedagogy': ['active_learning_methods', 'differentiated_instruction'],
+    'technology_usage': ['digital_tools_basics', 'online_teaching'],
+    'student_engagement': ['parent_communication', 'motivation_techniques']
+}
+
+# Module names and a (competency x module) membership matrix for vectorized lookups
+MODULE_NAMES = sorted({module for modules in MODULE_MAP.values() for module in modules})
+MODULE_MATRIX = np.array([
+    [module in MODULE_MAP[competency] for module in MODULE_NAMES]
+    for competency in COMPETENCIES
+])
 
 class CompetencyAnalyzer:
-    def __init__(self, n_clusters=5):
+    def __init__(self, n_clusters=5, model_store=None):
         self.n_clusters = n_clusters
-        self.scaler = StandardScaler()
-        self.kmeans = None
+        # Fitted models live per cluster_id, never on this shared instance
+        self.models = model_store or ClusterModelStore()
     
     def analyze_teacher_gap(self, teacher_id):
         """
         Analyze individual teacher's competency gaps
         Returns: dict with gap areas, priority, recommended modules
         """
-        # Fetch teacher's latest assessment
-        assessment = db.get_teacher_assessments(teacher_id)
+        # Fetch teacher's latest assessment into a one-row store, as the bulk path does
+        store = db.load_latest_assessments([teacher_id])
         
+        result = self._gap_results(store, [teacher_id]).get(teacher_id) or self.build_gap_result(teacher_id, None)
+        
+        # Save to Supabase, one row per assessment however often it is analyzed
+        if 'error' not in result:
+            assessment_id = store.assessment_ids[store.row(teacher_id)]
+            db.save_gap_analysis(teacher_id, result, key=self.gap_key(teacher_id, assessment_id))
+        
+        return result
+    
+    def build_gap_result(self, teacher_id, assessment):
+        """Derive gap areas, priority and modules from an assessment row"""
         if not assessment:
             return {
                 'teacher_id': teacher_id,
@@ -27,46 +70,67 @@ class CompetencyAnalyzer:
                 'recommended_modules': []
             }
         
-        # Extract competency scores
-        features = self._extract_features(assessment)
-        
-        # Identify weak areas (scores < 5 out of 10)
-        gap_areas = []
-        competency_map = {
-            'classroom_management': assessment.get('classroom_management_score', 0),
-            'content_knowledge': assessment.get('content_knowledge_score', 0),
-            'pedagogy': assessment.get('pedagogy_score', 0),
-            'technology_usage': assessment.get('technology_usage_score', 0),
-            'student_engagement': assessment.get('student_engagement_score', 0)
-        }
+        store = AssessmentStore.from_rows([{**assessment, 'teacher_id': teacher_id}])
+        return self._gap_results(store, [teacher_id])[teacher_id]
+    
+    def _gap_results(self, store, teacher_ids):
+        """
+        Gap areas, priority and modules for the given teachers that have an
+        assessment in store, vectorized over their score matrix
+        Returns: dict of teacher_id -> result
+        """
+        # (n_teachers x 5) score matrix gathered from the store, missing scores count as 0
+        X, assessed_ids = store.matrix(teacher_ids)
         
-        for competency, score in competency_map.items():
-            if score < 5:
-                gap_areas.append(competency)
+        gap_mask = X < GAP_THRESHOLD
+        gap_counts = gap_mask.sum(axis=1)
+        priorities = np.select([gap_counts >= 3, gap_counts == 2], ['high', 'medium'], default='low')
+        module_mask = (gap_mask.astype(int) @ MODULE_MATRIX.astype(int)) > 0
         
-        # Determine priority based on number of gaps
-        if len(gap_areas) >= 3:
-            priority = 'high'
-        elif len(gap_areas) == 2:
-            priority = 'medium'
-        else:
-            priority = 'low'
+        competencies = np.array(COMPETENCIES)
+        module_names = np.array(MODULE_NAMES)
         
-        # Map gaps to training modules
-        recommended_modules = self._recommend_modules(gap_areas)
+        return {
+            teacher_id: {
+                'teacher_id': teacher_id,
+                'gap_areas': competencies[gap_mask[i]].tolist(),
+                'priority': str(priorities[i]),
+                'recommended_modules': module_names[module_mask[i]].tolist(),
+                'scores': dict(zip(COMPETENCIES, (round(score, 2) for score in X[i].tolist())))
+            }
+            for i, teacher_id in enumerate(assessed_ids)
+        }
+    
+    def analyze_gaps_bulk(self, teacher_ids, save=True):
+        """
+        Vectorized gap analysis for many teachers (e.g. nightly district runs)
+        Returns: dict with build_gap_result-shaped results in teacher_ids
+        order, the number of rows saved, and an error if any were not
+        """
+        store = db.load_latest_assessments(teacher_ids)
+        analyzed = self._gap_results(store, teacher_ids)
         
-        result = {
-            'teacher_id': teacher_id,
-            'gap_areas': gap_areas,
-            'priority': priority,
-            'recommended_modules': recommended_modules,
-            'scores': competency_map
+        summary = {
+            'total': len(teacher_ids),
+            'results': [
+                analyzed.get(teacher_id) or self.build_gap_result(teacher_id, None)
+                for teacher_id in teacher_ids
+            ],
+            'saved': 0
         }
         
-        # Save to Supabase
-        db.save_gap_analysis(teacher_id, result)
+        # Persist every result in bulk inserts, retried until written before returning
+        if save and analyzed:
+            writer = BulkWriter(db, max_rows=500)
+            for teacher_id, result in analyzed.items():
+                assessment_id = store.assessment_ids[store.row(teacher_id)]
+                writer.add('competency_gaps', db.gap_row(teacher_id, result), key=self.gap_key(teacher_id, assessment_id))
+            unsaved = writer.close()
+            summary['saved'] = writer.stats['rows']
+            if unsaved:
+                summary['error'] = f"{unsaved} writes failed"
         
-        return result
+        return summary
     
     def analyze_cluster_gaps(self, cluster_id):
         """
@@ -74,33 +138,29 @@ class CompetencyAnalyzer:
         Returns: dict with cluster insights and teacher groupings
         """
         # Fetch all teachers in cluster
-        teachers = db.get_teachers_by_cluster(cluster_id)
+        teachers = db.get_teachers_by_cluster(cluster_id, columns='id')
         
         if len(teachers) < self.n_clusters:
             return {'error': 'Not enough teachers for clustering'}
         
-        # Collect assessment data
-        feature_matrix = []
-        teacher_ids = []
-        
-        for teacher in teachers:
-            assessment = db.get_teacher_assessments(teacher['id'])
-            if assessment:
-                features = self._extract_features(assessment)
-                feature_matrix.append(features)
-                teacher_ids.append(teacher['id'])
+        # Fetch latest assessments in bulk and gather the feature matrix in one step
+        store = db.load_latest_assessments([t['id'] for t in teachers])
+        X, teacher_ids = store.matrix([t['id'] for t in teachers], dtype=float)
         
-        if len(feature_matrix) < self.n_clusters:
+        if len(X) < self.n_clusters:
             return {'error': 'Insufficient assessment data'}
         
-        # Normalize features
-        X = np.array(feature_matrix)
-        X_scaled = self.scaler.fit_transform(X)
-        
-        # Apply K-Means clustering
-        self.kmeans = KMeans(n_clusters=self.n_clusters, random_state=42, n_init=10)
-        cluster_labels = self.kmeans.fit_predict(X_scaled)
+        # Reuse the stored model unless the data drifted, refit otherwise
+        model = self.models.get(cluster_id)
+        if model is None or model.n_clusters != self.n_clusters or model.needs_refit(X):
+            model, cluster_labels = self.models.fit(cluster_id, X, self.n_clusters)
+        else:
+            cluster_labels = model.predict(X)
         
+        return self._cluster_result(cluster_id, len(teachers), teacher_ids, X, cluster_labels)
+    
+    def _cluster_result(self, cluster_id, total_teachers, teacher_ids, X, cluster_labels):
+        """Group teachers by label and average their scores per group"""
         # Group teachers by cluster
         cluster_groups = {}
         for i, label in enumerate(cluster_labels):
@@ -108,7 +168,7 @@ class CompetencyAnalyzer:
                 cluster_groups[label] = []
             cluster_groups[label].append({
                 'teacher_id': teacher_ids[i],
-                'features': feature_matrix[i].tolist()
+                'features': X[i].tolist()
             })
         
         # Identify common gaps per cluster
@@ -129,35 +189,190 @@ class CompetencyAnalyzer:
         
         return {
             'cluster_id': cluster_id,
-            'total_teachers': len(teachers),
+            'total_teachers': total_teachers,
             'clusters': cluster_insights
         }
     
-    def _extract_features(self, assessment):
-        """Convert assessment dict to feature vector"""
-        return np.array([
-            assessment.get('classroom_management_score', 0),
-            assessment.get('content_knowledge_score', 0),
-            assessment.get('pedagogy_score', 0),
-            assessment.get('technology_usage_score', 0),
-            assessment.get('student_engagement_score', 0)
-        ])
+    def analyze_all_clusters(self, cluster_ids=None, workers=None):
+        """
+        analyze_cluster_gaps for every cluster (or the given ones) in one run
+        
+        Teachers and latest assessments are fetched in bulk, stacked into one
+        feature matrix ordered by cluster, and the clusters whose stored model
+        is missing or drifted are refitted across a process pool that reads
+        the matrix from shared memory. Current models are reused in-process.
+        Returns: one report with a per-cluster analyze_cluster_gaps result
+        """
+        started = time.perf_counter()
+        workers = workers or BATCH_WORKERS
+        
+        members = {cluster_id: [] for cluster_id in cluster_ids or []}
+        for teacher in db.iter_teachers(cluster_ids, columns='id,cluster_id'):
+            if teacher['cluster_id'] is None:
+                continue  # Not assigned to a cluster yet
+            members.setdefault(teacher['cluster_id'], []).append(teacher['id'])
+        store = db.load_latest_assessments(
+            [teacher_id for teacher_ids in members.values() for teacher_id in teacher_ids]
+        )
+        
+        # Rows of every cluster stacked contiguously: spans[cluster_id] = (start, stop, teacher_ids)
+        order, spans, stop = [], {}, 0
+        for cluster_id, teacher_ids in members.items():
+            indices, assessed = store.rows_for(teacher_ids)
+            order.append(indices)
+            spans[cluster_id] = (stop, stop + len(indices), assessed)
+            stop += len(indices)
+        X = store.scores[np.concatenate(order) if order else np.empty(0, dtype=np.intp)].astype(float)
+        
+        results, skipped, to_fit = {}, {}, []
+        for cluster_id, (start, stop, assessed) in spans.items():
+            if len(members[cluster_id]) < self.n_clusters:
+                skipped[cluster_id] = 'Not enough teachers for clustering'
+            elif stop - start < self.n_clusters:
+                skipped[cluster_id] = 'Insufficient assessment data'
+            else:
+                model = self.models.get(cluster_id)
+                if model is None or model.n_clusters != self.n_clusters or model.needs_refit(X[start:stop]):
+                    to_fit.append((cluster_id, start, stop))
+                else:
+                    results[cluster_id] = self._cluster_result(
+                        cluster_id, len(members[cluster_id]), assessed, X[start:stop], model.predict(X[start:stop])
+                    )
+        
+        for cluster_id, model, labels, error in fit_clusters_parallel(X, to_fit, self.n_clusters, workers):
+            if error is not None:
+                print(f"Cluster fit error for {cluster_id}: {error}")
+                skipped[cluster_id] = str(error)
+                continue
+            self.models.save(model)
+            start, stop, assessed = spans[cluster_id]
+            results[cluster_id] = self._cluster_result(
+                cluster_id, len(members[cluster_id]), assessed, X[start:stop], labels
+            )
+        
+        return {
+            'cluster_count': len(members),
+            'analyzed': len(results),
+            'refitted': len(to_fit) - sum(cluster_id in skipped for cluster_id, _, _ in to_fit),
+            'total_teachers': sum(len(teacher_ids) for teacher_ids in members.values()),
+            'assessed_teachers': len(X),
+            'average_scores': {
+                competency: round(float(X[:, i].mean()), 2) if len(X) else None
+                for i, competency in enumerate(COMPETENCIES)
+            },
+            'workers': workers,
+            'elapsed_seconds': round(time.perf_counter() - started, 2),
+            'skipped': skipped,
+            'clusters': results
+        }
     
-    def _recommend_modules(self, gap_areas):
-        """Map competency gaps to training module IDs"""
-        module_map = {
-            'classroom_management': ['behavior_mgmt_101', 'discipline_strategies'],
-            'content_knowledge': ['subject_mastery', 'curriculum_design'],
-            'pedagogy': ['active_learning_methods', 'differentiated_instruction'],
-            'technology_usage': ['digital_tools_basics', 'online_teaching'],
-            'student_engagement': ['parent_communication', 'motivation_techniques']
+    def analyze_gaps_streaming(self, cluster_ids=None, page_size=1000, batch_size=4096):
+        """
+        MiniBatchKMeans grouping over very large (e.g. state-level) populations
+        
+        Assessments are pulled page by page and spooled to a temporary
+        float32 memmap, so memory stays bounded. Scaling, partial_fit and the
+        final assignment pass then run over that spool in batches, and
+        per-group averages are accumulated incrementally.
+        Returns: same shape as analyze_cluster_gaps
+        """
+        from sklearn.cluster import MiniBatchKMeans
+        from sklearn.preprocessing import StandardScaler
+        
+        scaler = StandardScaler()
+        teacher_ids = []
+        total_teachers = 0
+        
+        with tempfile.TemporaryDirectory() as spool_dir:
+            spool_path = os.path.join(spool_dir, 'features.f32')
+            
+            # Pass 1: stream assessments from Supabase into the spool
+            with open(spool_path, 'wb') as spool:
+                for page in db.iter_teacher_id_pages(cluster_ids, page_size=page_size):
+                    total_teachers += len(page)
+                    X_page, page_ids = db.load_latest_assessments(page).matrix(page)
+                    if not page_ids:
+                        continue
+                    
+                    scaler.partial_fit(X_page)
+                    X_page.tofile(spool)
+                    teacher_ids.extend(page_ids)
+            
+            n_samples = len(teacher_ids)
+            if n_samples < self.n_clusters:
+                return {'error': 'Insufficient assessment data'}
+            
+            X = np.memmap(spool_path, dtype=np.float32, mode='r', shape=(n_samples, len(COMPETENCIES)))
+            kmeans = MiniBatchKMeans(n_clusters=self.n_clusters, random_state=42, batch_size=batch_size, n_init=3)
+            
+            # Pass 2: fit on scaled batches
+            for start in range(0, n_samples, batch_size):
+                batch = scaler.transform(np.asarray(X[start:start + batch_size], dtype=float))
+                if len(batch) >= self.n_clusters:
+                    kmeans.partial_fit(batch)
+            
+            # Pass 3: assign labels and accumulate per-group sums
+            sums = np.zeros((self.n_clusters, len(COMPETENCIES)))
+            counts = np.zeros(self.n_clusters, dtype=int)
+            groups = [[] for _ in range(self.n_clusters)]
+            
+            for start in range(0, n_samples, batch_size):
+                batch = np.asarray(X[start:start + batch_size], dtype=float)
+                labels = kmeans.predict(scaler.transform(batch))
+                np.add.at(sums, labels, batch)
+                counts += np.bincount(labels, minlength=self.n_clusters)
+                for offset, label in enumerate(labels):
+                    groups[label].append(teacher_ids[start + offset])
+            
+            del X
+        
+        cluster_insights = {}
+        for label in range(self.n_clusters):
+            if not counts[label]:
+                continue
+            avg_scores = sums[label] / counts[label]
+            cluster_insights[f'cluster_{label}'] = {
+                'teacher_count': int(counts[label]),
+                'average_scores': {
+                    competency: round(avg_scores[i], 2) for i, competency in enumerate(COMPETENCIES)
+                },
+                'teachers': groups[label]
+            }
+        
+        return {
+            'cluster_id': cluster_ids,
+            'total_teachers': total_teachers,
+            'clusters': cluster_insights
         }
+    
+    def predict_teacher_group(self, cluster_id, teacher_id):
+        """
+        Assign one teacher to a group of the cluster's stored model
+        without refitting. Returns: dict with group label
+        """
+        model = self.models.get(cluster_id)
+        if model is None:
+            return {'error': 'No trained model for cluster, run cluster analysis first'}
         
-        modules = []
-        for gap in gap_areas:
-            modules.extend(module_map.get(gap, []))
+        assessment = db.get_teacher_assessments(teacher_id)
+        if not assessment:
+            return {'error': 'No assessment data found'}
         
-        return list(set(modules))  # Remove duplicates
+        label = model.predict(self._extract_features(assessment))
+        return {
+            'cluster_id': cluster_id,
+            'teacher_id': teacher_id,
+            'group': f'cluster_{label}',
+            'model_trained_at': model.trained_at
+        }
+    
+    def gap_key(self, teacher_id, assessment_id):
+        """One competency_gaps row per (teacher, assessment)"""
+        return idempotency_key('competency_gaps', teacher_id, assessment_id)
+    
+    def _extract_features(self, assessment):
+        """Convert assessment dict to feature vector"""
+        return np.array([assessment.get(f'{competency}_score', 0) for competency in COMPETENCIES])
 
-# Initialize analyzer
-analyzer = CompetencyAnalyzer(n_clusters=5)
+# Initialize analyzer on first use
+analyzer = LazyInstance(lambda: CompetencyAnalyzer(n_clusters=5), 'analyzer')
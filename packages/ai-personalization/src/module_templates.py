@@ -0,0 +1,183 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+from lazy import LazyInstance
+from llm_personalizer import personalizer
+from single_flight import SingleFlight
+from supabase_client import reference_data
+from training_assignment import build_cluster_context
+
+TEMPLATE_DIR = Path(os.getenv('MODULE_TEMPLATE_DIR', Path(__file__).parent.parent / 'templates'))
+# 'fill': placeholders only, no LLM call per teacher
+# 'intro': placeholders plus a short generated per-teacher opening
+TEMPLATE_MODE = os.getenv('MODULE_TEMPLATE_MODE', 'fill')
+TEMPLATE_VERSION = 1  # Bump when the template prompt changes
+
+PLACEHOLDERS = ('teacher_name', 'subject', 'experience', 'gap_areas')
+_PLACEHOLDER = re.compile(r'\{\{\s*([a-z_]+)\s*\}\}')
+
+
+def template_fingerprint(cluster_context, base_module):
+    """Changes whenever anything the template was generated from changes"""
+    source = {
+        'version': TEMPLATE_VERSION,
+        'cluster': cluster_context,
+        'module': {key: base_module.get(key) for key in ('id', 'title', 'competency_area', 'content')}
+    }
+    return hashlib.sha1(json.dumps(source, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def fill_template(content, teacher_profile):
+    """Substitute per-teacher details into a cluster template"""
+    values = {
+        'teacher_name': teacher_profile.get('name') or 'Teacher',
+        'subject': teacher_profile.get('subject') or 'your subject',
+        'experience': str(teacher_profile.get('experience') or 'several'),
+        'gap_areas': ', '.join(area.replace('_', ' ') for area in teacher_profile.get('gap_areas') or []) or 'your focus areas'
+    }
+    return _PLACEHOLDER.sub(lambda match: values.get(match.group(1), ''), content)
+
+
+class TemplateStore:
+    """
+    Cluster-level adapted modules, one per (cluster_id, module_id)
+
+    Cached in memory and persisted as JSON on local disk like the cluster
+    models. A template is regenerated when its fingerprint (cluster context,
+    module content, prompt version) no longer matches.
+    """
+
+    def __init__(self, template_dir=TEMPLATE_DIR):
+        self.template_dir = Path(template_dir)
+        self._templates = {}
+        self._lock = threading.Lock()
+        self._inflight = SingleFlight('template')
+
+    def _path(self, cluster_id, module_id):
+        safe_id = re.sub(r'[^A-Za-z0-9_.-]', '_', f'{cluster_id}__{module_id}')
+        return self.template_dir / f'template_{safe_id}.json'
+
+    def get(self, cluster_id, module_id, fingerprint=None):
+        """Stored template, or None if missing or stale"""
+        key = (cluster_id, module_id)
+        with self._lock:
+            template = self._templates.get(key)
+
+        if template is None:
+            path = self._path(cluster_id, module_id)
+            if not path.exists():
+                return None
+            try:
+                template = json.loads(path.read_text())
+            except Exception as e:
+                print(f"Error loading template {path}: {e}")
+                return None
+            with self._lock:
+                self._templates[key] = template
+
+        if fingerprint and template.get('fingerprint') != fingerprint:
+            return None
+        return template
+
+    def save(self, template):
+        """Persist atomically so concurrent readers never see a partial file"""
+        self.template_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(template['cluster_id'], template['module_id'])
+        tmp_path = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        tmp_path.write_text(json.dumps(template, ensure_ascii=False))
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._templates[(template['cluster_id'], template['module_id'])] = template
+
+    def get_or_create(self, cluster_id, cluster_context, base_module):
+        """Return the current template, generating it once on first demand"""
+        fingerprint = template_fingerprint(cluster_context, base_module)
+        template = self.get(cluster_id, base_module.get('id'), fingerprint)
+        if template is not None:
+            return template
+        # Concurrent first requests for the same template share one generation
+        return self._inflight.do(
+            (cluster_id, base_module.get('id'), fingerprint),
+            self._generate, cluster_id, cluster_context, base_module, fingerprint
+        )
+
+    def _generate(self, cluster_id, cluster_context, base_module, fingerprint):
+        content = personalizer.generate_module_template(base_module, cluster_context, PLACEHOLDERS)
+        template = {
+            'cluster_id': cluster_id,
+            'module_id': base_module.get('id'),
+            'module_title': base_module.get('title'),
+            'fingerprint': fingerprint,
+            'content': content,
+            'created_at': datetime.now(timezone.utc).isoformat()
+        }
+        self.save(template)
+        return template
+
+
+def personalize_from_template(base_module, teacher_profile, cluster_id, cluster_context, mode=None):
+    """
+    personalize_training_module-shaped result built from the cluster
+    template, with a short LLM call per teacher only in 'intro' mode
+    """
+    mode = mode or TEMPLATE_MODE
+    try:
+        template = template_store.get_or_create(cluster_id, cluster_context, base_module)
+    except Exception as e:
+        print(f"Template generation error: {e}")
+        return {
+            'success': False,
+            'error': str(e),
+            'personalized_content': base_module.get('content'),  # Fallback to base content
+            'estimated_duration': '10-15 minutes'
+        }
+
+    content = fill_template(template['content'], teacher_profile)
+    if mode == 'intro':
+        try:
+            content = personalizer.generate_teacher_intro(teacher_profile, base_module).strip() + '\n\n' + content
+        except Exception as e:
+            print(f"Intro generation error (using template only): {e}")
+
+    return {
+        'success': True,
+        'personalized_content': content,
+        'original_module_id': base_module.get('id'),
+        'estimated_duration': '10-15 minutes',
+        'adaptations_made': personalizer.adaptations_made(teacher_profile, cluster_context),
+        'template_created_at': template['created_at']
+    }
+
+
+def precompute_templates(cluster_ids=None):
+    """
+    Generate (or refresh stale) templates for every cluster x base module
+    Returns counts of generated, up-to-date and failed templates
+    """
+    snapshot = reference_data.snapshot()
+    clusters = snapshot['clusters']
+    modules = [module for group in snapshot['modules_by_competency'].values() for module in group]
+    counts = {'generated': 0, 'up_to_date': 0, 'failed': 0}
+
+    for cluster_id in cluster_ids or list(clusters):
+        cluster_context = build_cluster_context(clusters.get(cluster_id) or {})
+        for module in modules:
+            if template_store.get(cluster_id, module.get('id'), template_fingerprint(cluster_context, module)):
+                counts['up_to_date'] += 1
+                continue
+            try:
+                template_store.get_or_create(cluster_id, cluster_context, module)
+                counts['generated'] += 1
+            except Exception as e:
+                print(f"Template precompute error for {cluster_id}/{module.get('id')}: {e}")
+                counts['failed'] += 1
+    return counts
+
+
+template_store = LazyInstance(TemplateStore, 'template_store')
@@ -0,0 +1,246 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Tuple
+import numpy as np
+
+from issue_stats import normalize_issue
+
+# Cosine, below this a neighbour is ignored. Tuned on the labelled set in
+# benchmarks/calibrate_semantic.py, where 0.15-0.20 scores best; the lines in
+# tests/test_semantic_matcher.py are held out from tuning
+MIN_SIMILARITY = float(os.getenv('SEMANTIC_MIN_SIMILARITY', 0.2))
+NEIGHBOURS = int(os.getenv('SEMANTIC_NEIGHBOURS', 5))
+EMBEDDING_CACHE_SIZE = int(os.getenv('SEMANTIC_CACHE_SIZE', 20000))  # Feedback rows kept encoded
+N_FEATURES = 2 ** 18
+EXEMPLAR_WEIGHT = 0.8  # Confidence of the built-in exemplars, mapping rows carry their own
+SEMANTIC_VERSION = 3  # Bump when the encoder or the built-in exemplars change
+
+# Labelled example issues per competency, added to the issue_competency_mapping keywords
+DEFAULT_EXEMPLARS = {
+    'classroom_management': [
+        'students do not sit still',
+        'kids keep running around the classroom',
+        'children are noisy and talk during lessons',
+        'class is out of control',
+        'students fight with each other',
+        'pupils ignore instructions and misbehave',
+        'cannot keep discipline in class',
+        'too much noise in the classroom',
+        'बच्चे शोर करते हैं',
+        'कक्षा में अनुशासन नहीं है',
+    ],
+    'content_knowledge': [
+        'unsure about the subject content',
+        'cannot answer student questions about the topic',
+        'struggle to explain concepts correctly',
+        'weak understanding of the syllabus',
+        'made mistakes while solving problems on the board',
+        'need help with mathematics concepts',
+        'विषय की जानकारी कम है',
+    ],
+    'pedagogy': [
+        'lessons are only lecture and rote learning',
+        'students do not understand my explanations',
+        'do not know how to teach mixed ability classes',
+        'need new teaching methods',
+        'lesson planning takes too long',
+        'students cannot follow the lesson pace',
+        'पढ़ाने का तरीका समझ नहीं आता',
+    ],
+    'technology_usage': [
+        'do not know how to use the tablet',
+        'projector and smart board are difficult to use',
+        'cannot operate the computer',
+        'trouble with online classes and apps',
+        'internet and digital tools are confusing',
+        'मोबाइल ऐप चलाना नहीं आता',
+    ],
+    'student_engagement': [
+        'students are bored and not interested',
+        'kids do not participate in class',
+        'children are distracted and lose attention',
+        'low attendance and students skip school',
+        'students do not do their homework',
+        'pupils are unmotivated',
+        'बच्चे ध्यान नहीं देते',
+    ],
+}
+
+
+# Labelled issues that are not a teaching competency (infrastructure, pay,
+# administration). A competency only matches when it is more similar than all
+# of these, so "the classroom is too hot" does not count as classroom management
+OFF_TOPIC_EXEMPLARS = [
+    'classroom too hot, no fan',
+    'hot weather, heat in summer',
+    'classroom walls and windows broken',
+    'no lights or fans',
+    'roof leaking',
+    'no drinking water',
+    'toilets not working',
+    'power cut, no electricity',
+    'building repair needed',
+    'not enough desks and benches',
+    'salary delayed',
+    'transfer and posting orders',
+    'leave not approved',
+    'mid day meal',
+    'road and transport to school',
+    'school bus is late',
+    'need chalk, blackboard and stationery',
+    'paperwork and non teaching duties',
+    'election duty',
+    'स्कूल भवन की मरम्मत',
+    'कक्षा में गर्मी',
+    'वेतन नहीं मिला',
+    'बिजली और पानी की समस्या',
+    'स्कूल में पीने का पानी नहीं',
+]
+
+
+def _vectorizer():
+    """Stateless hashed character n-gram counts; tolerant of spelling and inflection"""
+    from sklearn.feature_extraction.text import HashingVectorizer
+    return HashingVectorizer(
+        analyzer='char_wb', ngram_range=(3, 5), n_features=N_FEATURES,
+        alternate_sign=False, norm=None, lowercase=False
+    )
+
+
+class EmbeddingCache:
+    """
+    LRU of raw hashed n-gram counts per feedback id
+
+    Counts do not depend on the exemplar set, so entries stay valid when
+    mappings are reloaded. The text hash guards against edited descriptions.
+    """
+
+    def __init__(self, max_entries=EMBEDDING_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, digest):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != digest:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, digest, counts):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (digest, counts)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class SemanticMatcher:
+    """
+    Nearest-neighbour matching of issue text against labelled exemplars
+
+    Exemplars (mapping keywords plus DEFAULT_EXEMPLARS) and the
+    OFF_TOPIC_EXEMPLARS are encoded once as hashed TF-IDF vectors and kept
+    as an L2-normalised sparse matrix. A query is one sparse product
+    against that matrix. The best neighbours above MIN_SIMILARITY that are
+    also more similar than every off-topic exemplar vote, each contributing
+    weight x similarity, and the highest value per competency is kept.
+    """
+
+    def __init__(self, mappings: List[Dict], exemplars: Dict[str, List[str]] = None, cache: EmbeddingCache = None,
+                 off_topic: List[str] = None):
+        from scipy import sparse
+
+        texts, self._labels, weights = [], [], []
+        for mapping in mappings:
+            texts.append(mapping['issue_keyword'])
+            self._labels.append(mapping['competency_area'])
+            weights.append(float(mapping['confidence_score']))
+        for competency, examples in (DEFAULT_EXEMPLARS if exemplars is None else exemplars).items():
+            for example in examples:
+                texts.append(example)
+                self._labels.append(competency)
+                weights.append(EXEMPLAR_WEIGHT)
+        for example in OFF_TOPIC_EXEMPLARS if off_topic is None else off_topic:
+            texts.append(example)
+            self._labels.append(None)
+            weights.append(0.0)
+
+        self._vectorizer = _vectorizer()
+        self.cache = cache or EmbeddingCache()
+        self._weights = np.asarray(weights, dtype=float)
+        self._off_topic = np.array([label is None for label in self._labels], dtype=bool)
+
+        counts = self._vectorizer.transform([normalize_issue(text) for text in texts]).tocsr()
+        # Smoothed IDF over the exemplars, so n-grams shared by many of them weigh less
+        document_frequency = np.bincount(counts.indices, minlength=N_FEATURES)
+        self._idf = np.log((1 + len(texts)) / (1 + document_frequency)) + 1
+        self._index = self._weigh(counts) if texts else sparse.csr_matrix((0, N_FEATURES))
+
+    def __len__(self):
+        return len(self._labels)
+
+    def _weigh(self, counts):
+        """Counts -> sublinear TF-IDF rows with unit length"""
+        from sklearn.preprocessing import normalize
+        weighted = counts.astype(float)
+        weighted.data = 1 + np.log(weighted.data)
+        return normalize(weighted.multiply(self._idf).tocsr())
+
+    def _counts(self, text: str, key=None):
+        text = normalize_issue(text)
+        if key is None:
+            return self._vectorizer.transform([text])
+        digest = hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest()
+        counts = self.cache.get(key, digest)
+        if counts is None:
+            counts = self._vectorizer.transform([text])
+            self.cache.put(key, digest, counts)
+        return counts
+
+    def _similarities(self, text: str, key=None):
+        return (self._index @ self._weigh(self._counts(text, key)).T).toarray().ravel()
+
+    def neighbours(self, text: str, key=None, k: int = NEIGHBOURS, similarities=None) -> List[Tuple[str, float, float]]:
+        """[(competency, similarity, weight)] of the k most similar exemplars; None for off-topic ones"""
+        if not len(self):
+            return []
+        if similarities is None:
+            similarities = self._similarities(text, key)
+        k = min(k, len(similarities))
+        best = np.argpartition(-similarities, k - 1)[:k]
+        best = best[np.argsort(-similarities[best])]
+        return [(self._labels[i], float(similarities[i]), float(self._weights[i])) for i in best]
+
+    def match(self, text: str, key=None) -> Dict[str, float]:
+        """
+        Confidence per competency for one issue; key (e.g. the feedback id)
+        lets repeat analyses reuse the cached encoding
+
+        Returns: {'competency_area': confidence_score}
+        """
+        matched = {}
+        if not len(self):
+            return matched
+        similarities = self._similarities(text, key)
+        off_topic = similarities[self._off_topic].max(initial=0.0)
+        for competency, similarity, weight in self.neighbours(text, similarities=similarities):
+            if similarity < MIN_SIMILARITY or similarity <= off_topic:
+                break  # Also stops at the first off-topic neighbour
+            confidence = round(weight * similarity, 3)
+            if confidence > matched.get(competency, 0):
+                matched[competency] = confidence
+        return matched
@@ -0,0 +1,359 @@
+"""
+Columnar snapshots of the service's Supabase tables for offline analytics
+
+    python snapshots.py export [--out DIR]    # stream tables to DIR/<table>.arrow
+    python snapshots.py info DIR
+
+Each table is written as an uncompressed Arrow IPC file, one record batch
+per fetched page, so memory stays at one page while exporting. SnapshotDB
+memory-maps those files and answers the analyzers' queries from them, so
+reanalyses and benchmarks run at disk speed without touching production.
+Set DATA_SNAPSHOT=DIR to run the whole service against a snapshot.
+"""
+import os
+import json
+import argparse
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+import numpy as np
+
+from assessment_store import AssessmentStore
+from supabase_client import (
+    SupabaseDB, TEACHER_COLUMNS, FEEDBACK_COLUMNS, ASSESSMENT_COLUMNS, IDEMPOTENCY_COLUMN, db
+)
+
+SNAPSHOT_DIR = Path(os.getenv('SNAPSHOT_DIR', Path(__file__).parent.parent / 'snapshots'))
+SNAPSHOT_VERSION = 2  # 2: teachers.experience_years
+
+# Large tables: streamed page by page with a fixed projection and schema
+STREAMED_TABLES = {
+    'teachers': TEACHER_COLUMNS,
+    'teacher_assessments': ASSESSMENT_COLUMNS,
+    'feedback': FEEDBACK_COLUMNS + ',cluster',
+}
+NUMERIC_COLUMNS = {column for column in ASSESSMENT_COLUMNS.split(',') if column.endswith('_score')}
+INTEGER_COLUMNS = {'experience_years'}
+# Small reference tables: read whole, schema inferred
+REFERENCE_TABLES = ('clusters', 'training_modules', 'issue_competency_mapping')
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute  # noqa: F401
+        import pyarrow.ipc  # noqa: F401
+        return pyarrow
+    except ImportError:
+        raise ImportError("Snapshots need pyarrow: pip install pyarrow") from None
+
+
+def _stream_schema(columns):
+    pa = _pyarrow()
+    return pa.schema([
+        (column, pa.float64() if column in NUMERIC_COLUMNS else pa.int64() if column in INTEGER_COLUMNS else pa.string())
+        for column in columns.split(',')
+    ])
+
+
+def _coerce(rows, schema):
+    """Match the fixed schema: ids and timestamps as text, scores as floats, counts as ints"""
+    def value(name, raw):
+        if raw is None:
+            return None
+        if name in NUMERIC_COLUMNS:
+            return float(raw)
+        return int(raw) if name in INTEGER_COLUMNS else str(raw)
+    return [{name: value(name, row.get(name)) for name in schema.names} for row in rows]
+
+
+def _write_stream(path, schema, rows, page_size):
+    """Write rows as one record batch per page; returns the row count"""
+    pa = _pyarrow()
+    tmp_path = path.with_suffix('.arrow.tmp')
+    count = 0
+    with pa.OSFile(str(tmp_path), 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+        page = []
+        for row in rows:
+            page.append(row)
+            if len(page) == page_size:
+                writer.write_batch(pa.RecordBatch.from_pylist(_coerce(page, schema), schema=schema))
+                count += len(page)
+                page = []
+        if page:
+            writer.write_batch(pa.RecordBatch.from_pylist(_coerce(page, schema), schema=schema))
+            count += len(page)
+    os.replace(tmp_path, path)
+    return count
+
+
+def _write_table(path, rows):
+    pa = _pyarrow()
+    table = pa.Table.from_pylist(rows)
+    tmp_path = path.with_suffix('.arrow.tmp')
+    with pa.OSFile(str(tmp_path), 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+    return table.num_rows
+
+
+def export_snapshot(out_dir=None, database=None, page_size=1000):
+    """
+    Dump the analysis tables to out_dir (default SNAPSHOT_DIR/<UTC time>)
+    Returns: the snapshot manifest
+    """
+    database = database or db
+    out_dir = Path(out_dir or SNAPSHOT_DIR / datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ'))
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest = {
+        'version': SNAPSHOT_VERSION,
+        'format': 'arrow-ipc',
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'tables': {}
+    }
+    for table, columns in STREAMED_TABLES.items():
+        rows = database.iter_table(table, columns=columns, page_size=page_size)
+        manifest['tables'][table] = _write_stream(out_dir / f'{table}.arrow', _stream_schema(columns), rows, page_size)
+        print(f"📦 {table}: {manifest['tables'][table]} rows")
+    for table in REFERENCE_TABLES:
+        manifest['tables'][table] = _write_table(out_dir / f'{table}.arrow', database.fetch_all(table, page_size=page_size))
+        print(f"📦 {table}: {manifest['tables'][table]} rows")
+
+    # Written last: a directory without a manifest is an unfinished export
+    (out_dir / 'manifest.json').write_text(json.dumps(manifest, indent=2))
+    manifest['path'] = str(out_dir)
+    return manifest
+
+
+class SnapshotDB(SupabaseDB):
+    """
+    SupabaseDB read API answered from a snapshot directory
+
+    Table files are memory-mapped on first use, so only the pages a query
+    touches are read from disk. Per-column row indexes (teacher_id, cluster,
+    id) are built once per table. Writes never leave the process: they are
+    collected in self.writes, and feedback aggregates are kept in memory.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        manifest_path = self.path / 'manifest.json'
+        if not manifest_path.exists():
+            raise FileNotFoundError(f"No snapshot manifest in {self.path}")
+        self.manifest = json.loads(manifest_path.read_text())
+        self.client = None
+        self.writes = {}
+        self._written_keys = {}  # table -> idempotency keys already in self.writes
+        self._keyless_tables = set()
+        self._aggregates = {}
+        self._tables = {}
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    # Storage -----------------------------------------------------------
+
+    def _table(self, name):
+        table = self._tables.get(name)
+        if table is None:
+            pa = _pyarrow()
+            path = self.path / f'{name}.arrow'
+            if not path.exists():
+                raise FileNotFoundError(f"Snapshot {self.path} has no {name} table")
+            # Uncompressed IPC reads zero-copy: columns point into the mapping
+            table = pa.ipc.open_file(pa.memory_map(str(path), 'r')).read_all()
+            self._tables[name] = table
+        return table
+
+    def _index(self, name, column):
+        """{value: row indices} for one column, built on first use"""
+        key = (name, column)
+        index = self._indexes.get(key)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(key)
+                if index is None:
+                    index = self._build_index(self._table(name).column(column))
+                    self._indexes[key] = index
+        return index
+
+    @staticmethod
+    def _build_index(column):
+        pa = _pyarrow()
+        encoded = pa.compute.dictionary_encode(column.combine_chunks())
+        codes = encoded.indices.fill_null(-1).to_numpy()  # Nulls sort first and match no value
+        # Group row numbers by code without a Python object per row
+        order = np.argsort(codes, kind='stable')
+        sorted_codes = codes[order]
+        values = encoded.dictionary.to_pylist()
+        starts = np.searchsorted(sorted_codes, np.arange(len(values)), side='left')
+        stops = np.searchsorted(sorted_codes, np.arange(len(values)), side='right')
+        return {value: order[start:stop] for value, start, stop in zip(values, starts, stops)}
+
+    def _select(self, name, column=None, values=None, columns='*', since=None, newest_first=False):
+        """Arrow table of the rows where column is in values and created_at > since (both optional)"""
+        pa = _pyarrow()
+        table = self._table(name)
+        if column is not None:
+            index = self._index(name, column)
+            parts = [index[value] for value in dict.fromkeys(values) if value in index]
+            table = table.take(pa.array(np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)))
+        if since:
+            table = table.filter(pa.compute.greater(table['created_at'], str(since)))
+        if newest_first:
+            table = table.sort_by([('created_at', 'descending'), ('id', 'descending')])
+        elif column is not None and 'id' in table.column_names:
+            table = table.sort_by('id')  # Whole tables are already stored in id order
+        if columns != '*':
+            table = table.select([c.strip() for c in columns.split(',') if c.strip() in table.column_names])
+        return table
+
+    @staticmethod
+    def _pages(table, page_size):
+        for batch in table.to_batches(max_chunksize=page_size):
+            yield from batch.to_pylist()
+
+    def _record(self, table, rows):
+        rows = rows if isinstance(rows, list) else [rows]
+        with self._lock:
+            self.writes.setdefault(table, []).extend(rows)
+        return rows
+
+    # Reads -------------------------------------------------------------
+
+    def ping(self):
+        self._table('teachers')
+
+    def iter_table(self, table, columns='*', page_size=1000):
+        return self._pages(self._select(table, columns=columns), page_size)
+
+    def fetch_all(self, table, page_size=1000):
+        return self._select(table).to_pylist()
+
+    def get_teacher_by_id(self, teacher_id, columns=TEACHER_COLUMNS):
+        rows = self._select('teachers', 'id', [teacher_id], columns).to_pylist()
+        return rows[0] if rows else None
+
+    def get_teachers_by_cluster(self, cluster_id, columns=TEACHER_COLUMNS, page_size=1000):
+        return self._select('teachers', 'cluster_id', [cluster_id], self._with_keys(columns, 'id')).to_pylist()
+
+    def get_teachers_by_ids(self, teacher_ids):
+        return {row['id']: row for row in self._select('teachers', 'id', teacher_ids, TEACHER_COLUMNS).to_pylist()}
+
+    def iter_teachers(self, cluster_ids=None, columns='id,cluster_id', page_size=1000):
+        columns = self._with_keys(columns, 'id')
+        if cluster_ids:
+            return self._pages(self._select('teachers', 'cluster_id', cluster_ids, columns), page_size)
+        return self._pages(self._select('teachers', columns=columns), page_size)
+
+    def get_teacher_assessments(self, teacher_id):
+        rows = self._select('teacher_assessments', 'teacher_id', [teacher_id], ASSESSMENT_COLUMNS, newest_first=True)
+        return rows.slice(0, 1).to_pylist()[0] if rows.num_rows else None
+
+    def load_latest_assessments(self, teacher_ids):
+        return AssessmentStore.from_rows(self._pages(
+            self._select('teacher_assessments', 'teacher_id', teacher_ids, ASSESSMENT_COLUMNS), 1000
+        ))
+
+    def get_latest_assessments_for_teachers(self, teacher_ids):
+        latest = {}
+        for row in self._select('teacher_assessments', 'teacher_id', teacher_ids, ASSESSMENT_COLUMNS, newest_first=True).to_pylist():
+            latest.setdefault(row['teacher_id'], row)
+        return latest
+
+    def get_feedback_for_teachers(self, teacher_ids, since=None):
+        feedback = {}
+        for row in self._select('feedback', 'teacher_id', teacher_ids, FEEDBACK_COLUMNS, since, newest_first=True).to_pylist():
+            feedback.setdefault(row['teacher_id'], []).append(row)
+        return feedback
+
+    def iter_teacher_feedback(self, teacher_id, since=None, columns=FEEDBACK_COLUMNS, page_size=1000):
+        columns = self._with_keys(columns, 'created_at')
+        return self._pages(self._select('feedback', 'teacher_id', [teacher_id], columns, since, newest_first=True), page_size)
+
+    def iter_cluster_feedback(self, cluster_id, columns=FEEDBACK_COLUMNS, since=None, page_size=1000):
+        columns = self._with_keys(columns, 'created_at')
+        return self._pages(self._select('feedback', 'cluster', [cluster_id], columns, since, newest_first=True), page_size)
+
+    def get_feedback_statuses(self, feedback_ids):
+        return {row['id']: row['status'] for row in self._select('feedback', 'id', feedback_ids, 'id,status').to_pylist()}
+
+    def get_base_training_module(self, module_id):
+        rows = self._select('training_modules', 'id', [module_id]).to_pylist()
+        return rows[0] if rows else None
+
+    def get_feedback_aggregate(self, teacher_id):
+        return self._aggregates.get(teacher_id)
+
+    def get_feedback_aggregates(self, teacher_ids):
+        return {teacher_id: self._aggregates[teacher_id] for teacher_id in teacher_ids if teacher_id in self._aggregates}
+
+    # Writes stay in memory ---------------------------------------------
+
+    def save_feedback_aggregate(self, aggregate):
+        self._aggregates[aggregate['teacher_id']] = json.loads(json.dumps(aggregate))
+        return [aggregate]
+
+    def save_feedback_aggregates(self, aggregates):
+        for aggregate in aggregates:
+            self.save_feedback_aggregate(aggregate)
+
+    def insert_rows(self, table, rows, chunk_size=500):
+        return self._record(table, rows)
+
+    def upsert_rows(self, table, rows, on_conflict, chunk_size=500):
+        return self._record(table, rows)
+
+    def save_keyed_rows(self, table, rows, chunk_size=500):
+        # Like the upsert with ignore_duplicates: a key already written is skipped
+        with self._lock:
+            written = self._written_keys.setdefault(table, set())
+            fresh = [row for row in rows if row.get(IDEMPOTENCY_COLUMN) not in written]
+            written.update(row.get(IDEMPOTENCY_COLUMN) for row in fresh)
+        return self._record(table, fresh)
+
+    def update_rows_by_id(self, table, values, ids, chunk_size=100):
+        self._record(f'{table}:updates', [{'id': row_id, **values} for row_id in ids])
+
+    def insert_personalized_training(self, payload, key=None):
+        if key:
+            return self.save_keyed_rows('personalized_training', [{**payload, IDEMPOTENCY_COLUMN: key}])
+        return self._record('personalized_training', payload)
+
+    def update_feedback_status(self, feedback_id, status):
+        self.update_rows_by_id('feedback', {'status': status}, [feedback_id])
+
+    def save_gap_analysis(self, teacher_id, gap_data, key=None):
+        row = self.gap_row(teacher_id, gap_data)
+        if key:
+            return self.save_keyed_rows('competency_gaps', [{**row, IDEMPOTENCY_COLUMN: key}])
+        return self._record('competency_gaps', row)
+
+    def save_personalized_training(self, teacher_id, module_id, personalized_content, metadata):
+        return self._record('personalized_training', {
+            'teacher_id': teacher_id,
+            'base_module_id': module_id,
+            'personalized_content': personalized_content,
+            'adaptation_metadata': metadata
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help='stream the Supabase tables to a new snapshot')
+    export.add_argument('--out', help=f'snapshot directory (default {SNAPSHOT_DIR}/<UTC time>)')
+    export.add_argument('--page-size', type=int, default=1000)
+    info = commands.add_parser('info', help='show a snapshot manifest')
+    info.add_argument('path')
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        manifest = export_snapshot(args.out, page_size=args.page_size)
+        print(f"✅ Snapshot written to {manifest['path']}")
+    else:
+        print(json.dumps(SnapshotDB(args.path).manifest, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,45 +1,158 @@
 import os
-from supabase import create_client, Client
+import json
+import time
+import hashlib
+import threading
 from dotenv import load_dotenv
 from pathlib import Path
+from lazy import LazyInstance
+from db_pool import PooledClient, create_pooled_client
+from assessment_store import AssessmentStore
 
 current_dir = Path(__file__).parent
 dotenv_path = current_dir.parent.parent.parent / '.env'
 load_dotenv(dotenv_path=dotenv_path)
 
+# Columns the service actually reads, instead of select('*')
+TEACHER_COLUMNS = 'id,name,subject,experience_years,cluster_id'
+FEEDBACK_COLUMNS = 'id,teacher_id,description,status,created_at'
+ASSESSMENT_COLUMNS = (
+    'id,teacher_id,created_at,classroom_management_score,content_knowledge_score,'
+    'pedagogy_score,technology_usage_score,student_engagement_score'
+)
+
+# Unique column added by migrations/002_idempotency_keys.sql
+IDEMPOTENCY_COLUMN = 'idempotency_key'
+# Postgres / PostgREST codes for an upsert against a table not yet migrated:
+# no unique constraint for ON CONFLICT, unknown column, column not in schema cache
+KEYLESS_ERROR_CODES = {'42P10', '42703', 'PGRST204'}
+
+def idempotency_key(table, *parts):
+    """Deterministic key for a logical write, e.g. (teacher_id, feedback_id)"""
+    source = json.dumps([table, *parts], sort_keys=True, default=str)
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+def _quote_filter_value(value):
+    """Double-quote a value inside a PostgREST or=() filter (timestamps contain : and .)"""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def _keyset_page(query, cursor, sort_column, descending, page_size):
+    """
+    One keyset page of query ordered by (sort_column, id), continuing after
+    cursor = (sort value, id) of the previous page's last row
+    """
+    op = 'lt' if descending else 'gt'
+    if cursor is not None:
+        if sort_column == 'id':
+            query = getattr(query, op)('id', cursor[1])
+        else:
+            value, last_id = (_quote_filter_value(v) for v in cursor)
+            query = query.or_(
+                f'{sort_column}.{op}.{value},and({sort_column}.eq.{value},id.{op}.{last_id})'
+            )
+    if sort_column != 'id':
+        query = query.order(sort_column, desc=descending)
+    return query.order('id', desc=descending).limit(page_size)
+
+
 class SupabaseDB:
-    def __init__(self):
-        url = os.getenv("SUPABASE_URL")
-        key = os.getenv("SUPABASE_KEY_PYTHON")  # CORRECTED
-        
-        if not url or not key:
-            raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set in .env file")
-        
-        self.client: Client = create_client(url, key)
+    """
+    Data access for the service. Every query goes through self.client, a
+    PooledClient that adds keep-alive pooling, timeouts and retries.
+    """
+    def __init__(self, client=None):
+        # An injected client (e.g. the benchmark fakes) skips env configuration
+        if client is None:
+            url = os.getenv("SUPABASE_URL")
+            key = os.getenv("SUPABASE_KEY_PYTHON")  # CORRECTED
+            
+            if not url or not key:
+                raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set in .env file")
+            
+            client = create_pooled_client(url, key)
+        self.client = client if isinstance(client, PooledClient) else PooledClient(client)
+        self._keyless_tables = set()  # Tables without the idempotency_key constraint
+    
+    def ping(self):
+        """Cheap round trip used by the readiness check (raises on failure)"""
+        self.client.table('clusters').select('id').limit(1).execute(timeout=2, retries=0)
+    
+    @staticmethod
+    def _with_keys(columns, sort_column):
+        """Make sure a projection includes the keyset columns"""
+        if columns == '*':
+            return columns
+        names = [c.strip() for c in columns.split(',')]
+        names += [key for key in (sort_column, 'id') if key not in names]
+        return ','.join(dict.fromkeys(names))
+    
+    def _keyset_rows(self, build_query, sort_column='id', descending=False, page_size=1000):
+        """
+        Yield rows of build_query() ordered by (sort_column, id), one page at
+        a time. Each page continues after the last row seen rather than using
+        OFFSET, so deep pages cost the same as the first and memory stays at
+        one page.
+        """
+        cursor = None
+        while True:
+            query = _keyset_page(build_query(), cursor, sort_column, descending, page_size)
+            rows = query.execute().data or []
+            
+            yield from rows
+            if len(rows) < page_size:
+                return
+            cursor = (rows[-1].get(sort_column), rows[-1]['id'])
     
-    def get_teacher_by_id(self, teacher_id):
+    def get_teacher_by_id(self, teacher_id, columns=TEACHER_COLUMNS):
         """Fetch teacher profile from Supabase"""
         try:
-            response = self.client.table('teachers').select('*').eq('id', teacher_id).execute()
+            response = self.client.table('teachers').select(columns).eq('id', teacher_id).execute()
             return response.data[0] if response.data else None
         except Exception as e:
             print(f"Error fetching teacher: {e}")
             return None
     
-    def get_teachers_by_cluster(self, cluster_id):
-        """Fetch all teachers in a cluster"""
+    def get_teachers_by_cluster(self, cluster_id, columns=TEACHER_COLUMNS, page_size=1000):
+        """Fetch all teachers in a cluster, paging by id past the API row limit"""
         try:
-            response = self.client.table('teachers').select('*').eq('cluster_id', cluster_id).execute()
-            return response.data
+            columns = self._with_keys(columns, 'id')
+            return list(self._keyset_rows(
+                lambda: self.client.table('teachers').select(columns).eq('cluster_id', cluster_id),
+                page_size=page_size
+            ))
         except Exception as e:
             print(f"Error fetching cluster teachers: {e}")
             return []
     
+    def iter_teachers(self, cluster_ids=None, columns='id,cluster_id', page_size=1000):
+        """
+        Yield teachers (optionally limited to some clusters) one page at a
+        time; a cluster filter is sent in chunks like every other in_ query
+        """
+        if cluster_ids:
+            return self._fetch_in_chunks('teachers', 'cluster_id', cluster_ids, columns=columns, page_size=page_size)
+        columns = self._with_keys(columns, 'id')
+        return self._keyset_rows(lambda: self.client.table('teachers').select(columns), page_size=page_size)
+    
+    def iter_teacher_id_pages(self, cluster_ids=None, page_size=1000):
+        """
+        Yield pages of teacher ids (optionally limited to some clusters),
+        so memory stays bounded for very large groupings
+        """
+        page = []
+        for teacher in self.iter_teachers(cluster_ids, columns='id', page_size=page_size):
+            page.append(teacher['id'])
+            if len(page) == page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+    
     def get_teacher_assessments(self, teacher_id):
         """Fetch teacher's competency assessment scores"""
         try:
             response = self.client.table('teacher_assessments')\
-                .select('*')\
+                .select(ASSESSMENT_COLUMNS)\
                 .eq('teacher_id', teacher_id)\
                 .order('created_at', desc=True)\
                 .limit(1)\
@@ -49,16 +162,115 @@ class SupabaseDB:
             print(f"Error fetching assessments: {e}")
             return None
     
-    def save_gap_analysis(self, teacher_id, gap_data):
-        """Save ML-generated gap analysis"""
+    def _fetch_in_chunks(self, table, column, values, columns='*', order_by=None, chunk_size=100, page_size=1000,
+                         since=None):
+        """
+        Yield rows whose column is in values (and created after `since`),
+        chunking the in_ filter (to stay within URL length limits) and
+        keyset-paging each chunk, newest first when order_by is given
+        """
+        values = list(dict.fromkeys(v for v in values if v is not None))
+        columns = self._with_keys(columns, order_by or 'id')
+        
+        def build_query(chunk):
+            query = self.client.table(table).select(columns).in_(column, chunk)
+            return query.gt('created_at', since) if since else query
+        
+        for i in range(0, len(values), chunk_size):
+            chunk = values[i:i + chunk_size]
+            yield from self._keyset_rows(
+                lambda: build_query(chunk),
+                sort_column=order_by or 'id',
+                descending=bool(order_by),
+                page_size=page_size
+            )
+    
+    def get_latest_assessments_for_teachers(self, teacher_ids):
+        """
+        Fetch the latest competency assessment for many teachers at once
+        Returns: dict of teacher_id -> newest assessment row
+        """
+        latest = {}
         try:
-            data = {
-                'teacher_id': teacher_id,
-                'gap_areas': gap_data['gap_areas'],
-                'priority_level': gap_data['priority'],
-                'recommended_modules': gap_data['recommended_modules'],
-                'cluster_assignment': gap_data.get('cluster_label')
-            }
+            # Rows arrive newest first per chunk, so the first row seen per teacher wins
+            for row in self._fetch_in_chunks(
+                'teacher_assessments', 'teacher_id', teacher_ids, columns=ASSESSMENT_COLUMNS, order_by='created_at'
+            ):
+                latest.setdefault(row['teacher_id'], row)
+        except Exception as e:
+            print(f"Error fetching bulk assessments: {e}")
+        return latest
+    
+    def load_latest_assessments(self, teacher_ids):
+        """
+        Latest assessment for many teachers as a compact AssessmentStore,
+        filled while pages stream in instead of keeping every row dict
+        """
+        try:
+            return AssessmentStore.from_rows(self._fetch_in_chunks(
+                'teacher_assessments', 'teacher_id', teacher_ids, columns=ASSESSMENT_COLUMNS, order_by='created_at'
+            ))
+        except Exception as e:
+            print(f"Error fetching bulk assessments: {e}")
+            return AssessmentStore()
+    
+    def get_teachers_by_ids(self, teacher_ids):
+        """Fetch many teacher profiles, returns dict of teacher_id -> teacher"""
+        try:
+            return {row['id']: row for row in self._fetch_in_chunks('teachers', 'id', teacher_ids, columns=TEACHER_COLUMNS)}
+        except Exception as e:
+            print(f"Error fetching teachers: {e}")
+            return {}
+    
+    def iter_table(self, table, columns='*', page_size=1000):
+        """Yield every row of a table in id order, one keyset page at a time"""
+        columns = self._with_keys(columns, 'id')
+        return self._keyset_rows(lambda: self.client.table(table).select(columns), page_size=page_size)
+    
+    def fetch_all(self, table, page_size=1000):
+        """Fetch every row of a (small) table, paging past the API row limit"""
+        rows = []
+        offset = 0
+        while True:
+            response = self.client.table(table)\
+                .select('*')\
+                .order('id')\
+                .range(offset, offset + page_size - 1)\
+                .execute()
+            page = response.data or []
+            rows.extend(page)
+            if len(page) < page_size:
+                return rows
+            offset += page_size
+    
+    def get_feedback_for_teachers(self, teacher_ids, since=None):
+        """
+        Fetch feedback for many teachers, optionally only rows created after
+        `since`, returns dict of teacher_id -> rows (newest first)
+        """
+        feedback = {}
+        for row in self._fetch_in_chunks('feedback', 'teacher_id', teacher_ids, columns=FEEDBACK_COLUMNS,
+                                         order_by='created_at', since=since):
+            feedback.setdefault(row['teacher_id'], []).append(row)
+        return feedback
+    
+    @staticmethod
+    def gap_row(teacher_id, gap_data):
+        """competency_gaps row for a gap analysis result"""
+        return {
+            'teacher_id': teacher_id,
+            'gap_areas': gap_data['gap_areas'],
+            'priority_level': gap_data['priority'],
+            'recommended_modules': gap_data['recommended_modules'],
+            'cluster_assignment': gap_data.get('cluster_label')
+        }
+    
+    def save_gap_analysis(self, teacher_id, gap_data, key=None):
+        """Save ML-generated gap analysis; with a key, at most once per key"""
+        try:
+            data = self.gap_row(teacher_id, gap_data)
+            if key:
+                return self.save_keyed_rows('competency_gaps', [{**data, IDEMPOTENCY_COLUMN: key}])
             response = self.client.table('competency_gaps').insert(data).execute()
             return response.data
         except Exception as e:
@@ -91,5 +303,233 @@ class SupabaseDB:
             print(f"Error saving personalized training: {e}")
             return None
 
-# Initialize global instance
-db = SupabaseDB()
+    def iter_teacher_feedback(self, teacher_id, since=None, columns=FEEDBACK_COLUMNS, page_size=1000):
+        """
+        Yield a teacher's feedback newest first, optionally only rows
+        created after `since` (raises on failure while iterating)
+        """
+        columns = self._with_keys(columns, 'created_at')
+        
+        def build_query():
+            query = self.client.table('feedback').select(columns).eq('teacher_id', teacher_id)
+            return query.gt('created_at', since) if since else query
+        
+        return self._keyset_rows(build_query, sort_column='created_at', descending=True, page_size=page_size)
+    
+    def get_teacher_feedback(self, teacher_id, since=None, columns=FEEDBACK_COLUMNS):
+        """List form of iter_teacher_feedback (raises on failure)"""
+        return list(self.iter_teacher_feedback(teacher_id, since=since, columns=columns))
+    
+    def iter_cluster_feedback(self, cluster_id, columns=FEEDBACK_COLUMNS, since=None, page_size=1000):
+        """
+        Yield the feedback filed in a cluster newest first, a page at a time,
+        so large clusters are scanned in constant memory (raises on failure)
+        """
+        columns = self._with_keys(columns, 'created_at')
+        
+        def build_query():
+            query = self.client.table('feedback').select(columns).eq('cluster', cluster_id)
+            return query.gt('created_at', since) if since else query
+        
+        return self._keyset_rows(build_query, sort_column='created_at', descending=True, page_size=page_size)
+    
+    def get_feedback_statuses(self, feedback_ids):
+        """Fetch current status for feedback rows, returns dict of id -> status"""
+        try:
+            return {row['id']: row['status'] for row in self._fetch_in_chunks('feedback', 'id', feedback_ids, columns='id,status')}
+        except Exception as e:
+            print(f"Error fetching feedback statuses: {e}")
+            return {}
+    
+    def get_feedback_aggregate(self, teacher_id):
+        """Fetch a teacher's persisted feedback-gap aggregate"""
+        try:
+            response = self.client.table('teacher_feedback_aggregates')\
+                .select('*')\
+                .eq('teacher_id', teacher_id)\
+                .execute()
+            return response.data[0] if response.data else None
+        except Exception as e:
+            print(f"Error fetching feedback aggregate: {e}")
+            return None
+    
+    def get_feedback_aggregates(self, teacher_ids, chunk_size=100):
+        """Fetch persisted aggregates for many teachers, returns dict of teacher_id -> aggregate"""
+        teacher_ids = list(dict.fromkeys(teacher_ids))
+        aggregates = {}
+        try:
+            # One row per teacher, so a chunk never needs paging
+            for i in range(0, len(teacher_ids), chunk_size):
+                response = self.client.table('teacher_feedback_aggregates')\
+                    .select('*')\
+                    .in_('teacher_id', teacher_ids[i:i + chunk_size])\
+                    .execute()
+                aggregates.update((row['teacher_id'], row) for row in response.data or [])
+        except Exception as e:
+            print(f"Error fetching feedback aggregates: {e}")
+        return aggregates
+    
+    def save_feedback_aggregates(self, aggregates, chunk_size=500):
+        """Upsert many teachers' aggregates in multi-row requests"""
+        try:
+            for i in range(0, len(aggregates), chunk_size):
+                self.client.table('teacher_feedback_aggregates')\
+                    .upsert(aggregates[i:i + chunk_size], on_conflict='teacher_id')\
+                    .execute()
+        except Exception as e:
+            print(f"Error saving feedback aggregates: {e}")
+    
+    def save_feedback_aggregate(self, aggregate):
+        """Upsert a teacher's feedback-gap aggregate (one row per teacher_id)"""
+        try:
+            response = self.client.table('teacher_feedback_aggregates')\
+                .upsert(aggregate, on_conflict='teacher_id')\
+                .execute()
+            return response.data
+        except Exception as e:
+            print(f"Error saving feedback aggregate: {e}")
+            return None
+    
+    def insert_rows(self, table, rows, chunk_size=500):
+        """Multi-row inserts, chunk_size rows per request (raises on failure)"""
+        saved = []
+        for i in range(0, len(rows), chunk_size):
+            response = self.client.table(table).insert(rows[i:i + chunk_size]).execute()
+            saved.extend(response.data or [])
+        return saved
+    
+    def upsert_rows(self, table, rows, on_conflict, chunk_size=500):
+        """
+        Multi-row inserts that skip rows whose on_conflict key already
+        exists, so repeating a write is safe (raises on failure)
+        """
+        saved = []
+        for i in range(0, len(rows), chunk_size):
+            response = self.client.table(table)\
+                .upsert(rows[i:i + chunk_size], on_conflict=on_conflict, ignore_duplicates=True)\
+                .execute()
+            saved.extend(response.data or [])
+        return saved
+    
+    def update_rows_by_id(self, table, values, ids, chunk_size=100):
+        """Apply the same column values to many rows by id (raises on failure)"""
+        ids = list(dict.fromkeys(ids))
+        for i in range(0, len(ids), chunk_size):
+            self.client.table(table).update(values).in_('id', ids[i:i + chunk_size]).execute()
+    
+    def save_keyed_rows(self, table, rows, chunk_size=500):
+        """
+        Insert rows that carry an idempotency_key, skipping keys already
+        written, so a retried request never duplicates a row (raises on
+        failure). Tables without the key constraint get plain inserts.
+        """
+        if table not in self._keyless_tables:
+            try:
+                return self.upsert_rows(table, rows, on_conflict=IDEMPOTENCY_COLUMN, chunk_size=chunk_size)
+            except Exception as e:
+                if getattr(e, 'code', None) not in KEYLESS_ERROR_CODES:
+                    raise
+                print(f"⚠️ {table} has no unique {IDEMPOTENCY_COLUMN} ({e.code}), writing without idempotency keys; "
+                      f"apply migrations/002_idempotency_keys.sql")
+                self._keyless_tables.add(table)
+        return self.insert_rows(table, [
+            {column: value for column, value in row.items() if column != IDEMPOTENCY_COLUMN} for row in rows
+        ], chunk_size=chunk_size)
+    
+    def insert_personalized_training(self, payload, key=None):
+        """Insert one prepared personalized_training row, keyed if given (raises on failure)"""
+        if key:
+            return self.save_keyed_rows('personalized_training', [{**payload, IDEMPOTENCY_COLUMN: key}])
+        return self.client.table('personalized_training').insert(payload).execute().data
+    
+    def update_feedback_status(self, feedback_id, status):
+        """Set one feedback row's status (raises on failure)"""
+        self.client.table('feedback').update({'status': status}).eq('id', feedback_id).execute()
+
+class ReferenceCache:
+    """
+    In-process snapshot of the small reference tables: clusters,
+    training_modules and issue_competency_mapping
+    
+    Lookups are plain dict reads. A stale snapshot keeps serving while one
+    background thread reloads it, and the new snapshot replaces the old one
+    in a single assignment so readers never see partial data.
+    """
+    
+    def __init__(self, database, ttl_seconds=None):
+        self._db = database
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv('REFERENCE_CACHE_TTL', 300))
+        self._snapshot = None
+        self._refresh_lock = threading.Lock()
+    
+    def _load(self):
+        """Build a complete new snapshot from Supabase"""
+        modules_by_competency = {}
+        for module in self._db.fetch_all('training_modules'):
+            modules_by_competency.setdefault(module.get('competency_area'), []).append(module)
+        
+        return {
+            'loaded_at': time.monotonic(),
+            'clusters': {cluster['id']: cluster for cluster in self._db.fetch_all('clusters')},
+            'modules_by_competency': modules_by_competency,
+            'mappings': self._db.fetch_all('issue_competency_mapping')
+        }
+    
+    def refresh(self):
+        """Reload now (blocking); keeps the old snapshot if loading fails"""
+        with self._refresh_lock:
+            try:
+                self._snapshot = self._load()
+            except Exception as e:
+                print(f"Error refreshing reference data: {e}")
+        return self._snapshot
+    
+    def _background_refresh(self):
+        if not self._refresh_lock.acquire(blocking=False):
+            return  # Another thread is already refreshing
+        
+        def run():
+            try:
+                self._snapshot = self._load()
+            except Exception as e:
+                print(f"Error refreshing reference data: {e}")
+            finally:
+                self._refresh_lock.release()
+        
+        threading.Thread(target=run, daemon=True).start()
+    
+    def snapshot(self):
+        """Current snapshot; only the very first load blocks"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self.refresh()
+            if snapshot is None:
+                return {'loaded_at': 0, 'clusters': {}, 'modules_by_competency': {}, 'mappings': []}
+        elif time.monotonic() - snapshot['loaded_at'] > self.ttl_seconds:
+            self._background_refresh()
+        return snapshot
+    
+    def get_cluster(self, cluster_id):
+        """Cluster row by id, or None"""
+        return self.snapshot()['clusters'].get(cluster_id)
+    
+    def get_module_for_competency(self, competency_area):
+        """First training module for a competency area, or None"""
+        modules = self.snapshot()['modules_by_competency'].get(competency_area)
+        return modules[0] if modules else None
+    
+    def get_mappings(self):
+        """issue_competency_mapping rows (same list object until the next refresh)"""
+        return self.snapshot()['mappings']
+
+def _default_db():
+    """Live Supabase, or a local snapshot directory when DATA_SNAPSHOT is set"""
+    snapshot = os.getenv('DATA_SNAPSHOT')
+    if snapshot:
+        from snapshots import SnapshotDB
+        return SnapshotDB(snapshot)
+    return SupabaseDB()
+
+# Global instances, built on first use
+db = LazyInstance(_default_db, 'db')
+reference_data = LazyInstance(lambda: ReferenceCache(db), 'reference_data')
@@ -0,0 +1,255 @@
+import os
+import time
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Iterator
+from supabase_client import db, reference_data
+from bulk_writer import BulkWriter, idempotency_key
+from metrics import stage, record_stage_error
+from llm_personalizer import personalizer
+from feedback_analyzer import feedback_analyzer
+
+DEFAULT_GAP = 'classroom_management'
+MAX_BATCH_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 500))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', 8))
+GENERATION_TIMEOUT = float(os.getenv('BATCH_GENERATION_TIMEOUT', 30))
+DEADLINE_GRACE = 1.0  # Seconds past the request deadline before the batch stops waiting
+
+
+def default_module():
+    """Placeholder module used when no module exists for a competency"""
+    return {'id': 'default', 'title': 'General Pedagogy', 'description': 'Basics'}
+
+
+def build_cluster_context(cluster_data: Dict) -> Dict:
+    """Cluster context passed to personalization"""
+    return {
+        'location': cluster_data.get('location', 'Rural India'),
+        'common_issues': 'general challenges',
+        'language': 'Hindi'
+    }
+
+
+def training_payload(teacher_id: str, feedback_id: str, base_module: Dict, personalized_text: str) -> Dict:
+    """personalized_training row linked back to the feedback that triggered it"""
+    return {
+        "teacher_id": teacher_id,
+        "training_module": base_module['title'],  # The name of the module
+        "content": personalized_text,
+        "status": "assigned",
+        "feedback_id": feedback_id,
+        "completion_percentage": 0
+    }
+
+
+def training_key(teacher_id: str, feedback_id: str, base_module: Dict) -> str:
+    """One personalized_training row per (teacher, triggering feedback, module)"""
+    return idempotency_key('personalized_training', teacher_id, feedback_id, base_module.get('id'))
+
+
+def assign_training(teacher_id, feedback_id, allow_fallback=True, raise_on_save_error=False):
+    """
+    Analyze, generate and save one training assignment for the
+    /api/feedback-to-training route; returns (body, status)
+    The job worker turns off the LLM fallback and save-error swallowing so
+    those failures are retried instead
+    """
+    # 1. Analyze feedback
+    print(f"Analyzing feedback for teacher: {teacher_id}")
+    with stage('feedback_analysis'):
+        feedback_analysis = feedback_analyzer.analyze_teacher_feedback(teacher_id)
+    if 'error' in feedback_analysis:
+        record_stage_error('feedback_analysis')
+    inferred_gaps = feedback_analysis.get('inferred_gaps', [])
+
+    if not inferred_gaps:
+        # Fallback if no gaps found
+        inferred_gaps = [DEFAULT_GAP]
+
+    # 2. Get teacher
+    with stage('teacher_fetch'):
+        teacher = db.get_teacher_by_id(teacher_id)
+    if not teacher:
+        return {'error': 'Teacher not found'}, 404
+
+    # 3. Get cluster context
+    with stage('cluster_fetch'):
+        cluster_id = teacher.get('cluster_id')
+        cluster_data = reference_data.get_cluster(cluster_id) or {}
+
+        cluster_context = build_cluster_context(cluster_data)
+
+    # 4. Get base training module
+    with stage('module_fetch'):
+        base_module = reference_data.get_module_for_competency(inferred_gaps[0]) or default_module()
+
+    # 5. Generate personalized training
+    print("Generating personalized content with AI...")
+    with stage('llm_generation'):
+        personalized_text = personalizer.generate_assignment_message(
+            teacher, inferred_gaps[0], base_module, fallback=allow_fallback
+        )
+
+    # ==========================================
+    # 6. SAVE TO DATABASE (THE FIX)
+    # ==========================================
+    print("Saving to database...")
+    with stage('training_insert'):
+        try:
+            # Insert the prepared row so feedback_id is included; the key
+            # keeps a retried request or job from duplicating the row
+            payload = training_payload(teacher_id, feedback_id, base_module, personalized_text)
+            db.insert_personalized_training(payload, key=training_key(teacher_id, feedback_id, base_module))
+            print("✅ Saved to personalized_training with feedback_id link!")
+
+        except Exception as e:
+            record_stage_error('training_insert')
+            print(f"Database save error: {e}")
+            traceback.print_exc()
+            if raise_on_save_error:
+                raise
+
+    # 7. Update feedback status
+    with stage('feedback_update'):
+        try:
+            db.update_feedback_status(feedback_id, 'training_assigned')
+        except Exception as e:
+            record_stage_error('feedback_update')
+            print(f"Feedback update error: {e}")
+            if raise_on_save_error:
+                raise
+
+    print("=== FEEDBACK TO TRAINING COMPLETE ===\n")
+
+    return {
+        'success': True,
+        'assigned_module': base_module['title'],
+        'personalized_message': personalized_text
+    }, 200
+
+
+def assign_training_batch(items: List[Dict], concurrency=BATCH_CONCURRENCY,
+                          timeout=GENERATION_TIMEOUT) -> Iterator[Dict]:
+    """
+    Assign training for many (teacher_id, feedback_id) pairs
+
+    Feedback and teachers are prefetched in bulk and modules come from the
+    reference cache. Messages are generated on a bounded thread pool and
+    rows are written in bulk as they accumulate, with a final synchronous
+    flush. Each generation has a request deadline of `timeout` seconds;
+    a failed or late one is assigned the fallback message. Yields one
+    result per item as it completes, then a summary.
+    """
+    teacher_ids = list(dict.fromkeys(item['teacher_id'] for item in items))
+
+    # 1. Prefetch everything the generations need
+    analyses = feedback_analyzer.analyze_teachers_feedback_bulk(teacher_ids)
+    teachers = db.get_teachers_by_ids(teacher_ids)
+
+    gaps = {
+        teacher_id: (analyses.get(teacher_id, {}).get('inferred_gaps') or [DEFAULT_GAP])[0]
+        for teacher_id in teacher_ids
+    }
+    modules = {gap: reference_data.get_module_for_competency(gap) for gap in set(gaps.values())}
+
+    writer = BulkWriter(db)
+    succeeded = 0
+    failed = 0
+
+    def record(index, item, base_module, text, timed_out=False, error=None):
+        nonlocal succeeded
+        succeeded += 1
+        writer.add(
+            'personalized_training',
+            training_payload(item['teacher_id'], item['feedback_id'], base_module, text),
+            key=training_key(item['teacher_id'], item['feedback_id'], base_module)
+        )
+        writer.update('feedback', item['feedback_id'], {'status': 'training_assigned'})
+        return {
+            'index': index,
+            'teacher_id': item['teacher_id'],
+            'feedback_id': item['feedback_id'],
+            'success': True,
+            'assigned_module': base_module['title'],
+            'personalized_message': text,
+            'timed_out': timed_out,
+            **({'generation_error': error} if error else {})
+        }
+
+    # 2. Fan generations out over a bounded pool
+    started = {}
+    lock = threading.Lock()
+
+    def generate(index, teacher, gap, base_module):
+        with lock:
+            started[index] = time.monotonic()
+        # The request deadline frees this worker; failures surface in the loop below
+        return personalizer.generate_assignment_message(teacher, gap, base_module, fallback=False, timeout=timeout)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    pending = {}
+
+    try:
+        for index, item in enumerate(items):
+            teacher = teachers.get(item['teacher_id'])
+            if not teacher:
+                failed += 1
+                yield {
+                    'index': index,
+                    'teacher_id': item['teacher_id'],
+                    'feedback_id': item['feedback_id'],
+                    'success': False,
+                    'error': 'Teacher not found'
+                }
+                continue
+
+            gap = gaps[item['teacher_id']]
+            base_module = modules.get(gap) or default_module()
+            future = executor.submit(generate, index, teacher, gap, base_module)
+            pending[future] = (index, item, base_module)
+
+        while pending:
+            done, _ = wait(pending, timeout=min(1.0, timeout), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                index, item, base_module = pending.pop(future)
+                try:
+                    text = future.result()
+                except Exception as e:
+                    # One failed generation gets the fixed message, the rest of the batch carries on
+                    print(f"AI Error for feedback {item['feedback_id']} (using fallback): {e}")
+                    with lock:
+                        timed_out = time.monotonic() - started[index] >= timeout
+                    fallback = personalizer.fallback_assignment_message(base_module)
+                    yield record(index, item, base_module, fallback, timed_out=timed_out, error=str(e))
+                    continue
+                yield record(index, item, base_module, text)
+
+            # Backstop for a client that overruns its deadline (e.g. internal
+            # retries): answer with the fallback now and leave the call running
+            now = time.monotonic()
+            with lock:
+                expired = [
+                    future for future, (index, _, _) in pending.items()
+                    if index in started and now - started[index] > timeout + DEADLINE_GRACE
+                ]
+            for future in expired:
+                index, item, base_module = pending.pop(future)
+                fallback = personalizer.fallback_assignment_message(base_module)
+                yield record(index, item, base_module, fallback, timed_out=True)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        # 3. Write whatever is buffered, also when the caller stops early
+        unsaved = writer.close()
+
+    summary = {
+        'done': True,
+        'total': len(items),
+        'succeeded': succeeded,
+        'failed': failed,
+        'saved': writer.stats['rows']
+    }
+    if unsaved:
+        summary['error'] = f"{unsaved} writes failed"
+    yield summary
@@ -0,0 +1,47 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'src'))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+from fakes import FakeSupabaseClient  # noqa: E402
+from synthetic import generate_tables  # noqa: E402
+
+
+@pytest.fixture
+def tables():
+    """Small deterministic data set (100 feedback rows, 10 teachers)"""
+    return generate_tables(100, n_clusters=2, extra_keywords=20)
+
+
+@pytest.fixture
+def service(tmp_path):
+    """
+    Point every service singleton at in-process fakes
+    Call with the tables to serve; returns (fake client, fake model)
+    """
+    from run_benchmarks import install_fakes
+    from job_queue import JobQueue, job_queue
+
+    queues = []
+
+    def install(tables, db_latency=0.0, llm_latency=0.0):
+        queue = JobQueue(path=str(tmp_path / 'jobs.sqlite3'), workers=1, backoff_seconds=0.01)
+        queues.append(queue)
+        job_queue.override(queue)
+        return install_fakes(tables, db_latency, llm_latency, str(tmp_path / 'models'))
+
+    yield install
+    for queue in queues:
+        queue.stop()
+
+
+@pytest.fixture
+def fake_db():
+    """SupabaseDB over an empty fake client; fill client.tables directly"""
+    from supabase_client import SupabaseDB
+    client = FakeSupabaseClient()
+    return SupabaseDB(client=client), client
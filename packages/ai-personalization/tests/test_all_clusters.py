@@ -0,0 +1,37 @@
+import os
+
+from fakes import FakeQuery
+
+
+def test_skips_teachers_without_a_cluster(service, tables, tmp_path):
+    for teacher in tables['teachers'][:3]:
+        teacher['cluster_id'] = None
+    service(tables)
+    from ml_engine import analyzer
+
+    report = analyzer.analyze_all_clusters(workers=1)
+
+    assert None not in report['clusters'] and None not in report['skipped']
+    assert report['total_teachers'] == len(tables['teachers']) - 3
+    assert not os.path.exists(tmp_path / 'models' / 'cluster_None.json')
+
+
+def test_cluster_filter_is_chunked(service, tables, monkeypatch):
+    service(tables)
+    from ml_engine import analyzer
+
+    sizes = []
+    in_ = FakeQuery.in_
+
+    def recording_in(self, column, values):
+        values = list(values)
+        sizes.append(len(values))
+        return in_(self, column, values)
+
+    monkeypatch.setattr(FakeQuery, 'in_', recording_in)
+    cluster_ids = [cluster['id'] for cluster in tables['clusters']] + [f'missing-{i}' for i in range(450)]
+
+    report = analyzer.analyze_all_clusters(cluster_ids, workers=1)
+
+    assert max(sizes) <= 100
+    assert report['total_teachers'] == len(tables['teachers'])
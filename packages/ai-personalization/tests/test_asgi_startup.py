@@ -0,0 +1,31 @@
+import asyncio
+import threading
+
+
+def test_startup_loads_singletons_off_the_event_loop(service, tables, monkeypatch):
+    client, _ = service(tables)
+    from supabase_client import ReferenceCache, db, reference_data
+    from feedback_analyzer import feedback_analyzer
+    from job_queue import job_queue
+    import asgi_app
+
+    # As in a fresh process: nothing loaded or built yet
+    reference_data.override(ReferenceCache(db))
+    feedback_analyzer.override(None)
+    loaded_on = []
+    load = ReferenceCache._load
+    monkeypatch.setattr(ReferenceCache, '_load', lambda self: loaded_on.append(threading.current_thread()) or load(self))
+
+    async def start():
+        await asgi_app.app.startup()
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(start())
+
+    assert loaded_on and loop_thread not in loaded_on
+    assert feedback_analyzer.initialized
+    assert job_queue._threads
+    requests = client.request_count
+    reference_data.get_module_for_competency('pedagogy')
+    assert client.request_count == requests
+
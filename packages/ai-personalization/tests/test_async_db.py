@@ -0,0 +1,104 @@
+import asyncio
+import threading
+
+import pytest
+
+from fakes import FakeSupabaseClient
+
+
+def async_fake(**kwargs):
+    from async_supabase_client import AsyncSupabaseDB
+    client = FakeSupabaseClient(**kwargs)
+    return AsyncSupabaseDB(client=client.async_client()), client
+
+
+def test_teacher_projection_leaves_out_credentials():
+    db, client = async_fake()
+    client.table('teachers').insert({
+        'id': 't-1', 'name': 'A', 'subject': 'Math', 'experience_years': 4,
+        'cluster_id': 'c-1', 'password_hash': 'secret'
+    }).execute()
+
+    teacher = asyncio.run(db.get_teacher_by_id('t-1'))
+
+    assert teacher['experience_years'] == 4
+    assert 'password_hash' not in teacher
+
+
+def test_feedback_pages_past_the_row_cap_across_equal_timestamps():
+    db, client = async_fake(max_rows=2)
+    client.table('feedback').insert([
+        {'id': f'f-{i}', 'teacher_id': 't-1', 'description': 'noise', 'status': 'open',
+         'created_at': '2025-03-01T10:00:00' if i < 4 else f'2025-03-0{i}T10:00:00'}
+        for i in range(7)
+    ]).execute()
+
+    rows = asyncio.run(db.get_teacher_feedback('t-1', page_size=2))
+    since = asyncio.run(db.get_teacher_feedback('t-1', since='2025-03-04T10:00:00', page_size=2))
+
+    assert sorted(row['id'] for row in rows) == [f'f-{i}' for i in range(7)]
+    assert [row['id'] for row in since] == ['f-6', 'f-5']
+
+
+def test_timeouts_retry_reads_but_not_inserts():
+    from db_pool import AsyncPooledClient
+    client = FakeSupabaseClient(latency=0.05)
+    pooled = AsyncPooledClient(client.async_client(), timeout=0.01, retries=2, backoff=0)
+
+    async def run(query):
+        with pytest.raises(asyncio.TimeoutError):
+            await query.execute()
+
+    asyncio.run(run(pooled.table('feedback').select('id')))
+    assert pooled.stats == {'requests': 3, 'retries': 2, 'failures': 1}
+
+    asyncio.run(run(pooled.table('feedback').insert({'id': 'f-1'})))
+    assert pooled.stats == {'requests': 4, 'retries': 2, 'failures': 2}
+
+
+def test_keyed_writes_skip_repeats_and_fall_back_when_unmigrated():
+    db, client = async_fake()
+    payload = {'teacher_id': 't-1', 'feedback_id': 'f-1', 'content': 'text'}
+
+    for _ in range(2):
+        asyncio.run(db.insert_personalized_training(payload, key='k-1'))
+    assert len(client.tables['personalized_training'].rows) == 1
+
+    db, client = async_fake(unique={'personalized_training': ('id',)})
+    asyncio.run(db.insert_personalized_training(payload, key='k-1'))
+    assert 'idempotency_key' not in client.tables['personalized_training'].rows[0]
+    assert 'personalized_training' in db._keyless_tables
+
+
+def test_asgi_route_saves_once_and_keeps_the_aggregate(service, tables, monkeypatch):
+    client, _ = service(tables)
+    from supabase_client import reference_data
+    import asgi_app
+    teacher_id = tables['teachers'][0]['id']
+    feedback_id = next(f['id'] for f in tables['feedback'] if f['teacher_id'] == teacher_id)
+    lookups = []
+    get_cluster = type(reference_data._get()).get_cluster
+    monkeypatch.setattr(
+        type(reference_data._get()), 'get_cluster',
+        lambda self, cluster_id: lookups.append(threading.current_thread()) or get_cluster(self, cluster_id)
+    )
+
+    async def post_twice():
+        test_client = asgi_app.app.test_client()
+        responses = []
+        for _ in range(2):  # A retried request
+            responses.append(await test_client.post(
+                '/api/feedback-to-training', json={'teacher_id': teacher_id, 'feedback_id': feedback_id}
+            ))
+        return responses, threading.current_thread()
+
+    responses, loop_thread = asyncio.run(post_twice())
+
+    assert [response.status_code for response in responses] == [200, 200]
+    rows = [row for row in client.tables['personalized_training'].rows if row['feedback_id'] == feedback_id]
+    assert len(rows) == 1
+    assert next(f for f in client.tables['feedback'].rows if f['id'] == feedback_id)['status'] == 'training_assigned'
+    # The analysis persisted its aggregate, so later ones read only new feedback
+    aggregates = [row for row in client.tables['teacher_feedback_aggregates'].rows if row['teacher_id'] == teacher_id]
+    assert len(aggregates) == 1 and aggregates[0]['total_issues'] > 0
+    assert lookups and loop_thread not in lookups
@@ -0,0 +1,101 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import feedback_analyzer as feedback_analyzer_module
+
+
+def recent(minutes_ago):
+    return (datetime.now(timezone.utc) - timedelta(minutes=minutes_ago)).isoformat()
+
+
+def row(feedback_id, created_at, cluster='cluster-a', description='students fighting'):
+    return {
+        'id': feedback_id, 'teacher_id': f'teacher-{feedback_id}', 'cluster': cluster,
+        'description': description, 'status': 'open', 'created_at': created_at
+    }
+
+
+@pytest.fixture
+def analyzer(service, tables):
+    tables['feedback'] = []
+    client, _ = service(tables)
+    from feedback_analyzer import feedback_analyzer
+    return feedback_analyzer, client
+
+
+def add(client, rows):
+    client.tables['feedback'].rows.extend(rows)
+    client.tables['feedback'].invalidate()
+
+
+def test_window_counts_new_rows_once(analyzer):
+    feedback_analyzer, client = analyzer
+    cursor = recent(10)
+    add(client, [row('f-1', recent(30)), row('f-2', cursor, description='projector')])
+
+    first = feedback_analyzer.analyze_cluster_feedback('cluster-a', days=7)
+    add(client, [row('f-3', cursor), row('f-4', recent(1))])  # f-3 shares the cursor timestamp
+    second = feedback_analyzer.analyze_cluster_feedback('cluster-a', days=7)
+    third = feedback_analyzer.analyze_cluster_feedback('cluster-a', days=7)
+
+    assert first['total_issues'] == 2
+    assert second['total_issues'] == third['total_issues'] == 4
+    assert second['common_issues'][0] == {'description': 'students fighting', 'issue_key': 'students fighting', 'frequency': 3}
+
+
+def test_slow_cluster_does_not_block_others(analyzer, monkeypatch):
+    feedback_analyzer, client = analyzer
+    add(client, [row('a-1', recent(5)), row('b-1', recent(5), cluster='cluster-b')])
+
+    entered, release = threading.Event(), threading.Event()
+    iter_cluster_feedback = feedback_analyzer_module.db.iter_cluster_feedback
+
+    def slow_for_a(cluster_id, **kwargs):
+        if cluster_id == 'cluster-a':
+            entered.set()
+            release.wait(5)
+        return iter_cluster_feedback(cluster_id, **kwargs)
+
+    monkeypatch.setattr(feedback_analyzer_module.db, 'iter_cluster_feedback', slow_for_a)
+    slow = threading.Thread(target=feedback_analyzer.analyze_cluster_feedback, args=('cluster-a',), kwargs={'days': 7})
+    slow.start()
+    try:
+        assert entered.wait(5)
+        result = {}
+        other = threading.Thread(target=lambda: result.update(feedback_analyzer.analyze_cluster_feedback('cluster-b', days=7)))
+        other.start()
+        other.join(2)
+        assert not other.is_alive()
+        assert result['total_issues'] == 1
+    finally:
+        release.set()
+        slow.join(5)
+
+
+def test_failed_read_is_not_half_applied(analyzer, monkeypatch):
+    feedback_analyzer, client = analyzer
+    add(client, [row('f-1', recent(3)), row('f-2', recent(2))])
+    iter_cluster_feedback = feedback_analyzer_module.db.iter_cluster_feedback
+
+    def fails_after_first_row(cluster_id, **kwargs):
+        rows = iter_cluster_feedback(cluster_id, **kwargs)
+        yield next(rows)
+        raise ConnectionError('connection reset')
+
+    monkeypatch.setattr(feedback_analyzer_module.db, 'iter_cluster_feedback', fails_after_first_row)
+    assert 'error' in feedback_analyzer.analyze_cluster_feedback('cluster-a', days=7)
+
+    monkeypatch.setattr(feedback_analyzer_module.db, 'iter_cluster_feedback', iter_cluster_feedback)
+    assert feedback_analyzer.analyze_cluster_feedback('cluster-a', days=7)['total_issues'] == 2
+
+
+def test_window_states_are_capped(analyzer, monkeypatch):
+    feedback_analyzer, _ = analyzer
+    monkeypatch.setattr(feedback_analyzer_module, 'CLUSTER_WINDOW_MAX_CLUSTERS', 3)
+
+    for i in range(5):
+        feedback_analyzer.analyze_cluster_feedback(f'cluster-{i}', days=1)
+
+    assert list(feedback_analyzer._cluster_windows) == ['cluster-2', 'cluster-3', 'cluster-4']
@@ -0,0 +1,136 @@
+import pytest
+
+
+def add_feedback(client, rows):
+    table = client.tables['feedback']
+    table.rows.extend(rows)
+    table.invalidate()
+
+
+def feedback(feedback_id, created_at, description='students fighting in class', teacher_id='teacher-x'):
+    return {
+        'id': feedback_id,
+        'teacher_id': teacher_id,
+        'cluster': 'cluster-00000',
+        'description': description,
+        'status': 'open',
+        'created_at': created_at
+    }
+
+
+@pytest.fixture
+def analyzer(service, tables):
+    client, _ = service(tables)
+    from feedback_analyzer import feedback_analyzer
+    return feedback_analyzer, client
+
+
+def test_incremental_matches_rebuild(analyzer, tables):
+    feedback_analyzer, client = analyzer
+    teacher_id = tables['teachers'][0]['id']
+
+    first = feedback_analyzer.analyze_teacher_feedback(teacher_id)
+    add_feedback(client, [
+        feedback('late-1', '2099-01-01T00:00:00', 'no internet for the tablet', teacher_id),
+        feedback('late-2', '2099-01-02T00:00:00', 'students bored', teacher_id),
+    ])
+    incremental = feedback_analyzer.analyze_teacher_feedback(teacher_id)
+    rebuilt = feedback_analyzer.rebuild_teacher_aggregate(teacher_id)
+
+    assert incremental['total_issues'] == first['total_issues'] + 2
+    assert incremental['total_issues'] == rebuilt['total_issues']
+    assert incremental['gap_scores'] == pytest.approx(rebuilt['gap_scores'])
+    assert incremental['inferred_gaps'] == rebuilt['inferred_gaps']
+
+
+def test_repeat_analysis_does_not_double_count(analyzer):
+    feedback_analyzer, client = analyzer
+    add_feedback(client, [feedback(f'f-{i}', '2025-03-01T10:00:00') for i in range(3)])
+
+    counts = [feedback_analyzer.analyze_teacher_feedback('teacher-x')['total_issues'] for _ in range(3)]
+
+    assert counts == [3, 3, 3]
+
+
+def test_rows_sharing_the_cursor_timestamp_are_folded(analyzer):
+    feedback_analyzer, client = analyzer
+    add_feedback(client, [feedback('f-1', '2025-03-01T10:00:00')])
+    feedback_analyzer.analyze_teacher_feedback('teacher-x')
+
+    # Committed after the first analysis with the same created_at
+    add_feedback(client, [feedback('f-2', '2025-03-01T10:00:00')])
+
+    assert feedback_analyzer.analyze_teacher_feedback('teacher-x')['total_issues'] == 2
+
+
+def test_late_rows_inside_the_overlap_are_folded_once(analyzer):
+    feedback_analyzer, client = analyzer
+    add_feedback(client, [feedback('f-1', '2025-03-01T10:00:00+00:00')])
+    feedback_analyzer.analyze_teacher_feedback('teacher-x')
+
+    # Earlier timestamp than the cursor, committed later (long transaction)
+    add_feedback(client, [feedback('f-0', '2025-03-01T09:58:00+00:00', 'projector broken')])
+    result = feedback_analyzer.analyze_teacher_feedback('teacher-x')
+    again = feedback_analyzer.analyze_teacher_feedback('teacher-x')
+
+    assert result['total_issues'] == again['total_issues'] == 2
+    assert result['gap_scores']['technology_usage'] > 0
+    stored = client.tables['teacher_feedback_aggregates'].rows[0]
+    assert stored['last_created_at'] == '2025-03-01T10:00:00+00:00'
+    assert sorted(feedback_id for _, feedback_id in stored['recent_feedback']) == ['f-0', 'f-1']
+
+
+def test_overlap_window_is_pruned(analyzer):
+    feedback_analyzer, client = analyzer
+    add_feedback(client, [feedback('old', '2025-03-01T00:00:00'), feedback('new', '2025-03-02T00:00:00')])
+
+    feedback_analyzer.analyze_teacher_feedback('teacher-x')
+
+    stored = client.tables['teacher_feedback_aggregates'].rows[0]
+    assert [feedback_id for _, feedback_id in stored['recent_feedback']] == ['new']
+
+
+def test_mapping_change_rebuilds(analyzer):
+    feedback_analyzer, client = analyzer
+    add_feedback(client, [feedback('f-1', '2025-03-01T10:00:00', 'chalk shortage')])
+    assert feedback_analyzer.analyze_teacher_feedback('teacher-x')['inferred_gaps'] == []
+
+    client.tables['issue_competency_mapping'].rows.append(
+        {'id': 9999, 'issue_keyword': 'chalk', 'competency_area': 'pedagogy', 'confidence_score': 1.0}
+    )
+    feedback_analyzer.reload_mappings()
+
+    result = feedback_analyzer.analyze_teacher_feedback('teacher-x')
+    assert result['total_issues'] == 1
+    assert result['inferred_gaps'] == ['pedagogy']
+
+
+def test_bulk_analysis_resumes_stored_aggregates(analyzer, tables, monkeypatch):
+    feedback_analyzer, client = analyzer
+    from supabase_client import db
+    stored_id, fresh_id = tables['teachers'][0]['id'], tables['teachers'][1]['id']
+    feedback_analyzer.analyze_teacher_feedback(stored_id)
+    add_feedback(client, [feedback('late-1', '2099-01-01T00:00:00', 'students bored', stored_id)])
+
+    reads = []
+    fetch = db._get().get_feedback_for_teachers
+
+    def spy(teacher_ids, since=None):
+        reads.append((sorted(teacher_ids), since))
+        return fetch(teacher_ids, since=since)
+
+    monkeypatch.setattr(db._get(), 'get_feedback_for_teachers', spy)
+    bulk = feedback_analyzer.analyze_teachers_feedback_bulk([stored_id, fresh_id])
+
+    # Full history only for the teacher without an aggregate
+    assert reads[0] == ([fresh_id], None)
+    assert reads[1][0] == [stored_id] and reads[1][1] is not None
+    for teacher_id in (stored_id, fresh_id):
+        rebuilt = feedback_analyzer.rebuild_teacher_aggregate(teacher_id)
+        assert bulk[teacher_id]['total_issues'] == rebuilt['total_issues']
+        assert bulk[teacher_id]['gap_scores'] == pytest.approx(rebuilt['gap_scores'])
+
+    # Both aggregates were saved, so a repeat folds nothing new
+    reads.clear()
+    assert feedback_analyzer.analyze_teachers_feedback_bulk([stored_id, fresh_id]) == bulk
+    assert len(reads) == 1 and reads[0][1] is not None
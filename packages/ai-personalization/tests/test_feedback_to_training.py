@@ -0,0 +1,92 @@
+import json
+
+
+def first_feedback(tables):
+    teacher_id = tables['teachers'][0]['id']
+    return teacher_id, next(f['id'] for f in tables['feedback'] if f['teacher_id'] == teacher_id)
+
+
+def saved_training(client, feedback_id):
+    return [row for row in client.tables.get('personalized_training', []).rows if row['feedback_id'] == feedback_id]
+
+
+def feedback_status(client, feedback_id):
+    return next(f['status'] for f in client.tables['feedback'].rows if f['id'] == feedback_id)
+
+
+def test_route_saves_training_linked_to_the_feedback(service, tables):
+    client, _ = service(tables)
+    import app
+    teacher_id, feedback_id = first_feedback(tables)
+
+    response = app.app.test_client().post(
+        '/api/feedback-to-training', json={'teacher_id': teacher_id, 'feedback_id': feedback_id}
+    )
+
+    assert response.status_code == 200
+    body = response.get_json()
+    # A swallowed save error still answers 200, so check the rows themselves
+    rows = saved_training(client, feedback_id)
+    assert len(rows) == 1
+    assert rows[0]['teacher_id'] == teacher_id
+    assert rows[0]['training_module'] == body['assigned_module']
+    assert rows[0]['content'] == body['personalized_message']
+    assert feedback_status(client, feedback_id) == 'training_assigned'
+
+
+def test_batch_route_saves_every_item(service, tables):
+    client, _ = service(tables)
+    import app
+    items = [
+        {'teacher_id': f['teacher_id'], 'feedback_id': f['id']}
+        for f in tables['feedback'][:5]
+    ] + [{'teacher_id': 'teacher-missing', 'feedback_id': 'feedback-missing'}]
+
+    response = app.app.test_client().post('/api/feedback-to-training/batch', json={'items': items})
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    summary = lines[-1]
+    assert summary['done'] and summary['succeeded'] == 5 and summary['failed'] == 1
+    assert summary['saved'] == 5 and 'error' not in summary
+    for item in items[:5]:
+        assert len(saved_training(client, item['feedback_id'])) == 1
+        assert feedback_status(client, item['feedback_id']) == 'training_assigned'
+
+
+def batch_lines(app, items):
+    response = app.app.test_client().post('/api/feedback-to-training/batch', json={'items': items})
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_failed_generation_gets_the_fallback(service, tables, monkeypatch):
+    client, model = service(tables)
+    import app
+    items = [{'teacher_id': f['teacher_id'], 'feedback_id': f['id']} for f in tables['feedback'][:4]]
+    failing = next(t['name'] for t in tables['teachers'] if t['id'] == items[0]['teacher_id'])
+    generate = model.generate_content
+
+    def flaky(prompt, **kwargs):
+        if failing in prompt:
+            raise RuntimeError('quota exceeded')
+        return generate(prompt, **kwargs)
+
+    monkeypatch.setattr(model, 'generate_content', flaky)
+    lines = batch_lines(app, items)
+
+    summary = lines[-1]
+    assert summary['done'] and summary['succeeded'] == 4 and summary['saved'] == 4
+    failed = [line for line in lines[:-1] if line['teacher_id'] == items[0]['teacher_id']]
+    assert failed and all(line['generation_error'] == 'quota exceeded' for line in failed)
+    assert all(line['personalized_message'].startswith('We have assigned') for line in failed)
+
+
+def test_generation_deadline_is_passed_to_the_model(service, tables):
+    client, model = service(tables, llm_latency=0.5)
+    from training_assignment import assign_training_batch
+    items = [{'teacher_id': f['teacher_id'], 'feedback_id': f['id']} for f in tables['feedback'][:2]]
+
+    lines = list(assign_training_batch(items, timeout=0.05))
+
+    assert all(line['timed_out'] and 'generation_error' in line for line in lines[:-1])
+    assert lines[-1]['saved'] == 2
+    assert model.call_count == 0  # Every call hit its deadline
@@ -0,0 +1,66 @@
+import random
+from collections import Counter
+
+from issue_stats import IssueCounter, normalize_issue
+
+
+def test_normalize_issue_groups_variants():
+    assert normalize_issue('  Students   FIGHTING!! ') == 'students fighting'
+    assert normalize_issue('students, fighting') == normalize_issue('Students fighting.')
+    # Devanagari vowel signs are kept
+    assert normalize_issue('बच्चे शोर करते हैं।') == 'बच्चे शोर करते हैं'
+
+
+def test_exact_top_k():
+    counter = IssueCounter(k=3)
+    for text, count in [('noise', 5), ('Noise!', 2), ('projector', 4), ('bored', 3), ('absent', 1)]:
+        for _ in range(count):
+            counter.add(text)
+
+    assert not counter.approximate
+    assert counter.total == 15
+    assert [(key, count) for key, count, _ in counter.top()] == [('noise', 7), ('projector', 4), ('bored', 3)]
+    # The first text seen is kept as the sample
+    assert counter.top(1)[0][2] == 'noise'
+
+
+def test_sketch_keeps_heavy_hitters():
+    rng = random.Random(3)
+    stream = ['heavy a'] * 500 + ['heavy b'] * 300 + ['heavy c'] * 200
+    stream += [f'rare issue {i}' for i in range(3000)]
+    rng.shuffle(stream)
+
+    counter = IssueCounter(k=3, max_exact_keys=100)
+    for text in stream:
+        counter.add(text)
+
+    assert counter.approximate
+    assert counter.total == len(stream)
+    top = counter.top()
+    assert [key for key, _, _ in top] == ['heavy a', 'heavy b', 'heavy c']
+    exact = Counter(stream)
+    for key, count, _ in top:
+        # Count-min never under-estimates
+        assert count >= exact[key]
+
+
+def test_merge_matches_single_counter():
+    days = [['noise', 'bored', 'noise'], ['noise', 'projector'], ['bored', 'bored']]
+
+    merged = IssueCounter(k=2)
+    for day in days:
+        bucket = IssueCounter(k=10)
+        for text in day:
+            bucket.add(text)
+        merged.merge(bucket)
+
+    assert merged.total == 7
+    assert sorted((key, count) for key, count, _ in merged.top()) == [('bored', 3), ('noise', 3)]
+
+
+def test_blank_issues_are_ignored():
+    counter = IssueCounter()
+    counter.add('')
+    counter.add('  ?! ')
+    assert counter.total == 0
+    assert counter.top() == []
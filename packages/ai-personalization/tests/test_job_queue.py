@@ -0,0 +1,160 @@
+import os
+import sys
+import json
+import time
+import threading
+import subprocess
+
+import pytest
+
+from job_queue import JobQueue, PermanentJobError
+
+
+def wait_for(queue, job_id, statuses=('succeeded', 'failed'), timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job['status'] in statuses:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f'job {job_id} stuck in {queue.get(job_id)["status"]}')
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    queues = []
+
+    def make(handlers, **kwargs):
+        kwargs.setdefault('backoff_seconds', 0.01)
+        queue = JobQueue(path=str(tmp_path / 'jobs.sqlite3'), workers=kwargs.pop('workers', 2), handlers=handlers, **kwargs)
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.stop()
+
+
+def insert_job(queue, job_id, kind, status='queued', updated_at=None, attempts=0):
+    now = time.time()
+    queue._connection().execute(
+        'INSERT INTO jobs (id, kind, payload, status, attempts, created_at, updated_at, run_after) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        (job_id, kind, json.dumps({'n': 1}), status, attempts, now, updated_at or now, now)
+    )
+
+
+def test_runs_a_job_and_stores_the_result(make_queue):
+    queue = make_queue({'double': lambda payload, last: payload['n'] * 2})
+
+    job = wait_for(queue, queue.enqueue('double', {'n': 21}))
+
+    assert job['status'] == 'succeeded'
+    assert job['result'] == 42
+    assert job['attempts'] == 1
+
+
+def test_retries_until_success_with_last_attempt_flag(make_queue):
+    calls = []
+
+    def flaky(payload, last_attempt):
+        calls.append(last_attempt)
+        if not last_attempt:
+            raise ConnectionError('try again')
+        return 'fallback'
+
+    queue = make_queue({'flaky': flaky}, max_attempts=3)
+    job = wait_for(queue, queue.enqueue('flaky', {}))
+
+    assert job['status'] == 'succeeded'
+    assert job['attempts'] == 3
+    assert calls == [False, False, True]
+
+
+def test_permanent_errors_are_not_retried(make_queue):
+    def bad_input(payload, last_attempt):
+        raise PermanentJobError('Teacher not found')
+
+    queue = make_queue({'bad': bad_input})
+    job = wait_for(queue, queue.enqueue('bad', {}))
+
+    assert job['status'] == 'failed'
+    assert job['attempts'] == 1
+    assert job['error'] == 'Teacher not found'
+
+
+def test_start_resumes_queued_and_expired_jobs_without_an_enqueue(make_queue):
+    ran = []
+    handlers = {'work': lambda payload, last: ran.append(payload) or 'done'}
+    queue = make_queue(handlers, lease_seconds=60)
+    insert_job(queue, 'queued-before-restart', 'work')
+    insert_job(queue, 'worker-died', 'work', status='running', updated_at=time.time() - 120, attempts=1)
+    insert_job(queue, 'still-leased', 'work', status='running', attempts=1)
+
+    queue.start()
+
+    assert wait_for(queue, 'queued-before-restart')['status'] == 'succeeded'
+    job = wait_for(queue, 'worker-died')
+    assert job['status'] == 'succeeded' and job['attempts'] == 2
+    time.sleep(0.2)
+    assert queue.get('still-leased')['status'] == 'running'
+    assert len(ran) == 2
+
+
+def test_heartbeat_keeps_long_jobs_from_being_claimed_twice(make_queue):
+    started = []
+    release = threading.Event()
+
+    def long_job(payload, last_attempt):
+        started.append(threading.current_thread().name)
+        release.wait(5)
+        return 'done'
+
+    handlers = {'long': long_job}
+    first = make_queue(handlers, lease_seconds=0.3, workers=1)
+    job_id = first.enqueue('long', {})
+    # A second process on the same file, polling while the lease would have expired
+    second = make_queue(handlers, lease_seconds=0.3, workers=2)
+    second.start()
+
+    time.sleep(1.2)
+    release.set()
+    job = wait_for(first, job_id)
+
+    assert job['status'] == 'succeeded'
+    assert job['attempts'] == 1
+    assert len(started) == 1
+
+
+def test_stale_worker_cannot_overwrite_a_reclaimed_job(make_queue):
+    queue = make_queue({'work': lambda payload, last: 'late result'})
+    insert_job(queue, 'job', 'work', status='running', attempts=2)
+    stale = {'id': 'job', 'kind': 'work', 'payload': '{}', 'attempts': 0}
+
+    queue._run(stale)  # Attempt 1 finishing after attempt 2 took over
+
+    job = queue.get('job')
+    assert job['status'] == 'running' and job['result'] is None
+
+
+def test_only_claims_kinds_it_can_run(make_queue):
+    queue = make_queue({'known': lambda payload, last: 'ok'})
+    insert_job(queue, 'other-service-job', 'unknown')
+
+    queue.start()
+    known = wait_for(queue, queue.enqueue('known', {}))
+
+    assert known['status'] == 'succeeded'
+    assert queue.get('other-service-job')['status'] == 'queued'
+    assert queue.get('other-service-job')['attempts'] == 0
+
+
+def test_importing_the_app_starts_no_workers(tmp_path):
+    # Spawned cluster pool workers re-import app; they must not run jobs
+    from conftest import ROOT
+    script = 'import app, threading; print(sorted(t.name for t in threading.enumerate() if t.name.startswith("job-worker")))'
+    output = subprocess.run(
+        [sys.executable, '-c', script], cwd=tmp_path, capture_output=True, text=True, check=True,
+        env={**os.environ, 'PYTHONPATH': str(ROOT / 'src'), 'JOB_QUEUE_PATH': str(tmp_path / 'jobs.sqlite3')}
+    ).stdout
+    assert output.strip().splitlines()[-1] == '[]'
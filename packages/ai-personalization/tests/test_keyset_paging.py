@@ -0,0 +1,59 @@
+from fakes import FakeSupabaseClient
+from supabase_client import SupabaseDB
+
+
+def feedback_rows(n, timestamps):
+    return [
+        {
+            'id': f'feedback-{i:04d}',
+            'teacher_id': 'teacher-1',
+            'cluster': 'cluster-1',
+            'description': f'issue {i}',
+            'status': 'open',
+            'created_at': timestamps[i % len(timestamps)]
+        }
+        for i in range(n)
+    ]
+
+
+def test_pages_across_equal_created_at():
+    # Far more rows share each timestamp than fit on one page
+    rows = feedback_rows(53, ['2025-01-01T10:00:00', '2025-01-02T10:00:00', '2025-01-02T10:00:00.5'])
+    db = SupabaseDB(client=FakeSupabaseClient({'feedback': rows}, max_rows=4))
+
+    seen = list(db.iter_teacher_feedback('teacher-1', page_size=4))
+
+    assert len(seen) == len(rows)
+    assert len({row['id'] for row in seen}) == len(rows)
+    expected = sorted(rows, key=lambda row: (row['created_at'], row['id']), reverse=True)
+    assert [row['id'] for row in seen] == [row['id'] for row in expected]
+
+
+def test_cluster_feedback_pages_with_timestamps_needing_quotes():
+    rows = feedback_rows(20, ['2025-01-01T10:00:00+05:30', '2025-01-01T10:00:00.25+05:30'])
+    db = SupabaseDB(client=FakeSupabaseClient({'feedback': rows}, max_rows=3))
+
+    seen = list(db.iter_cluster_feedback('cluster-1', columns='description', page_size=3))
+
+    assert sorted(row['id'] for row in seen) == sorted(row['id'] for row in rows)
+
+
+def test_fetch_in_chunks_pages_every_chunk():
+    rows = feedback_rows(30, ['2025-01-01T00:00:00'])
+    for i, row in enumerate(rows):
+        row['teacher_id'] = f'teacher-{i % 7}'
+    db = SupabaseDB(client=FakeSupabaseClient({'feedback': rows}, max_rows=2))
+
+    seen = list(db._fetch_in_chunks(
+        'feedback', 'teacher_id', [f'teacher-{i}' for i in range(7)] + [None],
+        columns='teacher_id', order_by='created_at', chunk_size=3, page_size=2
+    ))
+
+    assert sorted(row['id'] for row in seen) == sorted(row['id'] for row in rows)
+
+
+def test_id_paging_past_row_cap():
+    teachers = [{'id': f'teacher-{i:03d}', 'name': f'T{i}', 'cluster_id': 'c'} for i in range(25)]
+    db = SupabaseDB(client=FakeSupabaseClient({'teachers': teachers}, max_rows=10))
+
+    assert [t['id'] for t in db.get_teachers_by_cluster('c', page_size=10)] == [t['id'] for t in teachers]
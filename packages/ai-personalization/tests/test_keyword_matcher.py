@@ -0,0 +1,60 @@
+import random
+
+from keyword_matcher import KeywordMatcher
+
+
+def baseline_match(mappings, issue_text):
+    """The original per-mapping substring loop"""
+    matched = {}
+    for mapping in mappings:
+        if mapping['issue_keyword'].lower() in issue_text:
+            competency = mapping['competency_area']
+            matched[competency] = max(matched.get(competency, 0), float(mapping['confidence_score']))
+    return matched
+
+
+def test_matches_baseline_on_synthetic_feedback(tables):
+    mappings = tables['issue_competency_mapping']
+    matcher = KeywordMatcher(mappings)
+
+    for row in tables['feedback']:
+        text = row['description'].lower()
+        assert matcher.match(text) == baseline_match(mappings, text)
+
+
+def test_overlapping_and_nested_keywords():
+    mappings = [
+        {'issue_keyword': 'noise', 'competency_area': 'classroom_management', 'confidence_score': 0.6},
+        {'issue_keyword': 'Noisy class', 'competency_area': 'classroom_management', 'confidence_score': 0.9},
+        {'issue_keyword': 'class', 'competency_area': 'pedagogy', 'confidence_score': 0.3},
+        {'issue_keyword': 'ass', 'competency_area': 'content_knowledge', 'confidence_score': 0.2},
+        {'issue_keyword': 'शोर', 'competency_area': 'classroom_management', 'confidence_score': 1.0},
+    ]
+    matcher = KeywordMatcher(mappings)
+    texts = ['noisy classroom', 'too much noise', 'बहुत शोर है', 'glass', 'nothing relevant', '']
+
+    for text in texts:
+        assert matcher.match(text) == baseline_match(mappings, text)
+
+
+def test_random_keywords_match_baseline():
+    rng = random.Random(7)
+    alphabet = 'abcab '
+    mappings = [
+        {
+            'issue_keyword': ''.join(rng.choice(alphabet) for _ in range(rng.randrange(1, 5))),
+            'competency_area': rng.choice(['a', 'b', 'c']),
+            'confidence_score': round(rng.random(), 2)
+        }
+        for _ in range(60)
+    ]
+    matcher = KeywordMatcher(mappings)
+
+    for _ in range(300):
+        text = ''.join(rng.choice(alphabet) for _ in range(rng.randrange(0, 30)))
+        assert matcher.match(text) == baseline_match(mappings, text)
+
+
+def test_empty_keyword_matches_everything():
+    mappings = [{'issue_keyword': '', 'competency_area': 'pedagogy', 'confidence_score': 0.5}]
+    assert KeywordMatcher(mappings).match('anything') == {'pedagogy': 0.5}
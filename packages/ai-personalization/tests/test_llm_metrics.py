@@ -0,0 +1,22 @@
+import re
+
+from metrics import metrics
+
+
+def token_total(kind):
+    match = re.search(rf'^llm_tokens_total{{type="{kind}"}} (\d+)$', metrics.render(), re.MULTILINE)
+    return int(match.group(1)) if match else 0
+
+
+def test_generations_record_token_usage(service, tables):
+    service(tables)
+    from llm_personalizer import personalizer
+
+    prompt_before, completion_before = token_total('prompt'), token_total('completion')
+    personalizer.generate_assignment_message(tables['teachers'][0], 'pedagogy', tables['training_modules'][0])
+    chunks = list(personalizer.stream_training_module(tables['training_modules'][0], {'gap_areas': []}, {}))
+
+    assert chunks
+    assert token_total('prompt') > prompt_before
+    # FakeGenerativeModel reports 120 completion tokens per response
+    assert token_total('completion') == completion_before + 240
@@ -0,0 +1,88 @@
+import pytest
+
+# Held out: none of these are exemplars, and MIN_SIMILARITY and the off-topic
+# exemplars are tuned on benchmarks/calibrate_semantic.py, never on these lines.
+# Do not adjust the matcher to make a line here pass; add to the calibration set.
+ON_TOPIC = {
+    'classroom_management': [
+        'students are fighting during class',
+        'the class is very noisy',
+        'kids misbehave when I write on the board',
+        'children run around and do not sit',
+        'students shout in the classroom',
+        'बच्चे कक्षा में शोर मचाते हैं',
+    ],
+    'content_knowledge': [
+        'I find fractions hard to explain correctly',
+        'not confident about the science syllabus',
+        'students ask questions I cannot answer',
+        'पाठ्यक्रम का विषय कठिन है',
+    ],
+    'pedagogy': [
+        'my lessons are mostly lecture',
+        'lesson plan does not work for slow learners',
+        'how to teach a mixed ability class',
+        'शिक्षण विधि बदलनी है',
+    ],
+    'technology_usage': [
+        'the projector does not work for me',
+        'tablet apps are confusing',
+        'cannot use the computer lab software',
+        'तकनीक का उपयोग नहीं आता',
+    ],
+    'student_engagement': [
+        'students are bored in class',
+        'many children are absent',
+        'pupils not attentive after lunch',
+        'dropout rate is rising',
+    ],
+}
+
+INFRASTRUCTURE = [
+    'the classroom is too hot in summer',
+    'our classroom gets really hot in may',
+    'the classroom has no lights',
+    'roof leaks when it rains',
+    'no drinking water in school',
+    'toilets are broken',
+    'electricity goes off every day',
+    'need more chairs and benches',
+    'road to the school is flooded',
+    'कक्षा में बहुत गर्मी है',
+]
+
+OFF_TOPIC = [
+    'salary not paid for three months',
+    'transfer request pending',
+    'mid day meal was late',
+    'principal is on leave',
+    'holiday on friday',
+    'my bike broke down',
+]
+
+
+@pytest.fixture(scope='module')
+def matcher():
+    from synthetic import generate_tables
+    from semantic_matcher import SemanticMatcher
+    return SemanticMatcher(generate_tables(100, extra_keywords=20)['issue_competency_mapping'])
+
+
+@pytest.mark.parametrize('competency,text', [(c, t) for c, texts in ON_TOPIC.items() for t in texts])
+def test_teaching_issues_map_to_their_competency(matcher, competency, text):
+    matched = matcher.match(text.lower())
+    assert max(matched, key=matched.get) == competency
+
+
+@pytest.mark.parametrize('text', INFRASTRUCTURE + OFF_TOPIC)
+def test_infrastructure_and_off_topic_feedback_maps_to_nothing(matcher, text):
+    assert matcher.match(text.lower()) == {}
+
+
+def test_hybrid_mode_keeps_off_topic_feedback_out_of_the_gaps(service, tables):
+    service(tables)
+    from feedback_analyzer import FeedbackAnalyzer
+    analyzer = FeedbackAnalyzer(match_mode='hybrid')
+
+    assert analyzer._match_issue_to_gaps('the classroom is too hot in summer') == {}
+    assert analyzer._match_issue_to_gaps('too much noise, discipline is poor')['classroom_management'] >= 1.0
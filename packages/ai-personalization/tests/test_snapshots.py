@@ -0,0 +1,21 @@
+from supabase_client import SupabaseDB
+from fakes import FakeSupabaseClient
+
+
+def test_bulk_gaps_write_to_the_snapshot(tmp_path, tables):
+    from snapshots import export_snapshot
+    from run_benchmarks import install_snapshot
+    import app
+
+    manifest = export_snapshot(tmp_path / 'snap', database=SupabaseDB(client=FakeSupabaseClient(tables)), page_size=7)
+    snapshot_db, _, _ = install_snapshot(manifest['path'], 0.0, str(tmp_path / 'models'))
+    teacher_ids = sorted({row['teacher_id'] for row in tables['teacher_assessments']})
+
+    body = app.app.test_client().post('/api/analyze-teacher-gaps/bulk', json={'teacher_ids': teacher_ids}).get_json()
+    assert 'error' not in body
+    assert body['total'] == body['saved'] == len(teacher_ids)
+    assert sorted(row['teacher_id'] for row in snapshot_db.writes['competency_gaps']) == teacher_ids
+
+    # A retried batch is skipped by its idempotency keys, like the live upsert
+    app.app.test_client().post('/api/analyze-teacher-gaps/bulk', json={'teacher_ids': teacher_ids})
+    assert len(snapshot_db.writes['competency_gaps']) == len(teacher_ids)
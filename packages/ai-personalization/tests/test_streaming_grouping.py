@@ -0,0 +1,41 @@
+import time
+
+from fakes import FakeSupabaseClient
+from supabase_client import SupabaseDB
+
+
+def wait_for_job(client, job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f'/api/jobs/{job_id}').get_json()
+        if job['status'] in ('succeeded', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f'job {job_id} did not finish')
+
+
+def test_teacher_id_pages_follow_the_cluster_filter():
+    teachers = [{'id': f'teacher-{i:03d}', 'cluster_id': f'cluster-{i % 3}'} for i in range(50)]
+    db = SupabaseDB(client=FakeSupabaseClient({'teachers': teachers}, max_rows=7))
+
+    pages = list(db.iter_teacher_id_pages(['cluster-0', 'cluster-2'], page_size=7))
+
+    assert all(len(page) == 7 for page in pages[:-1])
+    assert [teacher_id for page in pages for teacher_id in page] == [
+        t['id'] for t in teachers if t['cluster_id'] in ('cluster-0', 'cluster-2')
+    ]
+
+
+def test_streaming_grouping_runs_as_a_job(service, tables):
+    service(tables)
+    import app
+
+    client = app.app.test_client()
+    response = client.post('/api/analyze-cluster-gaps/streaming', json={})
+    assert response.status_code == 202
+
+    job = wait_for_job(client, response.get_json()['job_id'])
+    assert job['status'] == 'succeeded', job['error']
+    result = job['result']
+    assert result['total_teachers'] == len(tables['teachers'])
+    assert sum(group['teacher_count'] for group in result['clusters'].values()) == len(tables['teachers'])
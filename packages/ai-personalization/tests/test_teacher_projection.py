@@ -0,0 +1,33 @@
+from supabase_client import SupabaseDB, TEACHER_COLUMNS
+from fakes import FakeSupabaseClient
+
+# Teacher fields the routes, prompts and scripts read
+READ_FIELDS = ('id', 'name', 'subject', 'experience_years', 'cluster_id')
+
+
+def test_projection_covers_every_field_read():
+    assert set(READ_FIELDS) <= set(TEACHER_COLUMNS.split(','))
+
+
+def test_profile_reaches_the_prompt(service, tables):
+    service(tables)
+    import app
+    from llm_personalizer import personalizer
+
+    teacher = tables['teachers'][0]
+    with app.app.test_request_context():
+        inputs, error = app._personalization_inputs({'teacher_id': teacher['id'], 'competency': 'pedagogy'})
+
+    assert error is None
+    assert inputs['teacher_profile']['experience'] == teacher['experience_years']
+    prompt = personalizer._personalization_prompt(inputs['base_module'], inputs['teacher_profile'], inputs['cluster_context'])
+    assert f"Experience: {teacher['experience_years']} years" in prompt
+
+
+def test_snapshot_keeps_experience_years(tmp_path, tables):
+    from snapshots import export_snapshot, SnapshotDB
+
+    manifest = export_snapshot(tmp_path / 'snap', database=SupabaseDB(client=FakeSupabaseClient(tables)), page_size=3)
+    teacher = tables['teachers'][0]
+
+    assert SnapshotDB(manifest['path']).get_teacher_by_id(teacher['id'])['experience_years'] == teacher['experience_years']
@@ -128,11 +128,22 @@ router.post('/feedback', async (req, res) => {
         body: JSON.stringify({
           teacher_id: teacherId,
           feedback_id: feedbackData.id,
-          admin_id: 'system_auto'
+          admin_id: 'system_auto',
+          // Queue the generation and return immediately instead of waiting on the LLM
+          async: true
         })
       });
 
-      if (aiResult.ok) {
+      if (aiResult.status === 202) {
+        const aiJob = await aiResult.json();
+        console.log('✅ AI Training queued:', aiJob.job_id);
+        aiResponse = {
+          suggestion: 'Personalized training is being prepared',
+          inferredGaps: [],
+          priority: 'high',
+          jobId: aiJob.job_id
+        };
+      } else if (aiResult.ok) {
         const aiData = await aiResult.json();
         console.log('✅ AI Training Assigned');
         aiResponse = {